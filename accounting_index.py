@@ -0,0 +1,337 @@
+import argparse
+import csv
+import hashlib
+import os
+import shutil
+import time
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from tracked_files import appended, read_appended, read_json, unchanged, write_json
+
+# Where the row indexes of the accounting files are kept
+INDEX_DIR = os.environ.get(
+    "GPU_UTIL_ACCOUNTING_INDEX",
+    os.path.join(os.path.expanduser("~"), ".cache", "gpu_util", "accounting_index")
+)
+META_FILE = "meta.json"
+# Bump whenever the index layout changes, the index is then rebuilt
+INDEX_VERSION = 1
+# Bytes of the accounting file read and indexed at a time
+BLOCK_SIZE = 64 * 2**20
+# Each update adds one parquet part per source, parts are merged once there are more
+MAX_PARTS = 16
+# Accounting columns kept in the index, with the byte offset and length of each row
+KEY_COLUMNS = ["job_number", "task_number", "owner", "project", "ux_end_time"]
+
+
+def read_meta(index_dir: str = None) -> dict:
+    """Reads the index's meta.json, an empty index when it is missing or from an older version"""
+    meta = read_json(os.path.join(index_dir or INDEX_DIR, META_FILE), INDEX_VERSION)
+    return meta or {"version": INDEX_VERSION, "sources": {}}
+
+
+def _key_frame(keys: dict, offsets: np.ndarray, lengths: np.ndarray) -> pd.DataFrame:
+    """Builds the index rows of a block from the raw key columns"""
+    entries = pd.DataFrame({
+        "job_number": pd.to_numeric(pd.Series(keys["job_number"]), errors="coerce").fillna(-1).astype(np.int64),
+        "task_number": pd.to_numeric(pd.Series(keys["task_number"]), errors="coerce").fillna(0).astype(np.int64),
+        "owner": pd.Series(keys["owner"], dtype=object).fillna("").astype(str),
+        "project": pd.Series(keys["project"], dtype=object).fillna("").astype(str),
+        "ux_end_time": pd.to_numeric(pd.Series(keys["ux_end_time"]), errors="coerce"),
+        "offset": offsets.astype(np.int64),
+        "length": lengths.astype(np.int32),
+    })
+    # Blank lines
+    return entries[entries["length"] > 1].reset_index(drop=True)
+
+
+def _index_block(block: bytes, base: int, header: list) -> pd.DataFrame:
+    """
+    Index rows of a block of complete accounting lines starting at byte `base`.
+
+    The key columns are parsed with pandas; when the parsed rows do not line up with
+    the lines of the block (malformed lines, quoted line breaks) the block is parsed
+    again line by line with the csv module.
+    """
+    codes = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(codes == ord("\n"))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts + 1
+    positions = [header.index(column) for column in KEY_COLUMNS]
+
+    try:
+        df = pd.read_csv(BytesIO(block), names=header, usecols=KEY_COLUMNS, dtype=str, quotechar='"',
+                         skip_blank_lines=False, on_bad_lines="skip", encoding_errors="replace")
+    except (pd.errors.ParserError, pd.errors.EmptyDataError):
+        df = None
+    if df is not None and len(df) == len(starts):
+        keys = {column: df[column].to_numpy() for column in KEY_COLUMNS}
+    else:
+        keys = {column: [] for column in KEY_COLUMNS}
+        for start, end in zip(starts, ends):
+            line = block[start:end].decode("utf-8", errors="replace")
+            fields = next(csv.reader([line]), [])
+            for column, position in zip(KEY_COLUMNS, positions):
+                keys[column].append(fields[position] if position < len(fields) else None)
+    return _key_frame(keys, starts + base, lengths)
+
+
+def _part_path(index_dir: str, state: dict, name: str) -> str:
+    return os.path.join(index_dir, state["tag"], name)
+
+
+def _read_parts(index_dir: str, state: dict, filters: list = None) -> pd.DataFrame:
+    """Reads the index rows of one source, optionally through parquet filters"""
+    frames = [pd.read_parquet(_part_path(index_dir, state, part), filters=filters) for part in state["parts"]]
+    if not frames:
+        return pd.DataFrame(columns=KEY_COLUMNS + ["offset", "length"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _write_part(entries: pd.DataFrame, path: str):
+    """Atomically writes one parquet part"""
+    tmp = f"{path}.{os.getpid()}"
+    entries.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def update_index(sources: list, index_dir: str = None) -> dict:
+    """
+    Brings the index up to date with a list of accounting CSV files.
+
+    Every row of a file, GPU job or not, gets an index row holding its job and task
+    numbers, owner, project and end time, and the byte offset and length of the line.
+    Only the bytes appended to each file since the previous update are read. A file that
+    shrank or whose contents before the indexed offset changed is indexed again from
+    the start, and a last line without its newline is left for the next update.
+
+    Parameters:
+        sources (list): Paths of yearly accounting files, missing files are ignored.
+        index_dir (str): Index directory, defaults to INDEX_DIR.
+
+    Returns:
+        dict: The index's meta data after the update.
+    """
+    index_dir = index_dir or INDEX_DIR
+    meta = read_meta(index_dir)
+    changed = False
+
+    for path in sources:
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            continue
+        state = meta["sources"].get(path)
+        stat = os.stat(path)
+        if unchanged(state, stat):
+            continue
+
+        with open(path, "rb") as file:
+            resume = appended(file, state, stat)
+            if state is not None and not resume:
+                shutil.rmtree(os.path.join(index_dir, state["tag"]), ignore_errors=True)
+            if not resume:
+                # New, rewritten or truncated file: index it again from the start
+                file.seek(0)
+                first = file.readline()
+                digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:10]
+                state = {
+                    "tag": f"{os.path.splitext(os.path.basename(path))[0]}-{digest}",
+                    "header": first.decode("utf-8").strip().split(","),
+                    "offset": len(first),
+                    "rows": 0,
+                    "parts": [],
+                    "next_part": 0,
+                }
+                meta["sources"][path] = state
+
+            frames = [
+                _index_block(block, state["offset"], state["header"])
+                for block in read_appended(file, state, stat, BLOCK_SIZE)
+            ]
+            entries = pd.concat(frames, ignore_index=True) if frames else None
+            if entries is not None and len(entries):
+                os.makedirs(os.path.join(index_dir, state["tag"]), exist_ok=True)
+                name = f"part-{state['next_part']:04d}.parquet"
+                _write_part(entries, _part_path(index_dir, state, name))
+                state["parts"].append(name)
+                state["next_part"] += 1
+                state["rows"] += len(entries)
+                if len(state["parts"]) > MAX_PARTS:
+                    _compact(index_dir, state)
+            changed = True
+
+    if changed:
+        os.makedirs(index_dir, exist_ok=True)
+        write_json(os.path.join(index_dir, META_FILE), meta)
+    return meta
+
+
+def _compact(index_dir: str, state: dict):
+    """Merges the parts of a source into a single part"""
+    combined = _read_parts(index_dir, state)
+    name = f"part-{state['next_part']:04d}.parquet"
+    _write_part(combined, _part_path(index_dir, state, name))
+    for part in state["parts"]:
+        os.remove(_part_path(index_dir, state, part))
+    state["parts"] = [name]
+    state["next_part"] += 1
+
+
+def lookup(sources: list, job_numbers: list = None, owners: list = None, projects: list = None,
+           index_dir: str = None) -> dict:
+    """
+    Finds the index rows matching exact job numbers, owners or projects.
+
+    The criteria that are given must all match. The index is updated from `sources`
+    first.
+
+    Parameters:
+        sources (list): Accounting CSV files to search.
+        job_numbers (list): Job numbers to look for.
+        owners (list): Owner (user) names to look for.
+        projects (list): Project names to look for.
+        index_dir (str): Index directory, defaults to INDEX_DIR.
+
+    Returns:
+        dict: {source path: index rows (job_number, task_number, owner, project,
+            ux_end_time, offset, length) in file order}, for the sources with a match.
+    """
+    index_dir = index_dir or INDEX_DIR
+    meta = update_index(sources, index_dir)
+
+    filters = []
+    if job_numbers is not None:
+        filters.append(("job_number", "in", [int(number) for number in job_numbers]))
+    if owners is not None:
+        filters.append(("owner", "in", [str(owner) for owner in owners]))
+    if projects is not None:
+        filters.append(("project", "in", [str(project) for project in projects]))
+
+    matches = {}
+    for path in sources:
+        state = meta["sources"].get(os.path.abspath(path))
+        if state is None:
+            continue
+        entries = _read_parts(index_dir, state, filters or None)
+        if len(entries):
+            matches[os.path.abspath(path)] = entries.sort_values("offset").reset_index(drop=True)
+    return matches
+
+
+def read_rows(path: str, entries: pd.DataFrame, header: list = None) -> pd.DataFrame:
+    """
+    Reads the accounting rows at the offsets of index rows.
+
+    Rows that follow each other in the file are read with a single read.
+
+    Parameters:
+        path (str): Accounting CSV file.
+        entries (pd.DataFrame): Index rows of that file, as returned by lookup.
+        header (list): Column names, read from the first line of the file when not given.
+
+    Returns:
+        pd.DataFrame: The rows, parsed as read_gpu_records parses them.
+    """
+    with open(path, "rb") as file:
+        if header is None:
+            header = file.readline().decode("utf-8").strip().split(",")
+        if entries is None or entries.empty:
+            return pd.DataFrame(columns=header)
+        offsets = entries["offset"].to_numpy()
+        ends = offsets + entries["length"].to_numpy()
+        # Runs of contiguous rows
+        breaks = np.flatnonzero(offsets[1:] != ends[:-1]) + 1
+        chunks = []
+        for first, last in zip(np.concatenate([[0], breaks]), np.append(breaks, len(offsets))):
+            file.seek(offsets[first])
+            chunks.append(file.read(ends[last - 1] - offsets[first]))
+    return pd.read_csv(BytesIO(b"".join(chunks)), names=header, quotechar='"',
+                       low_memory=False, encoding_errors="replace")
+
+
+def fetch_rows(sources: list, job_numbers: list = None, owners: list = None, projects: list = None,
+               index_dir: str = None) -> pd.DataFrame:
+    """
+    Returns the accounting rows matching exact job numbers, owners or projects.
+
+    Only the matching lines of the accounting files are read, see lookup for the
+    criteria.
+
+    Returns:
+        pd.DataFrame: The rows of every source, in file order.
+    """
+    index_dir = index_dir or INDEX_DIR
+    matches = lookup(sources, job_numbers, owners, projects, index_dir)
+    meta = read_meta(index_dir)
+    frames = [read_rows(path, entries, meta["sources"][path]["header"]) for path, entries in matches.items()]
+    if not frames:
+        headers = [state["header"] for path, state in meta["sources"].items()
+                   if path in {os.path.abspath(source) for source in sources}]
+        return pd.DataFrame(columns=headers[0] if headers else [])
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_arguments():
+    """Parse command line arguments for the accounting index tool"""
+    parser = argparse.ArgumentParser(description='Manage the row index of the yearly accounting files')
+    parser.add_argument('--index-dir', type=str, default=None,
+                        help=f'Index directory (default: {INDEX_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help='Index the new rows of the yearly accounting files')
+    update.add_argument('-y', '--year', type=str, nargs='+', required=True,
+                        help='Year(s) (last two digits, e.g. 25)')
+
+    find = commands.add_parser('find', help='Print the accounting rows of jobs, users or projects')
+    find.add_argument('-y', '--year', type=str, nargs='+', required=True,
+                      help='Year(s) (last two digits, e.g. 25)')
+    find.add_argument('-j', '--job', type=int, nargs='+', default=None, help='Job number(s)')
+    find.add_argument('-u', '--user', type=str, nargs='+', default=None, help='Owner(s)')
+    find.add_argument('-p', '--project', type=str, nargs='+', default=None, help='Project(s)')
+    find.add_argument('-o', '--output', type=str, default=None, help='Save the rows to a CSV file')
+
+    commands.add_parser('info', help='List the indexed files')
+    commands.add_parser('clear', help='Remove the index')
+
+    return parser.parse_args()
+
+
+def main():
+    from helpers import ACCOUNTING_DIR
+
+    args = parse_arguments()
+    index_dir = args.index_dir or INDEX_DIR
+
+    if args.command == 'update':
+        start = time.time()
+        update_index([f"{ACCOUNTING_DIR}/20{year}.csv" for year in args.year], index_dir)
+        print(f"Index updated in {time.time() - start:.1f}s")
+
+    elif args.command == 'find':
+        if args.job is None and args.user is None and args.project is None:
+            print("Error: give at least one of --job, --user or --project")
+            return
+        start = time.time()
+        rows = fetch_rows([f"{ACCOUNTING_DIR}/20{year}.csv" for year in args.year],
+                          args.job, args.user, args.project, index_dir)
+        print(f"Found {len(rows)} rows in {time.time() - start:.2f}s")
+        if args.output:
+            rows.to_csv(args.output, index=False)
+            print(f"Results saved to {args.output}")
+        elif len(rows):
+            print(rows.head(20))
+
+    elif args.command == 'info':
+        meta = read_meta(index_dir)
+        for path, state in sorted(meta["sources"].items()):
+            print(f"source  {path}: {state['rows']:,} rows, {state['offset'] / 2**20:,.1f} MB indexed "
+                  f"in {len(state['parts'])} parts")
+
+    elif args.command == 'clear':
+        shutil.rmtree(index_dir, ignore_errors=True)
+        print(f"Removed {index_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import argparse
+import os
+import shutil
+import time
+from io import BytesIO
+import pandas as pd
+from tracked_files import appended, read_appended, read_json, unchanged, write_json
+
+# Where the partitioned GPU-job accounting rows are kept
+STORE_DIR = os.environ.get(
+    "GPU_UTIL_ACCOUNTING_STORE",
+    os.path.join(os.path.expanduser("~"), ".cache", "gpu_util", "accounting")
+)
+META_FILE = "meta.json"
+# Bump whenever the stored columns or the partitioning change, the store is then rebuilt
+STORE_VERSION = 2
+# Bytes of the accounting file read and filtered at a time
+BLOCK_SIZE = 64 * 2**20
+# Each block appends a part to the partitions it touches, the parts of one source are
+# merged back into a single part once a partition holds more than MAX_PARTS of them
+MAX_PARTS = 16
+
+
+def prepare_gpu_jobs(gpu_jobs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the columns process_gpu_data joins on to raw GPU-job accounting rows.
+
+    'task_string' is the task number for array jobs and "undefined" otherwise, and
+    'job_task' is "<job_number>.<task_string>", the job id written in the gpustats files.
+    The submission and end times are converted to numbers.
+
+    Parameters:
+        gpu_jobs (pd.DataFrame): Rows returned by read_gpu_records.
+
+    Returns:
+        pd.DataFrame: The same frame, modified in place.
+    """
+    gpu_jobs["task_string"] = gpu_jobs["task_number"].astype(str)
+    gpu_jobs.loc[~(gpu_jobs["options"].str.contains("-t") | gpu_jobs['task_number'] != 0), "task_string"] = "undefined"
+    gpu_jobs["job_task"] = (
+        gpu_jobs["job_number"].astype(str) + "." + gpu_jobs["task_string"].astype(str)
+    )
+    gpu_jobs["ux_submission_time"] = pd.to_numeric(gpu_jobs["ux_submission_time"], errors="coerce")
+    gpu_jobs["ux_end_time"] = pd.to_numeric(gpu_jobs["ux_end_time"], errors="coerce")
+    return gpu_jobs
+
+
+def read_meta(store_dir: str = None) -> dict:
+    """Reads the store's meta.json, an empty store when it is missing or from an older version"""
+    meta = read_json(os.path.join(store_dir or STORE_DIR, META_FILE), STORE_VERSION)
+    return meta or {"version": STORE_VERSION, "sources": {}, "partitions": {}}
+
+
+def _parse_block(block: bytes, header: list) -> pd.DataFrame:
+    """
+    Parses the GPU-job rows of a block of complete accounting lines, like read_gpu_records.
+
+    Every column is kept as strings (NaN where empty), so that all the parts of the store
+    share one schema whatever values a block happens to hold; load_jobs infers the types
+    of the rows it returns.
+    """
+    lines = [line for line in block.split(b"\n") if b"gpus=" in line]
+    if not lines:
+        return None
+    df = pd.read_csv(BytesIO(b"\n".join(lines)), names=header, quotechar='"', dtype=str,
+                     low_memory=False, encoding_errors="replace")
+    return df[df["options"].str.contains("gpus=", na=False)]
+
+
+def _infer_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the string columns whose values are all numbers, as read_csv would"""
+    for column in df.columns[df.dtypes == object]:
+        numbers = pd.to_numeric(df[column], errors="coerce")
+        if numbers.notna().sum() == df[column].notna().sum():
+            df[column] = numbers
+    return df
+
+
+def _write_part(rows: pd.DataFrame, path: str):
+    """Atomically writes one parquet part"""
+    tmp = f"{path}.{os.getpid()}"
+    rows.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _read_parts(parts: list, store_dir: str, columns: list = None) -> pd.DataFrame:
+    """Reads and concatenates parts of the store"""
+    frames = [pd.read_parquet(os.path.join(store_dir, part), columns=columns) for part in parts]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _partition_stats(partition: dict, rows: pd.DataFrame):
+    """Folds the row count and the submission/end time bounds of new rows into a partition"""
+    partition["rows"] += len(rows)
+    submission = pd.to_numeric(rows["ux_submission_time"], errors="coerce").min()
+    if pd.notna(submission) and (partition["min_submission"] is None
+                                 or submission < partition["min_submission"]):
+        partition["min_submission"] = float(submission)
+    end_max = pd.to_numeric(rows["ux_end_time"], errors="coerce").max()
+    if pd.notna(end_max) and (partition["max_end"] is None or end_max > partition["max_end"]):
+        partition["max_end"] = float(end_max)
+
+
+def _drop_source(meta: dict, path: str, store_dir: str):
+    """Removes every part written from one accounting file and updates the partitions' stats"""
+    tag = meta["sources"][path]["tag"]
+    for key, partition in list(meta["partitions"].items()):
+        kept = []
+        for part in partition["parts"]:
+            if os.path.basename(part).startswith(f"{tag}-"):
+                try:
+                    os.remove(os.path.join(store_dir, part))
+                except OSError:
+                    pass
+            else:
+                kept.append(part)
+        if len(kept) == len(partition["parts"]):
+            continue
+        if not kept:
+            del meta["partitions"][key]
+            continue
+        # The stats cannot be reduced, recompute them from the parts of the other sources
+        partition.update(parts=kept, rows=0, min_submission=None, max_end=None)
+        _partition_stats(partition, _read_parts(kept, store_dir, ["ux_submission_time", "ux_end_time"]))
+    del meta["sources"][path]
+
+
+def update_store(sources: list, store_dir: str = None) -> dict:
+    """
+    Brings the store up to date with a list of accounting CSV files.
+
+    Only the bytes appended to each file since the previous update are read. Rows
+    whose options request GPUs (the 'gpus=' rows of read_gpu_records) are appended, as
+    strings, to the partition of the year/month of their ux_end_time; rows without an
+    end time can never match a GPU sample and are skipped.
+    A file that shrank or whose contents before the stored offset changed is re-read
+    from the start.
+
+    Parameters:
+        sources (list): Paths of yearly accounting files, missing files are ignored.
+        store_dir (str): Store directory, defaults to STORE_DIR.
+
+    Returns:
+        dict: The store's meta data after the update.
+    """
+    store_dir = store_dir or STORE_DIR
+    meta = read_meta(store_dir)
+    changed = False
+
+    for path in sources:
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            continue
+        state = meta["sources"].get(path)
+        stat = os.stat(path)
+        if unchanged(state, stat):
+            continue
+
+        with open(path, "rb") as file:
+            resume = appended(file, state, stat)
+            if state is not None and not resume:
+                _drop_source(meta, path, store_dir)
+            if not resume:
+                # New, rewritten or truncated file: read it again from the start
+                file.seek(0)
+                first = file.readline()
+                state = {
+                    "tag": os.path.splitext(os.path.basename(path))[0],
+                    "header": first.decode("utf-8").strip().split(","),
+                    "offset": len(first),
+                    "next_part": 0,
+                }
+                meta["sources"][path] = state
+
+            # A last line without its newline is picked up by the next update
+            for block in read_appended(file, state, stat, BLOCK_SIZE):
+                _store_block(meta, state, _parse_block(block, state["header"]), store_dir)
+            changed = True
+
+    if changed:
+        os.makedirs(store_dir, exist_ok=True)
+        write_json(os.path.join(store_dir, META_FILE), meta)
+    return meta
+
+
+def _store_block(meta: dict, state: dict, df: pd.DataFrame, store_dir: str):
+    """Appends the rows of one parsed block to their end-time partitions"""
+    if df is None or df.empty:
+        return
+    end = pd.to_datetime(pd.to_numeric(df["ux_end_time"], errors="coerce"), unit="s", errors="coerce")
+    df = df[end.notna()]
+    keys = end[end.notna()].dt.strftime("%Y-%m")
+
+    for key, rows in df.groupby(keys.to_numpy(), sort=True):
+        name = f"{key[:4]}/{key[5:]}/{state['tag']}-{state['next_part']:04d}.parquet"
+        os.makedirs(os.path.dirname(os.path.join(store_dir, name)), exist_ok=True)
+        _write_part(rows, os.path.join(store_dir, name))
+
+        partition = meta["partitions"].setdefault(
+            key, {"parts": [], "rows": 0, "min_submission": None, "max_end": None}
+        )
+        partition["parts"].append(name)
+        _partition_stats(partition, rows)
+        own = [part for part in partition["parts"] if os.path.basename(part).startswith(f"{state['tag']}-")]
+        if len(own) > MAX_PARTS:
+            _compact(partition, own, key, state, store_dir)
+    state["next_part"] += 1
+
+
+def _compact(partition: dict, parts: list, key: str, state: dict, store_dir: str):
+    """Merges the parts one source wrote to a partition into a single part"""
+    state["next_part"] += 1
+    name = f"{key[:4]}/{key[5:]}/{state['tag']}-{state['next_part']:04d}.parquet"
+    _write_part(_read_parts(parts, store_dir), os.path.join(store_dir, name))
+    for part in parts:
+        os.remove(os.path.join(store_dir, part))
+    partition["parts"] = [part for part in partition["parts"] if part not in parts] + [name]
+
+
+def load_jobs(start_time: float, end_time: float, sources: list,
+              store_dir: str = None) -> pd.DataFrame:
+    """
+    Returns the prepared GPU-job accounting rows of every job that may overlap a time window.
+
+    The store is updated from `sources` first. Only partitions holding a job that ended
+    at or after `start_time` and was submitted at or before `end_time` are read, and
+    only the rows of such jobs are returned. Their column types are inferred once over
+    the returned rows, then prepare_gpu_jobs is applied.
+
+    Parameters:
+        start_time (float): Window start, epoch seconds.
+        end_time (float): Window end, epoch seconds.
+        sources (list): Accounting CSV files feeding the store.
+        store_dir (str): Store directory, defaults to STORE_DIR.
+
+    Returns:
+        pd.DataFrame: Rows as read_gpu_records + prepare_gpu_jobs would return them.
+
+    Raises:
+        ImportError: If no parquet engine (pyarrow) is installed.
+    """
+    store_dir = store_dir or STORE_DIR
+    meta = update_store(sources, store_dir)
+
+    frames = []
+    for key in sorted(meta["partitions"]):
+        partition = meta["partitions"][key]
+        if not partition["parts"] or partition["max_end"] < start_time:
+            continue
+        if partition["min_submission"] is not None and partition["min_submission"] > end_time:
+            continue
+        frames.extend(pd.read_parquet(os.path.join(store_dir, part)) for part in partition["parts"])
+
+    if not frames:
+        header = next(iter(meta["sources"].values()))["header"] if meta["sources"] else []
+        return pd.DataFrame(columns=header + ["task_string", "job_task"])
+    jobs = pd.concat(frames, ignore_index=True)
+    ends = pd.to_numeric(jobs["ux_end_time"], errors="coerce")
+    submissions = pd.to_numeric(jobs["ux_submission_time"], errors="coerce")
+    jobs = jobs[(ends >= start_time) & ~(submissions > end_time)].reset_index(drop=True)
+    return prepare_gpu_jobs(_infer_types(jobs))
+
+
+def parse_arguments():
+    """Parse command line arguments for the accounting store tool"""
+    parser = argparse.ArgumentParser(description='Manage the partitioned GPU-job accounting store')
+    parser.add_argument('--store-dir', type=str, default=None,
+                        help=f'Store directory (default: {STORE_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help='Ingest new rows of the yearly accounting files')
+    update.add_argument('-y', '--year', type=str, nargs='+', required=True,
+                        help='Year(s) (last two digits, e.g. 25)')
+
+    commands.add_parser('info', help='List sources and partitions')
+    commands.add_parser('clear', help='Remove the store')
+
+    return parser.parse_args()
+
+
+def main():
+    from helpers import ACCOUNTING_DIR
+
+    args = parse_arguments()
+    store_dir = args.store_dir or STORE_DIR
+
+    if args.command == 'update':
+        start = time.time()
+        update_store([f"{ACCOUNTING_DIR}/20{year}.csv" for year in args.year], store_dir)
+        print(f"Store updated in {time.time() - start:.1f}s")
+
+    elif args.command == 'info':
+        meta = read_meta(store_dir)
+        for path, state in sorted(meta["sources"].items()):
+            print(f"source     {path}: {state['offset'] / 2**20:,.1f} MB ingested")
+        for key, partition in sorted(meta["partitions"].items()):
+            print(f"partition  {key}: {partition['rows']:>9,} rows in {len(partition['parts'])} parts")
+
+    elif args.command == 'clear':
+        shutil.rmtree(store_dir, ignore_errors=True)
+        print(f"Removed {store_dir}")
+
+
+if __name__ == "__main__":
+    main()
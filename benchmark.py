@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from io import StringIO
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import accounting_store
+import gpustats_cache
+import helpers
+from reducers import HourlyCube, JobSummary, reduce_gpu_data
+from synthetic_data import parse_months, read_manifest, write_cluster
+
+# Bump whenever the stages or the layout of the results change
+BENCHMARK_VERSION = 1
+# Stages timed by run_benchmark, in order
+STAGES = ("parse", "parse_cached", "accounting", "accounting_store", "join", "aggregate", "render", "ingest")
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """
+    Fingerprint of a frame's rows that does not depend on their order or on the index.
+
+    Two frames with the same columns and the same multiset of rows have the same digest,
+    so results can be compared between backends, commits or runs whatever order the
+    rows come out in. Categorical columns hash like the same values stored as objects.
+    """
+    if df is None:
+        return None
+    df = df[sorted(df.columns)]
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+    return f"{len(df)}:{int(hashes.sum(dtype=np.uint64)):016x}"
+
+
+@contextmanager
+def use_data(root: str, work_dir: str):
+    """
+    Points helpers at a synthetic cluster written by synthetic_data.write_cluster.
+
+    The gpustats and accounting directories are those of root; the parsed data cache and
+    the accounting store are kept under work_dir, so the user's caches are not touched.
+    """
+    saved = (helpers.GPUSTATS_DIR, helpers.ACCOUNTING_DIR, gpustats_cache.CACHE_DIR, accounting_store.STORE_DIR)
+    helpers.GPUSTATS_DIR = os.path.join(root, "gpustats")
+    helpers.ACCOUNTING_DIR = os.path.join(root, "accounting")
+    gpustats_cache.CACHE_DIR = os.path.join(work_dir, "cache")
+    accounting_store.STORE_DIR = os.path.join(work_dir, "store")
+    helpers._job_indexes.clear()
+    try:
+        yield
+    finally:
+        helpers.GPUSTATS_DIR, helpers.ACCOUNTING_DIR, gpustats_cache.CACHE_DIR, accounting_store.STORE_DIR = saved
+        helpers._job_indexes.clear()
+
+
+def time_stage(function, repeat: int) -> tuple:
+    """
+    Runs function() repeat times, returning (seconds of every run, result of the last run).
+
+    What the pipeline prints (skipped lines, progress) is discarded.
+    """
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        with redirect_stdout(StringIO()):
+            start_time = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - start_time)
+    return seconds, result
+
+
+def git_commit() -> str:
+    """Commit of the working tree, with a '+' when it has uncommitted changes, or None"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+
+def run_benchmark(root: str, repeat: int = 3, stages=STAGES, backend: str = "serial",
+                  n_jobs: int = None) -> dict:
+    """
+    Times each stage of a report on a synthetic cluster.
+
+    Stages, each timed on its own from the output of the previous ones:
+        parse: clean_gpu_data_new of every node-month file.
+        parse_cached: load_gpu_file of every file from a warm parsed data cache.
+        accounting: the GPU-job rows of each month, grepped from the accounting CSV.
+        accounting_store: the same rows from a warm accounting store.
+        join: the samples of each node-month matched to their job (JobIntervalIndex).
+        aggregate: JobSummary and HourlyCube of the joined records and the report tables.
+        render: the report PDF of the whole period.
+        ingest: process_gpu_data of each month end to end, without caches, with `backend`.
+
+    Parameters:
+        root (str): Directory written by synthetic_data.write_cluster.
+        repeat (int): Runs of each stage; all are kept, compare the best ones.
+        stages (iterable): Stages to time, the ones they depend on are run untimed.
+        backend (str): Backend of the ingest stage, see helpers.map_tasks.
+        n_jobs (int): Number of workers of the ingest stage.
+
+    Returns:
+        dict: {stage: {"seconds": [...], "best": s, "median": s, "rows": n, "digest": str}}.
+    """
+    manifest = read_manifest(root)
+    months = parse_months(manifest["months"])
+    host_owner = pd.DataFrame([(node["name"], node["flag"]) for node in manifest["nodes"]],
+                              columns=["node", "sb_flag"])
+    results = {}
+
+    def record(stage, seconds, rows=None, digest=None):
+        results[stage] = {
+            "seconds": [round(s, 4) for s in seconds],
+            "best": round(min(seconds), 4),
+            "median": round(statistics.median(seconds), 4),
+            "rows": rows,
+            "digest": digest,
+        }
+        print(f"{stage:>16}: best {min(seconds):8.3f} s, median {statistics.median(seconds):8.3f} s"
+              + (f", {rows:,} rows" if rows is not None else ""))
+
+    with tempfile.TemporaryDirectory() as work_dir, use_data(root, work_dir):
+        files = [(year, month, node, path)
+                 for year, month in months
+                 for node, path in sorted(helpers.list_gpu_files(year, month))]
+
+        # Parsing
+        def parse():
+            return [helpers.clean_gpu_data_new(path) for _, _, _, path in files]
+        seconds, records = time_stage(parse, repeat if "parse" in stages else 1)
+        if "parse" in stages:
+            record("parse", seconds, sum(map(len, records)),
+                   frame_digest(pd.concat(records, ignore_index=True)))
+
+        if "parse_cached" in stages:
+            time_stage(lambda: [helpers.load_gpu_file(path) for _, _, _, path in files], 1)
+            seconds, cached = time_stage(lambda: [helpers.load_gpu_file(path) for _, _, _, path in files], repeat)
+            record("parse_cached", seconds, sum(map(len, cached)),
+                   frame_digest(pd.concat(cached, ignore_index=True)))
+
+        # Accounting
+        def accounting():
+            return {(year, month): helpers.load_gpu_jobs(year, month, use_store=False) for year, month in months}
+        seconds, gpu_jobs = time_stage(accounting, repeat if "accounting" in stages else 1)
+        if "accounting" in stages:
+            record("accounting", seconds, sum(map(len, gpu_jobs.values())),
+                   frame_digest(pd.concat(gpu_jobs.values(), ignore_index=True)))
+
+        if "accounting_store" in stages:
+            time_stage(lambda: helpers.load_gpu_jobs(*months[0]), 1)
+            seconds, stored = time_stage(
+                lambda: {(year, month): helpers.load_gpu_jobs(year, month) for year, month in months}, repeat)
+            record("accounting_store", seconds, sum(map(len, stored.values())),
+                   frame_digest(pd.concat(stored.values(), ignore_index=True)))
+
+        # Join
+        def join():
+            job_indexes = {key: helpers.JobIntervalIndex(jobs) for key, jobs in gpu_jobs.items()}
+            joined = []
+            for ((year, month, node, _), gpu_records) in zip(files, records):
+                gpu_records = gpu_records.copy()
+                gpu_records["node"] = node
+                gpu_records["time"] = pd.to_numeric(gpu_records["time"], errors="coerce")
+                joined.append(job_indexes[(year, month)].join(gpu_records))
+            return joined
+        seconds, joined = time_stage(join, repeat if "join" in stages else 1)
+        if "join" in stages:
+            record("join", seconds, sum(map(len, joined)), frame_digest(pd.concat(joined, ignore_index=True)))
+
+        # Aggregation
+        def aggregate():
+            from reportgenerator import report_tables
+
+            job_sums, hourly_cube = reduce_gpu_data(joined, JobSummary(), HourlyCube())
+            return report_tables(job_sums, hourly_cube, host_owner, manifest["queues"])
+        seconds, (hourly, job_summary) = time_stage(aggregate, repeat if {"aggregate", "render"} & set(stages) else 1)
+        if "aggregate" in stages:
+            record("aggregate", seconds, len(job_summary), frame_digest(job_summary))
+
+        # Rendering
+        if "render" in stages:
+            from reportgenerator import create_report
+
+            first = datetime.strptime(f"20{months[0][0]}-{months[0][1]}", "%Y-%m")
+            last = datetime.strptime(f"20{months[-1][0]}-{months[-1][1]}", "%Y-%m")
+            output = os.path.join(work_dir, "report.pdf")
+            seconds, _ = time_stage(
+                lambda: create_report(output, first, hourly, job_summary,
+                                      end_date=last if len(months) > 1 else None), repeat)
+            record("render", seconds)
+            results["render"]["pdf_kb"] = round(os.path.getsize(output) / 1024)
+
+        # End to end
+        if "ingest" in stages:
+            def ingest():
+                helpers._job_indexes.clear()
+                return [helpers.process_gpu_data(year, month, use_cache=False, backend=backend, n_jobs=n_jobs)
+                        for year, month in months]
+            seconds, frames = time_stage(ingest, repeat)
+            record("ingest", seconds, sum(map(len, frames)), frame_digest(pd.concat(frames, ignore_index=True)))
+
+    return results
+
+
+def save_results(path: str, results: dict, root: str, repeat: int, backend: str, n_jobs: int):
+    """Writes the results of run_benchmark with what they were measured on to a JSON file"""
+    manifest = read_manifest(root)
+    document = {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "machine": {
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "cpus": helpers.default_n_jobs(),
+        },
+        "data": {key: manifest[key] for key in ("months", "jobs", "recycled_job_ids", "gpustats_lines", "config")},
+        "settings": {"repeat": repeat, "backend": backend, "n_jobs": n_jobs},
+        "stages": results,
+    }
+    with open(path, "w") as file:
+        json.dump(document, file, indent=1)
+
+
+def compare_results(old_path: str, new_path: str, threshold: float = 0.1) -> bool:
+    """
+    Prints the best time of every stage in two result files and flags changes.
+
+    Stages more than `threshold` slower are marked as regressions; stages whose output
+    digest changed are reported as well.
+
+    Returns:
+        bool: True when no stage got slower or changed its output.
+    """
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    if old["data"] != new["data"]:
+        print("Warning: the results were measured on different synthetic data")
+    if old["settings"] != new["settings"] or old["machine"] != new["machine"]:
+        print("Warning: the results were measured with different settings or on different machines")
+
+    ok = True
+    print(f"{'stage':>16} {old.get('commit') or 'old':>10} {new.get('commit') or 'new':>10}   ratio")
+    for stage in STAGES:
+        if stage not in old["stages"] or stage not in new["stages"]:
+            continue
+        before, after = old["stages"][stage], new["stages"][stage]
+        ratio = after["best"] / before["best"] if before["best"] else float("inf")
+        notes = []
+        if ratio > 1 + threshold:
+            notes.append("slower")
+            ok = False
+        if before["digest"] and after["digest"] and before["digest"] != after["digest"]:
+            notes.append("output changed")
+            ok = False
+        print(f"{stage:>16} {before['best']:9.3f}s {after['best']:9.3f}s {ratio:6.2f}x  {', '.join(notes)}")
+    return ok
+
+
+def parse_arguments():
+    """Parse command line arguments for the benchmark suite"""
+    parser = argparse.ArgumentParser(description='Benchmark the GPU report pipeline on synthetic data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Time every stage and write the results to JSON')
+    run.add_argument('--data', type=str, default=None,
+                     help='Directory written by synthetic_data.py (default: generate one in a temporary directory)')
+    run.add_argument('--months', type=str, nargs='+', default=["25-01"],
+                     help='Months to generate, as YY-MM (default: 25-01)')
+    run.add_argument('--nodes', type=int, default=8, help='Number of GPU nodes to generate (default: 8)')
+    run.add_argument('--gpus', type=int, default=4, help='GPUs per node to generate (default: 4)')
+    run.add_argument('--jobs-per-month', type=int, default=1000,
+                     help='GPU jobs per month to generate (default: 1000)')
+    run.add_argument('--seed', type=int, default=0, help='Random seed of the generated data (default: 0)')
+    run.add_argument('--repeat', type=int, default=3, help='Runs of every stage (default: 3)')
+    run.add_argument('--stages', type=str, nargs='+', default=list(STAGES), choices=STAGES,
+                     help='Stages to time (default: all)')
+    run.add_argument('--backend', type=str, default="serial",
+                     help='Backend of the ingest stage: serial, thread or process')
+    run.add_argument('-j', '--jobs', type=int, default=None,
+                     help='Number of workers of the ingest stage')
+    run.add_argument('-o', '--output', type=str, default="benchmark.json",
+                     help='Results file (default: benchmark.json)')
+
+    compare = commands.add_parser('compare', help='Compare two results files')
+    compare.add_argument('old', type=str, help='Results of the reference commit')
+    compare.add_argument('new', type=str, help='Results to check')
+    compare.add_argument('--threshold', type=float, default=0.1,
+                         help='Slowdown flagged as a regression (default: 0.1, 10%%)')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    if args.command == 'run':
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = args.data
+            if root is None:
+                root = os.path.join(tmpdir, "data")
+                start_time = time.time()
+                manifest = write_cluster(root, parse_months(args.months), args.nodes, args.gpus,
+                                         args.jobs_per_month, seed=args.seed)
+                print(f"Generated {manifest['gpustats_lines']:,} gpustats lines and {manifest['jobs']:,} jobs "
+                      f"in {time.time() - start_time:.1f}s")
+            results = run_benchmark(root, args.repeat, args.stages, args.backend, args.jobs)
+            save_results(args.output, results, root, args.repeat, args.backend, args.jobs)
+        print(f"Results saved as {args.output}")
+
+    elif args.command == 'compare':
+        if not compare_results(args.old, args.new, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+import argparse
+import hashlib
+import os
+import shutil
+import time
+import pandas as pd
+from tracked_files import checksums, read_json, write_json
+
+# Where parsed gpustats frames are kept between runs
+CACHE_DIR = os.environ.get(
+    "GPU_UTIL_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "gpu_util", "gpustats")
+)
+META_FILE = "meta.json"
+DATA_FILE = "data.parquet"
+# Incremental entries keep one parquet part per ingested chunk and are compacted
+# back into a single file once they hold more than MAX_PARTS parts
+MAX_PARTS = 16
+
+_parquet_warning_shown = False
+
+
+def entry_dir(filepath: str, cache_dir: str = None) -> str:
+    """
+    Returns the cache directory used for a single gpustats file.
+
+    Entries are laid out as <cache_dir>/<node>/<YYMM>-<hash>, where the hash is
+    taken from the absolute source path so that two data trees never share an entry.
+
+    Parameters:
+        filepath (str): Path to the gpustats file (e.g. .../data/scc-e02/2503).
+        cache_dir (str): Cache root, defaults to CACHE_DIR.
+
+    Returns:
+        str: Path of the entry directory (it may not exist yet).
+    """
+    filepath = os.path.abspath(filepath)
+    digest = hashlib.sha1(filepath.encode("utf-8")).hexdigest()[:10]
+    node = os.path.basename(os.path.dirname(filepath))
+    name = os.path.basename(filepath)
+    return os.path.join(cache_dir or CACHE_DIR, node, f"{name}-{digest}")
+
+
+def source_key(filepath: str, parser_version: int) -> dict:
+    """
+    Builds the cache key of a gpustats file: path, size, mtime and parser version.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        parser_version (int): Version of the parser producing the cached frame.
+
+    Returns:
+        dict: The key, stored verbatim in the entry's meta.json.
+    """
+    stat = os.stat(filepath)
+    return {
+        "path": os.path.abspath(filepath),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "parser_version": parser_version,
+    }
+
+
+def read_meta(path: str) -> dict:
+    """Reads an entry's meta.json, returning None when it is missing or unreadable"""
+    return read_json(os.path.join(path, META_FILE))
+
+
+def _write_meta(path: str, meta: dict):
+    """Atomically replaces an entry's meta.json"""
+    write_json(os.path.join(path, META_FILE), meta)
+
+
+def _write_part(path: str, name: str, frame: pd.DataFrame):
+    """Atomically writes one parquet part of an entry"""
+    tmp = os.path.join(path, f".{name}.{os.getpid()}")
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, os.path.join(path, name))
+
+
+def _warn(message: str):
+    """Prints a cache warning once per process, the report itself carries on uncached"""
+    global _parquet_warning_shown
+    if not _parquet_warning_shown:
+        print(f"gpustats cache disabled: {message}")
+        _parquet_warning_shown = True
+
+
+def load_entry(filepath: str, parser_version: int, cache_dir: str = None) -> pd.DataFrame:
+    """
+    Loads the cached frame of a gpustats file if its entry is still valid.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        parser_version (int): Version of the parser the caller would run.
+        cache_dir (str): Cache root, defaults to CACHE_DIR.
+
+    Returns:
+        pd.DataFrame: The cached frame, or None when there is no fresh entry.
+
+    Raises:
+        ValueError: If the file was cached as malformed, with the original message.
+    """
+    path = entry_dir(filepath, cache_dir)
+    meta = read_meta(path)
+    if meta is None or meta.get("key") != source_key(filepath, parser_version):
+        return None
+
+    if meta.get("error"):
+        raise ValueError(meta["error"])
+
+    return _read_parts(path, meta)
+
+
+def _read_parts(path: str, meta: dict) -> pd.DataFrame:
+    """Concatenates the parquet parts of an entry, None if any of them cannot be read"""
+    try:
+        frames = [pd.read_parquet(os.path.join(path, part)) for part in meta.get("parts", [DATA_FILE])]
+    except Exception:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def store_entry(filepath: str, key: dict, frame: pd.DataFrame = None, error: str = None,
+                cache_dir: str = None):
+    """
+    Writes a parsed frame (or the parse error of a malformed file) to the cache.
+
+    The parquet file is written first and meta.json last, so a reader never sees a
+    key pointing at a partially written frame.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        key (dict): Key returned by source_key() before the file was parsed.
+        frame (pd.DataFrame): Parsed frame, omitted when error is given.
+        error (str): Message of the ValueError raised by the parser.
+        cache_dir (str): Cache root, defaults to CACHE_DIR.
+    """
+    path = entry_dir(filepath, cache_dir)
+    try:
+        os.makedirs(path, exist_ok=True)
+        meta = {"key": key, "created": time.time(), "rows": 0, "error": error, "parts": []}
+        if frame is not None:
+            _write_part(path, DATA_FILE, frame)
+            meta["rows"] = len(frame)
+            meta["parts"] = [DATA_FILE]
+        _write_meta(path, meta)
+    except ImportError as e:
+        _warn(str(e))
+    except OSError as e:
+        _warn(f"cannot write to {path} ({e})")
+
+
+def cached_parse(filepath: str, parse, parser_version: int, cache_dir: str = None) -> pd.DataFrame:
+    """
+    Returns parse(filepath), reusing the cached frame while the file is unchanged.
+
+    A cache entry is valid while the file's path, size and mtime and the parser
+    version all match the stored key; anything else rebuilds the entry.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        parse (callable): Parser taking the file path and returning a DataFrame.
+        parser_version (int): Version of that parser, bump it when its output changes.
+        cache_dir (str): Cache root, defaults to CACHE_DIR.
+
+    Returns:
+        pd.DataFrame: The parsed records.
+
+    Raises:
+        ValueError: If the file is malformed (cached so it is not re-read every run).
+    """
+    frame = load_entry(filepath, parser_version, cache_dir)
+    if frame is not None:
+        return frame
+
+    key = source_key(filepath, parser_version)
+    try:
+        frame = parse(filepath)
+    except ValueError as e:
+        store_entry(filepath, key, error=str(e), cache_dir=cache_dir)
+        raise
+    store_entry(filepath, key, frame, cache_dir=cache_dir)
+    return frame
+
+
+def incremental_parse(filepath: str, parse_bytes, parser_version: int,
+                      cache_dir: str = None) -> pd.DataFrame:
+    """
+    Returns the parsed records of an append-only gpustats file, parsing only new bytes.
+
+    The entry remembers the byte offset of the last complete line it ingested together
+    with checksums of the bytes around it. While a file keeps growing, each call parses
+    only what was appended since that offset and stores it as a new parquet part; a
+    file that shrank or whose checksums no longer match is parsed from scratch.
+
+    A trailing line without its newline (still being written) is parsed for the
+    returned frame but not stored, and ignored if it cannot be parsed yet.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        parse_bytes (callable): Parser taking (bytes, filepath) and returning a DataFrame,
+            it must give the same rows for a file and for its line-aligned chunks.
+        parser_version (int): Version of that parser, bump it when its output changes.
+        cache_dir (str): Cache root, defaults to CACHE_DIR.
+
+    Returns:
+        pd.DataFrame: The parsed records, same rows as a full parse of the file.
+
+    Raises:
+        ValueError: If the file contains a malformed line.
+    """
+    path = entry_dir(filepath, cache_dir)
+    meta = read_meta(path)
+    key = source_key(filepath, parser_version)
+
+    # Unchanged since the last run
+    if meta is not None and meta.get("key") == key and not meta.get("pending"):
+        if meta.get("error"):
+            raise ValueError(meta["error"])
+        frame = _read_parts(path, meta)
+        if frame is not None:
+            return frame
+
+    with open(filepath, "rb") as file:
+        resume = (
+            meta is not None
+            and not meta.get("error")
+            and meta.get("offset") is not None
+            and meta["key"]["path"] == key["path"]
+            and meta["key"]["parser_version"] == parser_version
+            and key["size"] >= meta["offset"]
+            and checksums(file, meta["offset"]) == meta.get("checksums")
+        )
+        # Rows already stored, a part that cannot be read means starting over
+        previous = _read_parts(path, meta) if resume and meta.get("parts") else None
+        if previous is None and resume and meta.get("parts"):
+            resume = False
+        start = meta["offset"] if resume else 0
+        file.seek(start)
+        data = file.read()
+        end = start + data.rfind(b"\n") + 1
+        complete, pending = data[:end - start], data[end - start:]
+        end_checksums = checksums(file, end)
+
+    # The file may have grown since it was stat'ed, record what was actually read
+    key["size"] = start + len(data)
+    if not resume:
+        meta = {"key": key, "created": time.time(), "rows": 0, "error": None, "parts": []}
+
+    try:
+        frame = parse_bytes(complete, filepath)
+    except ValueError as e:
+        meta.update(key=key, error=str(e), pending=False)
+        _store_incremental(path, meta, None, resume)
+        raise
+
+    meta.update(key=key, offset=end, checksums=end_checksums, pending=bool(pending.strip()))
+    _store_incremental(path, meta, frame, resume)
+
+    frames = [previous, frame]
+    if pending.strip():
+        try:
+            frames.append(parse_bytes(pending, filepath))
+        except ValueError:
+            pass
+
+    frames = [f for f in frames if f is not None and len(f)]
+    if not frames:
+        return frame
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _store_incremental(path: str, meta: dict, frame: pd.DataFrame, resume: bool):
+    """Adds a newly parsed chunk to an incremental entry and rewrites its meta.json"""
+    try:
+        if not resume and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+        if frame is not None and len(frame):
+            parts = meta["parts"]
+            number = int(parts[-1][5:9]) + 1 if parts and parts[-1].startswith("part-") else 0
+            name = f"part-{number:04d}.parquet"
+            _write_part(path, name, frame)
+            parts.append(name)
+            meta["rows"] += len(frame)
+
+            if len(parts) > MAX_PARTS:
+                combined = _read_parts(path, meta)
+                _write_part(path, DATA_FILE, combined)
+                meta["parts"] = [DATA_FILE]
+                _write_meta(path, meta)
+                for part in parts:
+                    if part != DATA_FILE:
+                        os.remove(os.path.join(path, part))
+                return
+        _write_meta(path, meta)
+    except ImportError as e:
+        _warn(str(e))
+    except OSError as e:
+        _warn(f"cannot write to {path} ({e})")
+
+
+def entry_status(meta: dict, parser_version: int) -> str:
+    """
+    Classifies a cache entry as 'fresh', 'growing' (incremental entry whose source was
+    appended to since), 'stale' (source changed or newer parser) or 'orphan' (source
+    file no longer exists).
+    """
+    key = meta["key"]
+    if not os.path.exists(key["path"]):
+        return "orphan"
+    current = source_key(key["path"], parser_version)
+    if current == key:
+        return "fresh"
+    if (meta.get("offset") is not None and not meta.get("error")
+            and key["parser_version"] == parser_version and current["size"] >= key["size"]):
+        return "growing"
+    return "stale"
+
+
+def list_entries(parser_version: int, cache_dir: str = None) -> list:
+    """
+    Lists every entry under the cache root.
+
+    Parameters:
+        parser_version (int): Current parser version, used to flag stale entries.
+        cache_dir (str): Cache root, defaults to CACHE_DIR.
+
+    Returns:
+        list: One dict per entry with its directory, meta, status and size on disk.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+
+    for node in sorted(os.listdir(cache_dir)):
+        node_dir = os.path.join(cache_dir, node)
+        if not os.path.isdir(node_dir):
+            continue
+        for name in sorted(os.listdir(node_dir)):
+            path = os.path.join(node_dir, name)
+            meta = read_meta(path)
+            size = sum(
+                os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+            ) if os.path.isdir(path) else 0
+            entries.append({
+                "dir": path,
+                "node": node,
+                "meta": meta,
+                "status": entry_status(meta, parser_version) if meta else "broken",
+                "bytes": size,
+            })
+    return entries
+
+
+def prune_entries(parser_version: int, cache_dir: str = None, remove_all: bool = False,
+                  older_than: float = None) -> list:
+    """
+    Removes cache entries that can no longer be used.
+
+    Stale, orphaned and broken entries are always removed, growing ones are kept. With remove_all every entry
+    goes, and with older_than (days) fresh entries built before that age go as well.
+
+    Returns:
+        list: The entries that were removed.
+    """
+    removed = []
+    cutoff = time.time() - older_than * 86400 if older_than is not None else None
+    for entry in list_entries(parser_version, cache_dir):
+        created = entry["meta"]["created"] if entry["meta"] else 0
+        if (remove_all or entry["status"] not in ("fresh", "growing")
+                or (cutoff is not None and created < cutoff)):
+            shutil.rmtree(entry["dir"], ignore_errors=True)
+            removed.append(entry)
+
+    # Drop node directories left empty
+    cache_dir = cache_dir or CACHE_DIR
+    if os.path.isdir(cache_dir):
+        for node in os.listdir(cache_dir):
+            node_dir = os.path.join(cache_dir, node)
+            if os.path.isdir(node_dir) and not os.listdir(node_dir):
+                os.rmdir(node_dir)
+    return removed
+
+
+def parse_arguments():
+    """Parse command line arguments for the cache tool"""
+    parser = argparse.ArgumentParser(description='Manage the parsed gpustats cache')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help=f'Cache directory (default: {CACHE_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    warm = commands.add_parser('warm', help='Parse and cache the gpustats files of a month')
+    warm.add_argument('-y', '--year', type=str, required=True,
+                      help='Year (last two digits, e.g. 25)')
+    warm.add_argument('-m', '--month', type=str, nargs='+', default=None,
+                      help='Month(s) (two digits, e.g. 02), default: the whole year')
+    warm.add_argument('--incremental', action='store_true',
+                      help='Only parse bytes appended since the last run (months in progress)')
+
+    commands.add_parser('info', help='List cache entries and their status')
+
+    prune = commands.add_parser('prune', help='Remove stale, orphaned or old entries')
+    prune.add_argument('--all', action='store_true',
+                       help='Remove every entry')
+    prune.add_argument('--older-than', type=float, default=None,
+                       help='Also remove entries built more than this many days ago')
+
+    return parser.parse_args()
+
+
+def main():
+    # The cache itself does not depend on helpers, only the command line tool does
+    from helpers import PARSER_VERSION, list_gpu_files, load_gpu_file
+
+    args = parse_arguments()
+
+    if args.command == 'warm':
+        months = args.month or [f"{m:02d}" for m in range(1, 13)]
+        for month in months:
+            files = list_gpu_files(args.year, month)
+            start = time.time()
+            for node, file_name in files:
+                try:
+                    load_gpu_file(file_name, cache_dir=args.cache_dir,
+                                  incremental=args.incremental)
+                except Exception:
+                    print(f"Skipping missing or corrupted file: {file_name}")
+            print(f"Warmed {args.year}-{month}: {len(files)} files in {time.time() - start:.1f}s")
+
+    elif args.command == 'info':
+        entries = list_entries(PARSER_VERSION, args.cache_dir)
+        for entry in entries:
+            meta = entry["meta"] or {}
+            rows = "error" if meta.get("error") else meta.get("rows", "?")
+            path = meta.get("key", {}).get("path", entry["dir"])
+            print(f"{entry['status']:>6}  {entry['bytes'] / 2**20:8.2f} MB  {rows:>9}  {path}")
+        total = sum(entry["bytes"] for entry in entries)
+        counts = pd.Series([entry["status"] for entry in entries], dtype=object).value_counts()
+        summary = ", ".join(f"{n} {status}" for status, n in counts.items())
+        print(f"{len(entries)} entries ({summary or 'empty'}), {total / 2**20:.1f} MB "
+              f"in {args.cache_dir or CACHE_DIR}")
+
+    elif args.command == 'prune':
+        removed = prune_entries(PARSER_VERSION, args.cache_dir, args.all, args.older_than)
+        freed = sum(entry["bytes"] for entry in removed)
+        print(f"Removed {len(removed)} entries, freed {freed / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import argparse
+import hashlib
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from tracked_files import appended, read_appended, read_json, unchanged, write_json
+
+# Where the time indexes of the gpustats files are kept
+INDEX_DIR = os.environ.get(
+    "GPU_UTIL_INDEX_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "gpu_util", "index")
+)
+# Bump whenever the index layout changes, older indexes are then rebuilt
+INDEX_VERSION = 2
+# The index keeps one entry per block of about this many bytes, cut at line starts
+BLOCK_BYTES = 256 * 1024
+# Longest timestamp read at the start of a line
+TIME_DIGITS = 12
+
+
+def index_path(filepath: str, index_dir: str = None) -> str:
+    """
+    Returns the index file of a gpustats file, <index_dir>/<node>/<YYMM>-<hash>.json.
+
+    The hash is taken from the absolute source path so that two data trees never share
+    an index, as for the parsed data cache.
+    """
+    filepath = os.path.abspath(filepath)
+    digest = hashlib.sha1(filepath.encode("utf-8")).hexdigest()[:10]
+    node = os.path.basename(os.path.dirname(filepath))
+    return os.path.join(index_dir or INDEX_DIR, node, f"{os.path.basename(filepath)}-{digest}.json")
+
+
+def _line_times(data: bytes) -> tuple:
+    """
+    Offsets and leading timestamps of the lines of a chunk of complete lines.
+
+    Returns:
+        tuple: (line start offsets, timestamps), the timestamp of a line that does not
+            start with digits is -1.
+    """
+    codes = np.frombuffer(data, dtype=np.uint8)
+    starts = np.concatenate([[0], np.flatnonzero(codes == ord("\n"))[:-1] + 1]).astype(np.int64)
+    padded = np.concatenate([codes, np.zeros(TIME_DIGITS, dtype=np.uint8)])
+    window = padded[starts[:, None] + np.arange(TIME_DIGITS)]
+    digits = (window >= ord("0")) & (window <= ord("9"))
+    # Number of leading digits of each line
+    n_digits = np.where(digits.all(axis=1), TIME_DIGITS, digits.argmin(axis=1))
+    powers = n_digits[:, None] - 1 - np.arange(TIME_DIGITS)
+    values = np.where(powers >= 0, window.astype(np.int64) - ord("0"), 0) * 10 ** np.maximum(powers, 0)
+    times = np.where(n_digits > 0, values.sum(axis=1), -1)
+    return starts, times
+
+
+def _index_blocks(data: bytes, base: int) -> tuple:
+    """Block offsets and time ranges of a chunk of complete lines starting at byte `base`"""
+    starts, times = _line_times(data)
+    block = (starts + base) // BLOCK_BYTES
+    first = np.flatnonzero(np.diff(block, prepend=-1))
+    offsets, min_times, max_times = [], [], []
+    for begin, end in zip(first, np.append(first[1:], len(starts))):
+        valid = times[begin:end][times[begin:end] >= 0]
+        offsets.append(int(base + starts[begin]))
+        min_times.append(int(valid.min()) if len(valid) else None)
+        max_times.append(int(valid.max()) if len(valid) else None)
+    return offsets, min_times, max_times
+
+
+def load_index(filepath: str, index_dir: str = None) -> dict:
+    """
+    Returns the time index of a gpustats file, building or extending it as needed.
+
+    The index splits the file into blocks of about BLOCK_BYTES, cut at line starts, and
+    keeps the byte offset and the first and last timestamps of each block. Files are
+    expected to be appended to: when a file grew and its indexed part is unchanged, only
+    the new lines are indexed. A last line without its newline is left for the next call.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        index_dir (str): Index root, defaults to INDEX_DIR.
+
+    Returns:
+        dict: {"offset": indexed bytes, "offsets": [...], "min_time": [...], "max_time": [...]}
+    """
+    path = index_path(filepath, index_dir)
+    stat = os.stat(filepath)
+    index = read_json(path, INDEX_VERSION)
+    if unchanged(index, stat):
+        return index
+
+    with open(filepath, "rb") as file:
+        if not appended(file, index, stat):
+            # New, rewritten or truncated file
+            index = {"version": INDEX_VERSION, "path": os.path.abspath(filepath), "offset": 0,
+                     "offsets": [], "min_time": [], "max_time": []}
+        for data in read_appended(file, index, stat):
+            offsets, min_times, max_times = _index_blocks(data, index["offset"])
+            index["offsets"] += offsets
+            index["min_time"] += min_times
+            index["max_time"] += max_times
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json(path, index, indent=None)
+    return index
+
+
+def read_time_windows(filepath: str, windows: list, index_dir: str = None) -> pd.DataFrame:
+    """
+    Parses the lines of a gpustats file stamped within any of several time windows.
+
+    Only the blocks of the file whose time range overlaps a window are read, each block
+    once however many windows it overlaps, so the cost depends on the length of the
+    windows rather than on the size of the file.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        windows (list): (start, end) pairs, epoch seconds (inclusive).
+        index_dir (str): Index root, defaults to INDEX_DIR.
+
+    Returns:
+        pd.DataFrame: Records as clean_gpu_data_new returns them, for the windows only.
+    """
+    from helpers import GPU_RECORD_COLUMNS, parse_gpu_bytes
+
+    index = load_index(filepath, index_dir)
+    ends = index["offsets"][1:] + [index["offset"]]
+    ranges = []
+    for offset, end, first, last in zip(index["offsets"], ends, index["min_time"], index["max_time"]):
+        if first is None or not any(last >= start_time and first <= end_time for start_time, end_time in windows):
+            continue
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1][1] = end
+        else:
+            ranges.append([offset, end])
+
+    frames = []
+    with open(filepath, "rb") as file:
+        for offset, end in ranges:
+            file.seek(offset)
+            frames.append(parse_gpu_bytes(file.read(end - offset), filepath))
+    if not frames:
+        return pd.DataFrame([], columns=GPU_RECORD_COLUMNS)
+    records = pd.concat(frames, ignore_index=True)
+    times = pd.to_numeric(records["time"], errors="coerce")
+    keep = np.zeros(len(records), dtype=bool)
+    for start_time, end_time in windows:
+        keep |= ((times >= start_time) & (times <= end_time)).to_numpy()
+    return records[keep].reset_index(drop=True)
+
+
+def read_time_window(filepath: str, start_time: float, end_time: float, index_dir: str = None) -> pd.DataFrame:
+    """
+    Parses the lines of a gpustats file stamped between start_time and end_time.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        start_time (float): Window start, epoch seconds (inclusive).
+        end_time (float): Window end, epoch seconds (inclusive).
+        index_dir (str): Index root, defaults to INDEX_DIR.
+
+    Returns:
+        pd.DataFrame: Records as clean_gpu_data_new returns them, for the window only.
+    """
+    return read_time_windows(filepath, [(start_time, end_time)], index_dir)
+
+
+def find_job(job_number: int, task: str = None, years: list = None) -> pd.DataFrame:
+    """
+    Finds the GPU-job accounting rows of a job through the accounting index.
+
+    Parameters:
+        job_number (int): SGE job number.
+        task (str): Task number of an array job, all tasks when not given.
+        years (list): Two-digit years whose accounting files are searched (default: this
+            year and the previous one).
+
+    Returns:
+        pd.DataFrame: The job's rows, most recent first; recycled job numbers give one row
+            per job that used the number.
+    """
+    from accounting_index import fetch_rows
+    from accounting_store import prepare_gpu_jobs
+    from helpers import ACCOUNTING_DIR
+
+    if years is None:
+        this_year = time.gmtime().tm_year % 100
+        years = [f"{this_year - 1:02d}", f"{this_year:02d}"]
+    jobs = fetch_rows([f"{ACCOUNTING_DIR}/20{year}.csv" for year in years], job_numbers=[job_number])
+    if jobs.empty:
+        return pd.DataFrame()
+    jobs = jobs[jobs["options"].astype(str).str.contains("gpus=", na=False)]
+    jobs = prepare_gpu_jobs(jobs.copy())
+    jobs = jobs[jobs["ux_end_time"].notna()]
+    if task is not None:
+        jobs = jobs[jobs["task_string"].astype(str) == str(task)]
+    return jobs.sort_values("ux_end_time", ascending=False).reset_index(drop=True)
+
+
+def _job_files(job: pd.Series, data_dir: str = None) -> list:
+    """The existing gpustats files of a job's host covering the months of its run"""
+    from helpers import GPUSTATS_DIR
+
+    node = str(job["hostname"]).split(".")[0]
+    first, last = time.gmtime(float(job["ux_start_time"])), time.gmtime(float(job["ux_end_time"]))
+    files = []
+    year, month = first.tm_year, first.tm_mon
+    while (year, month) <= (last.tm_year, last.tm_mon):
+        filepath = os.path.join(data_dir or GPUSTATS_DIR, node, f"{year % 100:02d}{month:02d}")
+        if os.path.exists(filepath):
+            files.append(filepath)
+        year, month = year + month // 12, month % 12 + 1
+    return files
+
+
+def job_samples(job: pd.Series, data_dir: str = None, index_dir: str = None) -> pd.DataFrame:
+    """
+    Reads the gpustats samples of one job from its host's files, through the time index.
+
+    Parameters:
+        job (pd.Series): Accounting row of the job (hostname, job_task, ux_start_time, ux_end_time).
+        data_dir (str): gpustats directory, defaults to helpers.GPUSTATS_DIR.
+        index_dir (str): Index root, defaults to INDEX_DIR.
+
+    Returns:
+        pd.DataFrame: The samples written with the job's id during its run.
+    """
+    from helpers import GPU_RECORD_COLUMNS
+
+    start_time, end_time = float(job["ux_start_time"]), float(job["ux_end_time"])
+    frames = [read_time_window(filepath, start_time, end_time, index_dir)
+              for filepath in _job_files(job, data_dir)]
+    if not frames:
+        return pd.DataFrame([], columns=GPU_RECORD_COLUMNS)
+    samples = pd.concat(frames, ignore_index=True)
+    return samples[samples["job_id"] == job["job_task"]].reset_index(drop=True)
+
+
+def jobs_stats(jobs: pd.DataFrame, idle_threshold: float = None, data_dir: str = None,
+               index_dir: str = None) -> pd.DataFrame:
+    """
+    Summarizes the GPU samples of many jobs, reading each gpustats file once.
+
+    The jobs are grouped by the gpustats files of their host and months; each file is
+    read through the time index for the run windows of all of its jobs, so only the
+    blocks of the hosts and times the jobs ran on are parsed.
+
+    Parameters:
+        jobs (pd.DataFrame): Prepared GPU-job accounting rows (hostname, job_task,
+            ux_start_time, ux_end_time).
+        idle_threshold (float): See job_stats.
+        data_dir (str): gpustats directory, defaults to helpers.GPUSTATS_DIR.
+        index_dir (str): Index root, defaults to INDEX_DIR.
+
+    Returns:
+        pd.DataFrame: One row of job_stats per job, with the index of `jobs`.
+    """
+    from helpers import GPU_RECORD_COLUMNS
+
+    started = pd.to_numeric(jobs["ux_start_time"], errors="coerce") > 0
+    by_file = {}
+    for label, job in jobs[started].iterrows():
+        for filepath in _job_files(job, data_dir):
+            by_file.setdefault(filepath, []).append(label)
+
+    pieces = {label: [] for label in jobs.index}
+    for filepath, labels in by_file.items():
+        windows = [(float(jobs.at[label, "ux_start_time"]), float(jobs.at[label, "ux_end_time"])) for label in labels]
+        records = read_time_windows(filepath, windows, index_dir)
+        times = pd.to_numeric(records["time"], errors="coerce")
+        groups = records.groupby("job_id").indices
+        for label, (start_time, end_time) in zip(labels, windows):
+            rows = groups.get(jobs.at[label, "job_task"])
+            if rows is not None:
+                rows = rows[((times.iloc[rows] >= start_time) & (times.iloc[rows] <= end_time)).to_numpy()]
+                pieces[label].append(records.iloc[rows])
+
+    empty = pd.DataFrame([], columns=GPU_RECORD_COLUMNS)
+    stats = [job_stats(job, pd.concat(pieces[label], ignore_index=True) if pieces[label] else empty,
+                       idle_threshold)
+             for label, job in jobs.iterrows()]
+    return pd.DataFrame(stats, index=jobs.index)
+
+
+def job_stats(job: pd.Series, samples: pd.DataFrame, idle_threshold: float = None) -> dict:
+    """
+    Summarizes the GPU samples of a job.
+
+    Parameters:
+        job (pd.Series): Accounting row of the job.
+        samples (pd.DataFrame): Its samples, from job_samples.
+        idle_threshold (float): Utilization (%) below which a sample counts as idle,
+            defaults to reducers.LOW_UTIL_THRESHOLD.
+
+    Returns:
+        dict: GPU count, sampled GPU hours, average and peak utilization, idle share and
+            GPU hours, peak VRAM.
+    """
+    from reducers import LOW_UTIL_THRESHOLD, SAMPLE_SECONDS
+
+    threshold = LOW_UTIL_THRESHOLD if idle_threshold is None else idle_threshold
+    util = pd.to_numeric(samples["util"], errors="coerce")
+    vram = pd.to_numeric(samples["memory_used_mb"], errors="coerce")
+    times = pd.to_numeric(samples["time"], errors="coerce")
+    # Sampling interval of the node, from the gaps between samples of a GPU; jobs with a
+    # single sample per GPU have no gap and count SAMPLE_SECONDS per sample like the reducers
+    gaps = times.groupby(samples["bus"]).diff()
+    interval = float(gaps[gaps > 0].median()) if (gaps > 0).any() else float(SAMPLE_SECONDS)
+    idle = util < threshold
+
+    return {
+        "job": f"{job['job_task']}",
+        "owner": job.get("owner"),
+        "project": job.get("project"),
+        "host": str(job["hostname"]).split(".")[0],
+        "start": time.strftime("%Y-%m-%d %H:%M", time.localtime(job["ux_start_time"])),
+        "end": time.strftime("%Y-%m-%d %H:%M", time.localtime(job["ux_end_time"])),
+        "gpus_requested": int(job["n_gpu"]) if pd.notna(job.get("n_gpu")) else None,
+        "gpus_used": int(samples["bus"].nunique()),
+        "samples": len(samples),
+        "util_mean": float(util.mean()) if len(samples) else None,
+        "util_max": float(util.max()) if len(samples) else None,
+        "idle_share": float(idle.mean()) if len(samples) else None,
+        "idle_gpu_hours": float(idle.sum()) * interval / 3600,
+        "gpu_hours": len(samples) * interval / 3600,
+        "peak_vram_mb": float(vram.max()) if vram.notna().any() else None,
+    }
+
+
+def print_job_stats(stats: dict):
+    """Prints the summary of one job"""
+    def value(number, unit=""):
+        return "n/a" if number is None else f"{number:,.1f}{unit}"
+
+    print(f"Job {stats['job']} of {stats['owner']} ({stats['project']}) on {stats['host']}, "
+          f"{stats['start']} to {stats['end']}")
+    print(f"  GPUs:           {stats['gpus_used']} used, {stats['gpus_requested']} requested")
+    print(f"  Samples:        {stats['samples']:,}, {value(stats['gpu_hours'])} GPU hours")
+    print(f"  Utilization:    {value(stats['util_mean'], '%')} average, {value(stats['util_max'], '%')} peak")
+    idle = None if stats["idle_share"] is None else 100 * stats["idle_share"]
+    print(f"  Idle:           {value(idle, '%')} of the samples, {value(stats['idle_gpu_hours'])} GPU hours")
+    print(f"  Peak VRAM:      {value(stats['peak_vram_mb'], ' MB')}")
+
+
+def parse_arguments():
+    """Parse command line arguments for the gpustats time index"""
+    parser = argparse.ArgumentParser(description='Look up the GPU usage of a job through the gpustats time index')
+    parser.add_argument('--index-dir', type=str, default=None,
+                        help=f'Index directory (default: {INDEX_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    job = commands.add_parser('job', help='Print the GPU usage of a job')
+    job.add_argument('job_id', type=str, help='Job number, or <job number>.<task> for a task of an array job')
+    job.add_argument('-y', '--year', type=str, nargs='+', default=None,
+                     help='Years to search (last two digits, default: this year and the previous one)')
+    job.add_argument('--all', action='store_true',
+                     help='Show every job that used a recycled job number, not only the latest')
+
+    build = commands.add_parser('build', help='Index the gpustats files of a month ahead of time')
+    build.add_argument('-y', '--year', type=str, required=True, help='Year (last two digits, e.g. 25)')
+    build.add_argument('-m', '--month', type=str, nargs='+', default=None,
+                       help='Month(s) (two digits, default: all months)')
+
+    commands.add_parser('info', help='Summarize the stored indexes')
+    commands.add_parser('clear', help='Remove every index')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    index_dir = args.index_dir or INDEX_DIR
+
+    if args.command == 'job':
+        start = time.time()
+        job_number, _, task = args.job_id.partition(".")
+        jobs = find_job(int(job_number), task or None, args.year)
+        if jobs.empty:
+            print(f"Job {args.job_id} not found in the GPU-job accounting rows")
+            return
+        for _, job in (jobs if args.all else jobs.head(1)).iterrows():
+            print_job_stats(job_stats(job, job_samples(job, index_dir=index_dir)))
+        print(f"({time.time() - start:.2f}s)")
+
+    elif args.command == 'build':
+        from helpers import list_gpu_files
+
+        for month in args.month or [f"{m:02d}" for m in range(1, 13)]:
+            start = time.time()
+            files = list_gpu_files(args.year, month)
+            for node, filepath in files:
+                load_index(filepath, index_dir)
+            if files:
+                print(f"Indexed {len(files)} files of {args.year}-{month} in {time.time() - start:.1f}s")
+
+    elif args.command == 'info':
+        n_files, n_blocks, n_bytes = 0, 0, 0
+        for root, _, names in os.walk(index_dir):
+            for name in names:
+                index = read_json(os.path.join(root, name), INDEX_VERSION) if name.endswith(".json") else None
+                if index is not None:
+                    n_files += 1
+                    n_blocks += len(index["offsets"])
+                    n_bytes += index["offset"]
+        print(f"{index_dir}: {n_files} files indexed, {n_bytes / 2**20:,.0f} MB in {n_blocks:,} blocks")
+
+    elif args.command == 'clear':
+        shutil.rmtree(index_dir, ignore_errors=True)
+        print(f"Removed {index_dir}")
+
+
+if __name__ == "__main__":
+    main()
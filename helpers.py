@@ -1,8 +1,49 @@
 import subprocess
+import numpy as np
 import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 from io import StringIO
+import calendar
+import json
 import os
+import pickle
+import shutil
+import tempfile
+import threading
+from accounting_store import load_jobs, prepare_gpu_jobs
+from gpustats_cache import cached_parse, incremental_parse
+from profiling import profile_stage
+
+# Data sources
+GPUSTATS_DIR = "/project/scv/dugan/gpustats/data"
+ACCOUNTING_DIR = "/projectnb/rcsmetrics/accounting/data/scc"
+# Bump whenever clean_gpu_data_new output changes, cached frames of older versions are rebuilt
+PARSER_VERSION = 1
+# Ways process_gpu_data and friends can spread node-months over workers
+BACKENDS = ("serial", "thread", "process")
+
+# Column layout returned by clean_gpu_data_new
+GPU_RECORD_COLUMNS = [
+    "time", "bus", "util", "memory_throughput", "user", "project", "job_id",
+    "scenario", "memory_total_mb", "memory_used_mb", "temperature", "power_draw"
+]
+# Placeholder used by the parsers for fields a line does not carry
+MISSING_VALUE = "Missing Values"
+# Dtypes applied by compact_gpu_frame; other string columns become categoricals and
+# other integer columns are downcast to the smallest integer type holding their values
+GPU_COMPACT_SCHEMA = {
+    "time": "int32",
+    "scenario": "int8",
+    "util": "float32",
+    "memory_throughput": "float32",
+    "memory_total_mb": "float32",
+    "memory_used_mb": "float32",
+    "temperature": "float32",
+    "power_draw": "float32",
+}
 
 
 def read_gpu_records(filepath: str) -> pd.DataFrame:
@@ -159,6 +200,94 @@ def clean_gpu_data(filepath: str) -> pd.DataFrame:
     ]
     return pd.DataFrame(data, columns=columns)
 
+
+def _gather_tokens(padded: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Copies the tokens at the given byte offsets into a fixed-width bytes ("S") array.
+
+    `padded` is the file as a uint8 array followed by at least one token length of zeros.
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype="S8")
+    lengths = ends - starts
+    # Whole 8-byte words, so _decode_tokens can view the tokens as uint64
+    width = -(-int(lengths.max()) // 8) * 8
+    windows = np.lib.stride_tricks.as_strided(padded, shape=(len(padded) - width + 1, width), strides=(1, 1))
+    matrix = windows[starts]
+    # Zero the bytes past each token's end; "S" arrays drop trailing NULs
+    matrix *= np.arange(width) < lengths[:, None]
+    return matrix.view(f"S{width}").ravel()
+
+
+def _factorize_tokens(tokens: np.ndarray) -> tuple:
+    """
+    Groups identical tokens from _gather_tokens exactly.
+
+    Returns a code per token and the index of one representative token per code.
+    """
+    # Combine the codes of each 8-byte word of the tokens
+    words = tokens.view(np.uint64).reshape(len(tokens), -1)
+    codes = np.zeros(len(tokens), dtype=np.int64)
+    for j in range(words.shape[1]):
+        word_codes, word_uniques = pd.factorize(words[:, j])
+        codes, _ = pd.factorize(codes * len(word_uniques) + word_codes)
+
+    representative = np.zeros(int(codes.max()) + 1, dtype=np.int64)
+    representative[codes] = np.arange(len(tokens))
+    return codes, representative
+
+
+def _decode_tokens(tokens: np.ndarray, rows: np.ndarray = None, size: int = 0, default: str = None) -> np.ndarray:
+    """
+    Converts a bytes ("S") token array from _gather_tokens into an object array of str.
+
+    Each distinct token is decoded once. If `rows` is given, the tokens belong to those rows of
+    a column of length `size` and every other row is set to `default`.
+    """
+    if len(tokens):
+        codes, representative = _factorize_tokens(tokens)
+        strings = tokens[representative].astype("U").astype(object)
+    else:
+        codes, strings = np.zeros(0, dtype=np.int64), np.empty(0, dtype=object)
+
+    if rows is not None:
+        strings = np.concatenate([np.array([default], dtype=object), strings])
+        column_codes = np.zeros(size, dtype=np.int64)
+        column_codes[rows] = codes + 1
+        codes = column_codes
+    return strings[codes]
+
+
+def _parse_numbers(tokens: np.ndarray, dtype) -> tuple:
+    """
+    Converts a bytes ("S") token array from _gather_tokens with int()/float() semantics.
+
+    Each distinct token is converted once. Returns the values and a mask of the tokens that
+    converted; failed tokens are left as 0.
+    """
+    if len(tokens) == 0:
+        return np.zeros(0, dtype=dtype), np.zeros(0, dtype=bool)
+
+    codes, representative = _factorize_tokens(tokens)
+    distinct = tokens[representative]
+    try:
+        return distinct.astype(dtype)[codes], np.ones(len(tokens), dtype=bool)
+    except (ValueError, OverflowError):
+        pass
+
+    # The file has glitched rows, convert the distinct tokens one at a time
+    convert = int if dtype == np.int64 else float
+    values = np.zeros(len(distinct), dtype=dtype)
+    ok = np.zeros(len(distinct), dtype=bool)
+    for i, token in enumerate(distinct):
+        try:
+            values[i] = convert(token)
+            ok[i] = True
+        except (ValueError, OverflowError):
+            pass
+    return values[codes], ok[codes]
+
+
 def clean_gpu_data_new(filepath: str) -> pd.DataFrame:
     """
     Reads and processes GPU usage data while handling missing values, misaligned JobID,
@@ -170,6 +299,147 @@ def clean_gpu_data_new(filepath: str) -> pd.DataFrame:
     - Scenario 2: Job ID exists, but user and project are marked as "-", indicating idle GPU.
     - Scenario 3: Job ID appears in the user column due to misalignment.
 
+    Supports both:
+    - Legacy format: time, bus, util, mem_throughput, [user, project, job_id]
+    - New format (mid-March 2025+): time, bus, util, mem_throughput, [user, project, job_id],
+      memory_total, memory_used, temperature, power_draw
+
+    The file is read in one pass and tokenized as a byte array; the 5/7/9/11-field layouts and
+    the scenario codes are resolved with array operations. The output is identical to
+    clean_gpu_data_new_loop, including the ValueError raised for lines with fewer than five
+    fields (or exactly six) and the rows dropped when time/util/memory throughput do not parse.
+
+    Parameters:
+        filepath (str): Path to the GPU usage data file.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing cleaned GPU usage records.
+    """
+    with open(filepath, "rb") as file:
+        data = file.read()
+    return parse_gpu_bytes(data, filepath)
+
+
+def parse_gpu_bytes(data: bytes, filepath: str) -> pd.DataFrame:
+    """
+    Parses raw gpustats bytes exactly like clean_gpu_data_new parses a whole file.
+
+    Parameters:
+        data (bytes): Contents of (part of) a gpustats file, starting at a line boundary.
+        filepath (str): File the bytes came from, used in messages.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing cleaned GPU usage records.
+    """
+    # Text mode would translate \r\n and \r into \n
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+    codes = np.frombuffer(data, dtype=np.uint8)
+
+    # Only plain ASCII is tokenized here; files with other bytes (NULs, unusual control
+    # characters, non-ASCII text) take the line-by-line path so str.split() semantics hold
+    control = (codes < 9) | ((codes > 13) & (codes < 28))
+    if control.any() or (codes > 127).any():
+        return clean_gpu_data_new_loop(filepath, StringIO(data.decode("utf-8")))
+
+    # Token boundaries: bytes above space are token characters
+    in_token = codes > 32
+    boundary = np.diff(in_token.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(boundary == 1)
+    ends = np.flatnonzero(boundary == -1)
+
+    # Tokens per line from the number of tokens before each line break
+    newlines = np.flatnonzero(codes == ord("\n"))
+    line_ends = np.searchsorted(starts, newlines)
+    if len(data) and data[-1:] != b"\n":
+        line_ends = np.append(line_ends, len(starts))
+    n_fields = np.diff(line_ends, prepend=0)
+    first_token = line_ends - n_fields
+    n_lines = len(n_fields)
+
+    if n_lines == 0:
+        return pd.DataFrame([], columns=GPU_RECORD_COLUMNS)
+
+    malformed = (n_fields < 5) | (n_fields == 6)
+    if malformed.any():
+        line_number = int(np.argmax(malformed)) + 1
+        raise ValueError(
+            f"Malformed line {line_number} in {filepath}: {int(n_fields[line_number - 1])} fields"
+        )
+
+    padding = -(-int((ends - starts).max()) // 8) * 8
+    padded = np.concatenate([codes, np.zeros(padding, dtype=np.uint8)])
+
+    def field(position, rows=None) -> np.ndarray:
+        """Bytes tokens of the field at `position` for every line, or for the selected lines."""
+        token = (first_token if rows is None else first_token[rows]) + position
+        return _gather_tokens(padded, starts[token], ends[token])
+
+    time, time_ok = _parse_numbers(field(0), np.int64)
+    util, util_ok = _parse_numbers(field(2), np.float64)
+    mem_throughput, mem_ok = _parse_numbers(field(3), np.float64)
+
+    # Rows that fail to parse are likely a glitch with the gpu util file!
+    # for example:
+    # ...Unable to determine the device handle for GPU1...
+    # ...NVIDIA-SMI has failed because it couldn't communicate with the NVIDIA driver...
+    valid = time_ok & util_ok & mem_ok
+    error_row_count = int((~valid).sum())
+    if error_row_count:
+        print(f"There are some issues with file {filepath}! Total rows with issues: {error_row_count}")
+        if not valid.any():
+            return pd.DataFrame([], columns=GPU_RECORD_COLUMNS)
+        time, util, mem_throughput = time[valid], util[valid], mem_throughput[valid]
+        n_fields, first_token = n_fields[valid], first_token[valid]
+    n_rows = len(n_fields)
+
+    # Scenario 3: Job ID misaligned to user column (5 or 9 fields)
+    misaligned = (n_fields == 5) | (n_fields == 9)
+    aligned = np.flatnonzero(~misaligned)
+    user = _decode_tokens(field(4, aligned), aligned, n_rows, MISSING_VALUE)
+    proj = _decode_tokens(field(5, aligned), aligned, n_rows, MISSING_VALUE)
+    job_id = _decode_tokens(field(np.where(misaligned, 4, 6)))
+
+    # Scenario 2: Job ID exists but user/project missing (idle GPU)
+    # Scenario 1: Job ID exists, GPU is actively in use
+    has_job = job_id != "-"
+    idle = ~misaligned & (user == "-") & (proj == "-") & has_job
+    user[idle] = MISSING_VALUE
+    proj[idle] = MISSING_VALUE
+    scenario = np.select([misaligned, idle, has_job], [3, 2, 1], default=0).astype(np.int64)
+
+    # Memory/temperature/power only exist in the 9 and 11 field layouts
+    new_format = np.flatnonzero((n_fields == 9) | (n_fields == 11))
+    memory_position = np.where(n_fields[new_format] == 9, 5, 7)
+    memory_values = [
+        _decode_tokens(field(memory_position + offset, new_format), new_format, n_rows, MISSING_VALUE)
+        for offset in range(4)
+    ]
+
+    bus = _decode_tokens(field(1))
+    columns = [time, bus, util, mem_throughput, user, proj, job_id, scenario, *memory_values]
+    # Explicit dtypes keep pandas from re-inferring every object column
+    return pd.DataFrame(
+        {name: pd.Series(values, dtype=values.dtype) for name, values in zip(GPU_RECORD_COLUMNS, columns)},
+        copy=False,
+    )
+
+
+def clean_gpu_data_new_loop(filepath: str, lines=None) -> pd.DataFrame:
+    """
+    Line-by-line reference implementation of clean_gpu_data_new.
+
+    Kept so the vectorized parser can be checked and benchmarked against it (see speedtest.py).
+    Reads and processes GPU usage data while handling missing values, misaligned JobID,
+    and supporting both old and new file formats.
+
+    The function categorizes GPU usage scenarios based on job assignment:
+    - Scenario 0: GPU unassigned and unused. NOTE: MAY BE MINOR USAGE - IDLE DRAW?
+    - Scenario 1: Job ID exists, but user and project are missing (GPU in use).
+    - Scenario 2: Job ID exists, but user and project are marked as "-", indicating idle GPU.
+    - Scenario 3: Job ID appears in the user column due to misalignment.
+
     Supports both:
     - Legacy format: time, bus, util, mem_throughput, [user, project, job_id]
     - New format (mid-March 2025+): time, bus, util, mem_throughput, memory_total, memory_used,
@@ -177,6 +447,7 @@ def clean_gpu_data_new(filepath: str) -> pd.DataFrame:
 
     Parameters:
         filepath (str): Path to the GPU usage data file.
+        lines (iterable, optional): Lines to parse instead of reading `filepath`.
 
     Returns:
         pd.DataFrame: A DataFrame containing cleaned GPU usage records.
@@ -189,7 +460,7 @@ def clean_gpu_data_new(filepath: str) -> pd.DataFrame:
 
     error_row_count = 0
 
-    with open(filepath, "r", encoding="utf-8") as file:
+    with open(filepath, "r", encoding="utf-8") if lines is None else nullcontext(lines) as file:
         for line in file:
             parts = line.split()
             scenario = 0  # Default scenario: GPU unassigned, unused
@@ -256,17 +527,542 @@ def clean_gpu_data_new(filepath: str) -> pd.DataFrame:
     return pd.DataFrame(data, columns=columns)
 
 
-def process_gpu_data(year: str, month: str) -> pd.DataFrame:
+def compact_gpu_frame(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Processes GPU usage data for a given year and month by merging job records with node statistics.
+    Converts a gpustats or merged GPU frame to the compact schema.
+
+    Metrics use the float32/int dtypes of GPU_COMPACT_SCHEMA, with NaN where the parser
+    wrote MISSING_VALUE; integer columns with missing values use the nullable Int32/Int8
+    dtypes with pd.NA instead. String columns (user, project, job_id, bus, node and the
+    accounting strings, which repeat on every sample of a job) become categoricals.
+    Other integer columns are downcast to nullable integers (pd.NA after a left join)
+    and other float columns become float32 only when no value changes.
+
+    Note that grouping on categorical columns needs observed=True to leave out unused
+    category combinations.
+
+    Parameters:
+        df (pd.DataFrame): Frame from clean_gpu_data_new or process_gpu_data.
+
+    Returns:
+        pd.DataFrame: A new frame with the same rows and columns in compact dtypes.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        dtype = GPU_COMPACT_SCHEMA.get(column)
+        if dtype is not None:
+            if values.dtype == object:
+                values = pd.to_numeric(values.mask(values == MISSING_VALUE), errors="coerce")
+            if dtype.startswith("int") and values.isna().any():
+                # Nullable rather than float32, which rounds epoch seconds to about 2 minutes
+                dtype = dtype.capitalize()
+            columns[column] = values.astype(dtype)
+        elif values.dtype == object:
+            columns[column] = values.astype("category")
+        elif pd.api.types.is_integer_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            # Nullable so that a left join can introduce NA without turning the column into float64
+            downcast = pd.to_numeric(values, downcast="integer")
+            columns[column] = downcast.astype(downcast.dtype.name.capitalize())
+        elif values.dtype == np.float64:
+            # float32 only where the conversion is exact
+            single = values.astype(np.float32)
+            exact = (single.astype(np.float64) == values) | values.isna()
+            columns[column] = single if exact.all() else values
+        else:
+            columns[column] = values
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def concat_gpu_frames(frames: list) -> pd.DataFrame:
+    """
+    Concatenates compact frames, keeping categorical columns categorical.
+
+    pd.concat falls back to object dtype when the categories of two frames differ, so
+    categorical columns are concatenated here as codes over the union of the categories.
+    Columns are built one at a time to avoid intermediate copies of whole frames.
+
+    Parameters:
+        frames (list): DataFrames with the same columns, e.g. from compact_gpu_frame.
+
+    Returns:
+        pd.DataFrame: The concatenated frame with a fresh RangeIndex.
+    """
+    if not frames:
+        return pd.DataFrame()
+
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            categories = parts[0].cat.categories
+            for part in parts[1:]:
+                categories = categories.union(part.cat.categories)
+            dtype = pd.CategoricalDtype(categories)
+
+            # Map each frame's codes onto the union, writing straight into the result;
+            # the extra -1 at the end of the lookup keeps missing values (code -1) missing
+            codes = np.empty(
+                sum(len(part) for part in parts),
+                dtype=np.result_type(np.int8, np.min_scalar_type(len(categories)))
+            )
+            position = 0
+            for part in parts:
+                lookup = np.append(categories.get_indexer(part.cat.categories), -1).astype(codes.dtype)
+                np.take(lookup, part.cat.codes.to_numpy(), out=codes[position:position + len(part)])
+                position += len(part)
+            columns[column] = pd.Categorical.from_codes(codes, dtype=dtype)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns, copy=False)
+
+
+class JobIntervalIndex:
+    """
+    Sorted per-job_task index of accounting time windows, used to join GPU samples to jobs.
+
+    Job numbers are recycled, so joining samples to accounting rows on job_task alone
+    multiplies the rows. The index keeps, for each job_task, its accounting rows sorted by
+    ux_submission_time, and join() finds the row whose window contains each sample with
+    a binary search, without building the merged frame first. Key groups whose windows
+    overlap (e.g. duplicated accounting rows) fall back to checking every candidate.
+
+    join() returns exactly what process_gpu_data used to build with a left merge on
+    job_id == job_task filtered to samples inside the job's window or with scenario 0.
+    """
+
+    def __init__(self, gpu_jobs: pd.DataFrame):
+        # Accounting columns as the arrays join() takes rows from
+        self.columns = list(gpu_jobs.columns)
+        self.sources = {}
+        for column in self.columns:
+            source = gpu_jobs[column]
+            self.sources[column] = source.to_numpy() if isinstance(source.dtype, np.dtype) else source.array
+        self.decoded = set()
+
+        # Keys are sorted so samples can be matched to them with a binary search
+        codes, keys = pd.factorize(gpu_jobs["job_task"].to_numpy(dtype=object), sort=True)
+        self.keys = np.asarray(keys, dtype=str)
+        submission = gpu_jobs["ux_submission_time"].to_numpy(dtype="float64", na_value=np.nan)
+        end = gpu_jobs["ux_end_time"].to_numpy(dtype="float64", na_value=np.nan)
+
+        # Every row per key, in accounting order (for scenario 0 samples, matched on key only)
+        self.key_rows = np.argsort(codes, kind="stable")
+        self.key_bounds = np.searchsorted(codes[self.key_rows], np.arange(len(keys) + 1))
+
+        # Rows with a complete window per key, sorted by submission time
+        valid = np.flatnonzero(~(np.isnan(submission) | np.isnan(end)))
+        order = valid[np.lexsort((valid, submission[valid], codes[valid]))]
+        self.rows = order
+        self.submission = submission[order]
+        self.end = end[order]
+        self.bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+
+        # A key whose windows overlap can contain a sample more than once
+        same_key = codes[order][1:] == codes[order][:-1]
+        overlapping = same_key & (self.end[:-1] >= self.submission[1:])
+        self.overlaps = np.zeros(len(keys), dtype=bool)
+        self.overlaps[codes[order][1:][overlapping]] = True
+
+    def _lookup(self, job_ids: pd.Series, times: np.ndarray, idle: np.ndarray) -> tuple:
+        """Returns the (sample, accounting row) pairs of the join, -1 for no accounting row"""
+        sample_codes, sample_keys = pd.factorize(job_ids)
+        sample_keys = pd.Index(sample_keys, dtype=object)
+        strings = np.flatnonzero([isinstance(key, str) for key in sample_keys])
+        wanted = np.asarray(sample_keys[strings], dtype=str)
+        position = np.minimum(np.searchsorted(self.keys, wanted), max(len(self.keys) - 1, 0))
+        codes = np.full(len(sample_keys) + 1, -1)
+        if len(self.keys):
+            codes[strings] = np.where(self.keys[position] == wanted, position, -1)
+        codes = codes[sample_codes]
+        matched = codes >= 0
+        samples = np.arange(len(codes))
+
+        # Samples of keys with disjoint windows: bisect to the last window starting at or before
+        # the sample time, which is the only one that can contain it
+        bisect = np.flatnonzero(matched & ~idle & ~np.append(self.overlaps, False)[codes])
+        low = self.bounds[codes[bisect]]
+        high = self.bounds[codes[bisect] + 1]
+        first = low.copy()
+        t = times[bisect]
+        while True:
+            searching = low < high
+            if not searching.any():
+                break
+            middle = (low + high) // 2
+            before = np.zeros(len(t), dtype=bool)
+            before[searching] = self.submission[middle[searching]] <= t[searching]
+            low = np.where(searching & before, middle + 1, low)
+            high = np.where(searching & ~before, middle, high)
+        candidate = low - 1
+        inside = candidate >= first
+        inside[inside] = self.end[candidate[inside]] >= t[inside]
+        pairs = [(bisect[inside], self.rows[candidate[inside]])]
+
+        # Samples of keys with overlapping windows: test every window of the key
+        expand = np.flatnonzero(matched & ~idle & np.append(self.overlaps, False)[codes])
+        if len(expand):
+            sample, position = self._expand(expand, codes[expand], self.bounds)
+            inside = (self.submission[position] <= times[sample]) & (times[sample] <= self.end[position])
+            pairs.append((sample[inside], self.rows[position[inside]]))
+
+        # Scenario 0 samples keep every accounting row of their key, or one row without a job
+        expand = np.flatnonzero(matched & idle)
+        if len(expand):
+            sample, position = self._expand(expand, codes[expand], self.key_bounds)
+            pairs.append((sample, self.key_rows[position]))
+        unmatched = samples[~matched & idle]
+        pairs.append((unmatched, np.full(len(unmatched), -1)))
+
+        sample = np.concatenate([pair[0] for pair in pairs])
+        row = np.concatenate([pair[1] for pair in pairs])
+        order = np.lexsort((row, sample))
+        return sample[order], row[order], not matched.all()
+
+    @staticmethod
+    def _expand(samples: np.ndarray, codes: np.ndarray, bounds: np.ndarray) -> tuple:
+        """Pairs each sample with every position of its key group"""
+        counts = bounds[codes + 1] - bounds[codes]
+        sample = np.repeat(samples, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return sample, np.repeat(bounds[codes], counts) + offsets
+
+    def join(self, gpu_records: pd.DataFrame) -> pd.DataFrame:
+        """
+        Joins GPU samples to the accounting row whose time window contains them.
+
+        Parameters:
+            gpu_records (pd.DataFrame): Parsed gpustats records with job_id, time and scenario.
+
+        Returns:
+            pd.DataFrame: Sample columns followed by accounting columns (shared names get
+                _x/_y suffixes like pd.merge), one row per sample and matching window;
+                scenario 0 samples are kept with empty accounting columns when no job matches.
+        """
+        times = gpu_records["time"].to_numpy(dtype="float64", na_value=np.nan)
+        idle = (gpu_records["scenario"] == 0).to_numpy()
+        sample, row, missing = self._lookup(gpu_records["job_id"], times, idle)
+
+        shared = set(gpu_records.columns) & set(self.columns)
+        columns = {}
+        for column in gpu_records.columns:
+            name = f"{column}_x" if column in shared else column
+            columns[name] = gpu_records[column].take(sample).reset_index(drop=True)
+        # pd.merge gives the accounting columns missing-value dtypes as soon as one sample of
+        # the frame has no job, even if that sample is filtered out afterwards
+        fill_row = np.append(row, -1) if missing else row
+        for column in self.columns:
+            name = f"{column}_y" if column in shared else column
+            values = pd.api.extensions.take(self.sources[column], fill_row, allow_fill=True)
+            if column in self.decoded:
+                values = np.asarray(values, dtype=object)
+            columns[name] = pd.Series(values[:len(row)] if missing else values, copy=False)
+        return pd.DataFrame(columns, copy=False)
+
+    INDEX_ARRAYS = ("keys", "key_rows", "key_bounds", "rows", "submission", "end", "bounds", "overlaps")
+
+    def share(self, directory: str):
+        """
+        Writes the index to .npy files that worker processes memory-map with attach().
+
+        Numeric columns are written as they are, text columns as integer codes plus their
+        distinct values, so attaching maps the bulk of the table instead of reading it.
+        Columns of other extension types are pickled and read in full.
+
+        Parameters:
+            directory (str): Existing directory, ideally on a RAM-backed file system (/dev/shm).
+        """
+        def save(name: str, array):
+            array = np.asarray(array)
+            if array.dtype == object and all(isinstance(value, str) for value in array):
+                array = array.astype(str)
+            np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=True)
+
+        for name in self.INDEX_ARRAYS:
+            save(name, getattr(self, name))
+
+        layout = []
+        for position, column in enumerate(self.columns):
+            source = self.sources[column]
+            if isinstance(source, np.ndarray) and source.dtype != object:
+                layout.append({"name": column, "kind": "numpy"})
+                save(f"{position}.values", source)
+            elif isinstance(source, np.ndarray):
+                codes, categories = pd.factorize(source)
+                layout.append({"name": column, "kind": "object"})
+                save(f"{position}.codes", codes.astype(np.min_scalar_type(-len(categories) - 1)))
+                save(f"{position}.categories", np.asarray(categories, dtype=object))
+            elif isinstance(source, pd.Categorical):
+                layout.append({"name": column, "kind": "category", "ordered": bool(source.ordered)})
+                save(f"{position}.codes", source.codes)
+                save(f"{position}.categories", source.categories.to_numpy())
+            elif isinstance(source, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+                layout.append({"name": column, "kind": "masked", "type": type(source).__name__})
+                save(f"{position}.values", source.to_numpy(dtype=source.dtype.numpy_dtype, na_value=0))
+                save(f"{position}.mask", source.isna())
+            else:
+                layout.append({"name": column, "kind": "pickle"})
+                with open(os.path.join(directory, f"{position}.pickle"), "wb") as file:
+                    pickle.dump(source, file)
+
+        with open(os.path.join(directory, "layout.json"), "w") as file:
+            json.dump(layout, file)
+
+    @classmethod
+    def attach(cls, directory: str) -> "JobIntervalIndex":
+        """
+        Maps an index written by share() read-only, without copying its arrays.
+
+        Parameters:
+            directory (str): Directory passed to share().
+
+        Returns:
+            JobIntervalIndex: An index whose join() returns what the shared one returns.
+        """
+        def load(name: str) -> np.ndarray:
+            path = os.path.join(directory, f"{name}.npy")
+            try:
+                return np.asarray(np.load(path, mmap_mode="r"))
+            except ValueError:
+                # Arrays of Python objects cannot be mapped
+                return np.load(path, allow_pickle=True)
+
+        index = cls.__new__(cls)
+        for name in cls.INDEX_ARRAYS:
+            setattr(index, name, load(name))
+        with open(os.path.join(directory, "layout.json")) as file:
+            layout = json.load(file)
+
+        index.columns = [column["name"] for column in layout]
+        index.sources = {}
+        index.decoded = set()
+        for position, column in enumerate(layout):
+            name, kind = column["name"], column["kind"]
+            if kind == "numpy":
+                index.sources[name] = load(f"{position}.values")
+            elif kind in ("object", "category"):
+                categories = load(f"{position}.categories")
+                if categories.dtype.kind == "U":
+                    categories = categories.astype(object)
+                dtype = pd.CategoricalDtype(pd.Index(categories), ordered=column.get("ordered", False))
+                index.sources[name] = pd.Categorical.from_codes(load(f"{position}.codes"), dtype=dtype)
+                if kind == "object":
+                    index.decoded.add(name)
+            elif kind == "masked":
+                array_type = getattr(pd.arrays, column["type"])
+                index.sources[name] = array_type(load(f"{position}.values"), load(f"{position}.mask"))
+            else:
+                with open(os.path.join(directory, f"{position}.pickle"), "rb") as file:
+                    index.sources[name] = pickle.load(file)
+        return index
+
+
+def list_gpu_files(year: str, month: str, data_dir: str = None) -> list:
+    """
+    Lists the gpustats files recorded for a given year and month.
 
     Parameters:
         year (str): Two-digit year string (e.g., "25" for 2025).
         month (str): Two-digit month string (e.g., "01" for January).
+        data_dir (str): Directory holding one sub-directory per node, defaults to GPUSTATS_DIR.
 
     Returns:
-        pd.DataFrame: A merged DataFrame containing job and GPU usage records.
+        list: (node, file path) tuples for every node with a file for that month.
+    """
+    data_dir = data_dir or GPUSTATS_DIR
+    with profile_stage("discover", month=f"{year}{month}") as stage:
+        files = [
+            (node, f"{data_dir}/{node}/{year}{month}")
+            for node in os.listdir(data_dir)
+            if os.path.exists(f"{data_dir}/{node}/{year}{month}")
+        ]
+        stage["rows"] = len(files)
+    return files
+
+
+def load_gpu_file(filepath: str, use_cache: bool = True, cache_dir: str = None,
+                  incremental: bool = False) -> pd.DataFrame:
+    """
+    Parses a gpustats file with clean_gpu_data_new, going through the on-disk cache.
+
+    Closed months never change, so after the first run their frames are read back from
+    the cache instead of being re-parsed. See gpustats_cache.py for the cache layout.
+
+    Parameters:
+        filepath (str): Path to the gpustats file.
+        use_cache (bool): Set to False to always parse the text file.
+        cache_dir (str): Cache root, defaults to gpustats_cache.CACHE_DIR.
+        incremental (bool): Treat the file as append-only and only parse the bytes added
+            since the previous run, for months that are still being recorded.
+
+    Returns:
+        pd.DataFrame: Same frame as clean_gpu_data_new(filepath).
+    """
+    if not use_cache:
+        return clean_gpu_data_new(filepath)
+    if incremental:
+        return incremental_parse(filepath, parse_gpu_bytes, PARSER_VERSION, cache_dir)
+    return cached_parse(filepath, clean_gpu_data_new, PARSER_VERSION, cache_dir)
+
+
+def accounting_sources(year: str) -> list:
+    """Accounting files that may hold jobs which ran during a year"""
+    return [f"{ACCOUNTING_DIR}/20{int(year) + offset:02d}.csv" for offset in (-1, 0, 1)]
+
+
+def load_gpu_jobs(year: str, month: str, use_store: bool = True) -> pd.DataFrame:
+    """
+    Loads the GPU-job accounting rows needed to process a given year and month.
+
+    By default the rows come from the partitioned accounting store (accounting_store.py),
+    which only reads the partitions of jobs that may have run during the month, give or
+    take two days for time zones. Jobs that ran in the month but ended the next year,
+    which are in the next year's accounting file, are included as well.
+    Without the store, or without pyarrow, the year's accounting file is grepped.
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        month (str): Two-digit month string (e.g., "01" for January).
+        use_store (bool): Read the rows from the accounting store (default True).
+
+    Returns:
+        pd.DataFrame: Accounting rows with the job_task, task_string and numeric time columns.
+    """
+    if use_store:
+        first_day = (2000 + int(year), int(month), 1)
+        last_day = (first_day[0] + first_day[1] // 12, first_day[1] % 12 + 1, 1)
+        margin = 2 * 86400
+        try:
+            with profile_stage("accounting_store", month=f"{year}{month}") as stage:
+                gpu_jobs = load_jobs(
+                    calendar.timegm(first_day + (0, 0, 0)) - margin,
+                    calendar.timegm(last_day + (0, 0, 0)) + margin,
+                    accounting_sources(year),
+                )
+                stage["rows"] = len(gpu_jobs)
+            return gpu_jobs
+        except ImportError as e:
+            print(f"Accounting store disabled: {e}")
+
+    with profile_stage("read_gpu_records", month=f"{year}{month}") as stage:
+        gpu_jobs = prepare_gpu_jobs(read_gpu_records(f"{ACCOUNTING_DIR}/20{year}.csv"))
+        stage["rows"] = len(gpu_jobs)
+    return gpu_jobs
+
+
+# Job indexes of the last months used in this process, see _month_job_index
+_job_indexes = {}
+_job_indexes_lock = threading.Lock()
+# Where the process backend shares job indexes with its workers, RAM-backed when available
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# Parallel environments (granted_pe) that keep a job on a single host; jobs of the others
+# (mpi_*) may span hosts, and their accounting hostname only names the master host
+SINGLE_HOST_PES = ("NONE", "omp")
+
+
+def _month_job_index(year: str, month: str, use_cache: bool, compact: bool,
+                     shared_dir: str = None, job_filter: dict = None) -> JobIntervalIndex:
+    """
+    Returns the JobIntervalIndex of a month, built once per process and month.
+
+    Worker processes get the directory the parent shared the month's index to
+    (JobIntervalIndex.share) and map it read-only, so the job table is neither pickled
+    with every node nor loaded again by every worker. Thread workers share the index
+    built by whichever thread asked first. Only the two most recent months are kept.
+    With a job_filter, the index only holds the accounting rows matching it.
     """
+    filter_key = tuple(sorted(
+        (column, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+        for column, value in job_filter.items()
+    )) if job_filter else None
+    key = shared_dir or (year, month, use_cache, compact, ACCOUNTING_DIR, filter_key)
+    with _job_indexes_lock:
+        if key not in _job_indexes:
+            if shared_dir:
+                job_index = JobIntervalIndex.attach(shared_dir)
+            else:
+                gpu_jobs = load_gpu_jobs(year, month, use_store=use_cache)
+                if job_filter:
+                    selected = np.ones(len(gpu_jobs), dtype=bool)
+                    for column, value in job_filter.items():
+                        if isinstance(value, (list, tuple, set)):
+                            selected &= gpu_jobs[column].isin(value).to_numpy(dtype=bool)
+                        else:
+                            selected &= (gpu_jobs[column] == value).to_numpy(dtype=bool, na_value=False)
+                    gpu_jobs = gpu_jobs[selected].reset_index(drop=True)
+                if compact:
+                    # Joined rows then take the compact accounting columns straight from the join
+                    gpu_jobs = compact_gpu_frame(gpu_jobs)
+                job_index = JobIntervalIndex(gpu_jobs)
+            while len(_job_indexes) >= 2:
+                del _job_indexes[next(iter(_job_indexes))]
+            _job_indexes[key] = job_index
+        return _job_indexes[key]
+
+
+def _single_host(granted_pe) -> np.ndarray:
+    """True for jobs of a parallel environment that keeps them on one host (see SINGLE_HOST_PES)"""
+    pes = pd.Series(np.asarray(granted_pe, dtype=object)).fillna("NONE").astype(str)
+    return pes.str.startswith(SINGLE_HOST_PES).to_numpy(dtype=bool)
+
+
+def _job_nodes(job_index: JobIntervalIndex) -> set:
+    """
+    Names of the nodes the jobs of an index ran on, from the accounting hostname.
+
+    The hostname is only the master host of a job, so None is returned (every node may
+    hold samples of the jobs) as soon as one of them may span several hosts.
+    """
+    if not _single_host(job_index.sources["granted_pe"]).all():
+        return None
+    hosts = pd.unique(np.asarray(job_index.sources["hostname"], dtype=object))
+    return {host.split(".")[0] for host in hosts if isinstance(host, str)}
+
+
+def _process_node_month(task: tuple) -> pd.DataFrame:
+    """
+    Joins one node-month gpustats file to the month's job records.
+
+    Parameters:
+        task (tuple): (year, month, node, file path, use_cache, incremental, compact,
+            directory of the shared job index or None, job filter or None).
+
+    Returns:
+        pd.DataFrame: The joined records, or None if the file is missing or corrupted.
+    """
+    year, month, node, file_name, use_cache, incremental, compact, shared_dir, job_filter = task
+    try:
+        # gpu_records = pd.DataFrame(clean_gpu_data(file_name))
+        with profile_stage("parse", node=node, month=f"{year}{month}", cached=use_cache) as stage:
+            gpu_records = pd.DataFrame(load_gpu_file(file_name, use_cache=use_cache, incremental=incremental))
+            stage["rows"] = len(gpu_records)
+    except Exception as e:
+        print(f"Skipping missing or corrupted file: {file_name}")
+        return None
+
+    with profile_stage("job_index", node=node, month=f"{year}{month}"):
+        job_index = _month_job_index(year, month, use_cache, compact, shared_dir, job_filter)
+    if job_filter:
+        # Only samples of the selected jobs can be kept, the others are dropped before the join
+        gpu_records = gpu_records[gpu_records["job_id"].isin(job_index.keys)].reset_index(drop=True)
+
+    gpu_records["node"] = node
+    gpu_records["time"] = pd.to_numeric(gpu_records["time"], errors="coerce")
+    if compact:
+        gpu_records = compact_gpu_frame(gpu_records)
+
+    # Match each sample to the accounting row whose time window contains it,
+    # samples with scenario == 0 are kept whether or not they match a job
+    with profile_stage("join", node=node, month=f"{year}{month}") as stage:
+        matched = job_index.join(gpu_records)
+        if compact:
+            matched = compact_gpu_frame(matched)
+        stage["rows"] = len(matched)
+    return matched
+
+
+def _validate_month(year: str, month: str):
+    """Raises ValueError unless year and month are two-digit strings"""
     # Validate year format
     if not isinstance(year, str) or not year.isdigit() or len(year) != 2:
         raise ValueError(
@@ -279,64 +1075,161 @@ def process_gpu_data(year: str, month: str) -> pd.DataFrame:
             f"Invalid month format: {month}. Expected a two-digit string (e.g., '01' for January)."
         )
 
-    # Load job records
-    gpu_jobs = read_gpu_records(
-        f"/projectnb/rcsmetrics/accounting/data/scc/20{year}.csv"
-    )
-    gpu_jobs["task_string"] = gpu_jobs["task_number"].astype(str)
-    gpu_jobs.loc[~(gpu_jobs["options"].str.contains("-t") | gpu_jobs['task_number'] != 0), "task_string"] = "undefined"
-    gpu_jobs["job_task"] = (
-        gpu_jobs["job_number"].astype(str) + "." + gpu_jobs["task_string"].astype(str)
-    )
-    gpu_jobs["ux_submission_time"] = pd.to_numeric(gpu_jobs["ux_submission_time"], errors="coerce")
-    gpu_jobs["ux_end_time"] = pd.to_numeric(gpu_jobs["ux_end_time"], errors="coerce")
-
-    # Get file paths for the specified month
-    nodes = os.listdir("/project/scv/dugan/gpustats/data/")
-    files = [
-        (node, f"/project/scv/dugan/gpustats/data/{node}/{year}{month}")
-        for node in nodes
-        if os.path.exists(f"/project/scv/dugan/gpustats/data/{node}/{year}{month}")
-    ]
 
-    # Process and merge data
-    all_merged_dfs = []
-    for node, file_name in files:
-        try:
-            # gpu_records = pd.DataFrame(clean_gpu_data(file_name))
-            gpu_records = pd.DataFrame(clean_gpu_data_new(file_name))
-        except Exception as e:
-            print(f"Skipping missing or corrupted file: {file_name}")
-            continue
-
-        gpu_records["node"] = node
-        gpu_records["time"] = pd.to_numeric(gpu_records["time"], errors="coerce")
-
-        # gpu_records_scenario = gpu_records[gpu_records['scenario'] != 0]
-        # merged_df = pd.merge(gpu_records_scenario, gpu_jobs, left_on='job_id', right_on='job_task', how='left')
-        merged_df = pd.merge(
-            gpu_records, gpu_jobs,
-            left_on="job_id", right_on="job_task",
-            how="left"
-        )
+def default_n_jobs() -> int:
+    """Number of workers to use: $NSLOTS inside a batch job, the number of CPUs otherwise"""
+    return int(os.environ.get("NSLOTS", 0)) or os.cpu_count() or 1
 
-        # Filter rows where GPU timestamp falls within the job's actual time window
-        # Create a mask for matching time within job range
-        in_time_range = (
-            (merged_df["time"] >= merged_df["ux_submission_time"]) &
-            (merged_df["time"] <= merged_df["ux_end_time"])
-        )
 
-        # Fill NaNs with False for the mask
-        in_time_range = in_time_range.fillna(False)
+def map_tasks(function, tasks: list, backend: str = "serial", n_jobs: int = None):
+    """
+    Yields function(task) for every task, in the order of the tasks, using a backend.
+
+    At most 2 * n_jobs tasks are in flight, so results are produced no faster than they
+    are consumed and memory stays bounded when the caller streams them.
 
-        # Combine with scenario == 0
-        matched = merged_df[in_time_range | (merged_df["scenario"] == 0)]
+    Parameters:
+        function (callable): Module-level function (it must pickle for the process backend).
+        tasks (iterable): Arguments of each call, consumed as workers become free.
+        backend (str): "serial", "thread" (a thread pool) or "process" (a process pool).
+        n_jobs (int): Number of workers, defaults to default_n_jobs().
 
-        all_merged_dfs.append(matched)
-        # all_merged_dfs.append(merged_df)
+    Yields:
+        The results, in task order.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid backend: {backend}. Expected one of {', '.join(BACKENDS)}.")
+    n_jobs = n_jobs or default_n_jobs()
+    if backend == "serial" or n_jobs == 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    executor_class = ThreadPoolExecutor if backend == "thread" else ProcessPoolExecutor
+    with executor_class(max_workers=n_jobs) as executor:
+        pending = deque()
+        tasks = iter(tasks)
+        for task in tasks:
+            pending.append(executor.submit(function, task))
+            if len(pending) >= 2 * n_jobs:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for task in tasks:
+                pending.append(executor.submit(function, task))
+                break
+            yield result
+
+
+def _iter_months(months: list, use_cache: bool, incremental: bool, compact: bool,
+                 backend: str, n_jobs: int, job_filter: dict = None):
+    """
+    Runs the node-months of several months through map_tasks and groups the results by month.
+
+    Yields (year, month, frames) for every month, where frames yields the month's merged
+    node frames in order and must be consumed before the next month is asked for.
+    With the process backend, the parent builds each month's job index once and shares
+    it with the workers through memory-mapped files, removed once the month is done.
+    With a job_filter, nodes none of the selected jobs ran on are not read at all, unless
+    some of them may span several hosts (see _job_nodes).
+    """
+    for year, month in months:
+        _validate_month(year, month)
+    files = [list_gpu_files(year, month) for year, month in months]
+    if job_filter:
+        for position, (year, month) in enumerate(months):
+            nodes = _job_nodes(_month_job_index(year, month, use_cache, compact, job_filter=job_filter))
+            if nodes is not None:
+                files[position] = [(node, file_name) for node, file_name in files[position] if node in nodes]
+    share = backend == "process" and (n_jobs or default_n_jobs()) > 1
+    shared_dirs = {}
+
+    def tasks():
+        for (year, month), month_files in zip(months, files):
+            shared_dir = None
+            if share and month_files:
+                shared_dir = tempfile.mkdtemp(prefix="gpu_util_jobs_", dir=SHARED_DIR)
+                shared_dirs[year, month] = shared_dir
+                _month_job_index(year, month, use_cache, compact, job_filter=job_filter).share(shared_dir)
+            for node, file_name in month_files:
+                yield (year, month, node, file_name, use_cache, incremental, compact, shared_dir, job_filter)
+
+    results = map_tasks(_process_node_month, tasks(), backend, n_jobs)
+    try:
+        for (year, month), month_files in zip(months, files):
+            frames = (node_df for node_df in (next(results) for _ in month_files) if node_df is not None)
+            yield year, month, frames
+            for _ in frames:
+                pass
+            if (year, month) in shared_dirs:
+                shutil.rmtree(shared_dirs.pop((year, month)), ignore_errors=True)
+    finally:
+        results.close()
+        for shared_dir in shared_dirs.values():
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+def iter_gpu_data(year: str, month: str, use_cache: bool = True, incremental: bool = False,
+                  compact: bool = False, backend: str = "serial", n_jobs: int = None,
+                  job_filter: dict = None):
+    """
+    Yields the merged job and GPU usage records of a given year and month, one node at a time.
+
+    Only one node-month is held in memory at once (a few per worker when parallel), see
+    process_gpu_data for the concatenated frame. Every backend yields the same frames in
+    the same order.
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        month (str): Two-digit month string (e.g., "01" for January).
+        use_cache (bool): Read parsed gpustats files from the on-disk cache and job records
+            from the accounting store (default True).
+        incremental (bool): Only parse what was appended to each file since the last run.
+        compact (bool): Yield frames in the compact schema of compact_gpu_frame.
+        backend (str): "serial", "thread" or "process", see map_tasks.
+        n_jobs (int): Number of workers for the thread and process backends.
+        job_filter (dict): Accounting column values the jobs must have, e.g.
+            {"owner": "jdoe", "project": "proj"}, or lists of accepted values
+            ({"project": ["proj1", "proj2"]}). Only the samples of matching jobs are
+            joined and yielded, and nodes where none of them ran (by accounting hostname,
+            the master node of a job) are skipped, unless one of them is of a multi-host
+            parallel environment (mpi_*), whose other hosts are not recorded. Without it
+            every sample is yielded.
+
+    Yields:
+        pd.DataFrame: The merged records of one node.
+    """
+    for _, _, frames in _iter_months([(year, month)], use_cache, incremental, compact, backend, n_jobs,
+                                     job_filter):
+        yield from frames
+
+
+def process_gpu_data(year: str, month: str, use_cache: bool = True, incremental: bool = False,
+                     compact: bool = False, backend: str = "serial", n_jobs: int = None,
+                     job_filter: dict = None) -> pd.DataFrame:
+    """
+    Processes GPU usage data for a given year and month by merging job records with node statistics.
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        month (str): Two-digit month string (e.g., "01" for January).
+        use_cache (bool): Read parsed gpustats files from the on-disk cache (default True).
+        incremental (bool): Only parse what was appended to each file since the last run.
+        compact (bool): Return the frame in the compact schema of compact_gpu_frame.
+        backend (str): "serial", "thread" or "process", to process nodes in parallel.
+        n_jobs (int): Number of workers for the thread and process backends.
+        job_filter (dict): Only return the samples of jobs with these accounting values,
+            see iter_gpu_data.
+
+    Returns:
+        pd.DataFrame: A merged DataFrame containing job and GPU usage records.
+    """
+    all_merged_dfs = list(iter_gpu_data(year, month, use_cache, incremental, compact, backend, n_jobs,
+                                        job_filter))
 
     # Return the final concatenated DataFrame
+    if compact:
+        return concat_gpu_frames(all_merged_dfs)
     return (
         pd.concat(all_merged_dfs, ignore_index=True)
         if all_merged_dfs
@@ -344,33 +1237,54 @@ def process_gpu_data(year: str, month: str) -> pd.DataFrame:
     )
 
 
-def aggregate_gpu_data(year: str) -> pd.DataFrame:
+def aggregate_gpu_data(year: str, compact: bool = False, backend: str = "serial",
+                       n_jobs: int = None) -> pd.DataFrame:
     """
     Aggregates GPU usage data for all months in a given year.
 
     Parameters:
         year (str): Two-digit year string (e.g., "25" for 2025).
+        compact (bool): Build the frame in the compact schema of compact_gpu_frame.
+        backend (str): "serial", "thread" or "process", to process node-months in parallel.
+        n_jobs (int): Number of workers for the thread and process backends.
 
     Returns:
         pd.DataFrame: A concatenated DataFrame containing job and GPU usage records for all months.
     """
+    all_months_df = list(iter_gpu_data_year(year, by="month", compact=compact,
+                                            backend=backend, n_jobs=n_jobs))
+
+    # Return the final concatenated DataFrame
+    if compact:
+        return concat_gpu_frames(all_months_df)
+    return (
+        pd.concat(all_months_df, ignore_index=True) if all_months_df else pd.DataFrame()
+    )
+
+
+def iter_gpu_data_year(year: str, by: str = "node", compact: bool = False, backend: str = "serial",
+                       n_jobs: int = None):
+    """
+    Yields the GPU usage data of all months in a given year chunk by chunk.
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        by (str): Chunk size, "node" for one node-month or "month" for one whole month.
+        compact (bool): Yield frames in the compact schema of compact_gpu_frame.
+        backend (str): "serial", "thread" or "process", see map_tasks.
+        n_jobs (int): Number of workers for the thread and process backends.
+
+    Yields:
+        pd.DataFrame: Merged job and GPU usage records, see iter_gpu_data_range.
+    """
     # Validate year format
     if not isinstance(year, str) or not year.isdigit() or len(year) != 2:
         raise ValueError(
             f"Invalid year format: {year}. Expected a two-digit string (e.g., '25' for 2025)."
         )
 
-    all_months_df = []
-    for month in [f"{m:02d}" for m in range(1, 13)]:  # Generate "01" to "12"
-        print(f"Processing {year}-{month}...")
-        monthly_df = process_gpu_data(year, month)
-        if not monthly_df.empty:
-            all_months_df.append(monthly_df)
-
-    # Return the final concatenated DataFrame
-    return (
-        pd.concat(all_months_df, ignore_index=True) if all_months_df else pd.DataFrame()
-    )
+    yield from iter_gpu_data_range(f"20{year}-01-01", f"20{year}-12-31", by=by, compact=compact,
+                                   backend=backend, n_jobs=n_jobs)
 
 def process_projects_gpu_data(year: str, month: str, projects: list) -> pd.DataFrame:
     """
@@ -408,18 +1322,16 @@ def process_projects_gpu_data(year: str, month: str, projects: list) -> pd.DataF
     return filtered_df
 
 
-def process_gpu_data_range(start_date: str, end_date: str) -> pd.DataFrame:
+def months_in_range(start_date: str, end_date: str) -> list:
     """
-    Processes GPU usage data for a given date range by calling process_gpu_data 
-    for each month that falls within the range.
+    Lists the months that fall within a date range.
 
     Parameters:
         start_date (str): Start date in the format "YYYY-MM-DD".
         end_date (str): End date in the format "YYYY-MM-DD".
 
     Returns:
-        pd.DataFrame: A merged DataFrame containing job and GPU usage records 
-                      for the entire specified date range.
+        list: (year, month) tuples of two-digit strings, e.g. [("24", "12"), ("25", "01")].
     """
     # Validate date format
     try:
@@ -443,15 +1355,73 @@ def process_gpu_data_range(start_date: str, end_date: str) -> pd.DataFrame:
             month = 1
             year += 1
 
-    # Process each month and merge results
-    all_dfs = []
-    for year, month in months_to_process:
+    return months_to_process
+
+
+def iter_gpu_data_range(start_date: str, end_date: str, by: str = "node", compact: bool = False,
+                        backend: str = "serial", n_jobs: int = None):
+    """
+    Yields the GPU usage data of a date range chunk by chunk instead of concatenating it.
+
+    Memory stays bounded by the size of one chunk, so multi-year ranges can be folded
+    into summaries with the reducers in reducers.py. With the thread or process backend
+    the node-months of every month are spread over the same pool of workers, and chunks
+    are still yielded in order.
+
+    Parameters:
+        start_date (str): Start date in the format "YYYY-MM-DD".
+        end_date (str): End date in the format "YYYY-MM-DD".
+        by (str): Chunk size, "node" for one node-month or "month" for one whole month.
+        compact (bool): Yield frames in the compact schema of compact_gpu_frame.
+        backend (str): "serial", "thread" or "process", see map_tasks.
+        n_jobs (int): Number of workers for the thread and process backends.
+
+    Yields:
+        pd.DataFrame: Merged job and GPU usage records of one chunk, empty chunks are skipped.
+    """
+    if by not in ("node", "month"):
+        raise ValueError(f"Invalid chunk size: {by}. Expected 'node' or 'month'.")
+
+    months = months_in_range(start_date, end_date)
+    for year, month, frames in _iter_months(months, True, False, compact, backend, n_jobs):
         print(f"Processing {year}-{month}...")
-        monthly_df = process_gpu_data(year, month)
-        if not monthly_df.empty:
-            all_dfs.append(monthly_df)
+        if by == "node":
+            for node_df in frames:
+                if not node_df.empty:
+                    yield node_df
+        else:
+            node_dfs = list(frames)
+            if not node_dfs:
+                continue
+            monthly_df = concat_gpu_frames(node_dfs) if compact else pd.concat(node_dfs, ignore_index=True)
+            if not monthly_df.empty:
+                yield monthly_df
+
+
+def process_gpu_data_range(start_date: str, end_date: str, compact: bool = False,
+                           backend: str = "serial", n_jobs: int = None) -> pd.DataFrame:
+    """
+    Processes GPU usage data for a given date range by calling process_gpu_data 
+    for each month that falls within the range.
+
+    Parameters:
+        start_date (str): Start date in the format "YYYY-MM-DD".
+        end_date (str): End date in the format "YYYY-MM-DD".
+        compact (bool): Build the frame in the compact schema of compact_gpu_frame.
+        backend (str): "serial", "thread" or "process", to process node-months in parallel.
+        n_jobs (int): Number of workers for the thread and process backends.
+
+    Returns:
+        pd.DataFrame: A merged DataFrame containing job and GPU usage records 
+                      for the entire specified date range.
+    """
+    # Process each month and merge results
+    all_dfs = list(iter_gpu_data_range(start_date, end_date, by="month", compact=compact,
+                                       backend=backend, n_jobs=n_jobs))
 
     # Concatenate results
+    if compact:
+        return concat_gpu_frames(all_dfs)
     return pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
 
 
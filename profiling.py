@@ -0,0 +1,188 @@
+import glob
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Set while profiling, to the directory worker processes write their stage records to;
+# child processes inherit it through the environment, whichever way they are started
+PROFILE_ENV = "GPU_UTIL_PROFILE_DIR"
+
+# Stage records of this process, and the process that started profiling
+_records = []
+_main_pid = None
+_profiler = None
+_started = None
+
+
+def profiling_enabled() -> bool:
+    """True while start_profiling is in effect, in the main process and in its workers"""
+    return PROFILE_ENV in os.environ
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def profile_stage(name: str, **info):
+    """
+    Records the wall time, CPU time and peak memory of a stage when profiling is enabled.
+
+    The yielded dict is the stage's record: callers may add to it, e.g. the number of
+    rows the stage produced as record["rows"]. When profiling is off nothing is measured.
+
+    CPU time is that of the calling thread, so it stays right with the thread backend.
+    Peak RSS is that of the whole process; peak_rss_increase_mb is how much the stage
+    raised it, which points at the stages that set the process's peak.
+
+    Parameters:
+        name (str): Stage name, e.g. "parse" or "page:create_title_page".
+        **info: Details stored with the record (node, month, file...).
+    """
+    if not profiling_enabled():
+        yield {}
+        return
+
+    record = {"stage": name, **info}
+    peak_before = _peak_rss_mb()
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = round(time.perf_counter() - wall, 6)
+        record["cpu_s"] = round(time.thread_time() - cpu, 6)
+        peak_after = _peak_rss_mb()
+        record["peak_rss_mb"] = round(peak_after, 1)
+        record["peak_rss_increase_mb"] = round(peak_after - peak_before, 1)
+        record["pid"] = os.getpid()
+        if os.getpid() == _main_pid:
+            _records.append(record)
+        else:
+            # Worker process: one JSON line per record, collected by stop_profiling
+            path = os.path.join(os.environ[PROFILE_ENV], f"stages-{os.getpid()}.jsonl")
+            with open(path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+
+def start_profiling(cpu: bool = False, memory: bool = False):
+    """
+    Starts recording the stages of this process and of the worker processes it starts.
+
+    Parameters:
+        cpu (bool): Also run cProfile in this process.
+        memory (bool): Also trace Python allocations with tracemalloc (slow).
+    """
+    global _main_pid, _profiler, _started
+    os.environ[PROFILE_ENV] = tempfile.mkdtemp(prefix="gpu_util_profile_")
+    _main_pid = os.getpid()
+    _records.clear()
+    _started = (time.perf_counter(), time.process_time())
+    if cpu:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if memory:
+        import tracemalloc
+
+        tracemalloc.start()
+
+
+def summarize(records: list) -> dict:
+    """Totals of the records of each stage name: count, wall and CPU seconds, rows, peak RSS"""
+    summary = {}
+    for record in records:
+        stage = summary.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows": 0,
+                                                     "peak_rss_mb": 0.0})
+        stage["count"] += 1
+        stage["wall_s"] += record["wall_s"]
+        stage["cpu_s"] += record["cpu_s"]
+        stage["rows"] += record.get("rows") or 0
+        stage["peak_rss_mb"] = max(stage["peak_rss_mb"], record["peak_rss_mb"])
+    for stage in summary.values():
+        stage["wall_s"], stage["cpu_s"] = round(stage["wall_s"], 6), round(stage["cpu_s"], 6)
+    return summary
+
+
+def stop_profiling(output: str) -> dict:
+    """
+    Stops profiling and writes the JSON report, plus the cProfile and tracemalloc dumps.
+
+    The report holds the command line, the totals of the run, the summary of each stage
+    name and every stage record, from this process and from its workers. The cProfile
+    statistics go to <output>.prof (open with pstats or snakeviz) and the largest
+    allocation sites to <output>.tracemalloc.txt.
+
+    Parameters:
+        output (str): Path of the JSON report.
+
+    Returns:
+        dict: The report.
+    """
+    global _profiler, _started
+    wall, cpu = time.perf_counter() - _started[0], time.process_time() - _started[1]
+    shared_dir = os.environ.pop(PROFILE_ENV)
+
+    records = list(_records)
+    for path in sorted(glob.glob(os.path.join(shared_dir, "stages-*.jsonl"))):
+        with open(path) as file:
+            records.extend(json.loads(line) for line in file if line.strip())
+    shutil.rmtree(shared_dir, ignore_errors=True)
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "command": sys.argv,
+        "total": {
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "workers_cpu_s": round(children.ru_utime + children.ru_stime, 6),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "workers_peak_rss_mb": round(children.ru_maxrss / 1024, 1),
+        },
+        "summary": summarize(records),
+        "stages": records,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=1)
+
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(f"{output}.prof")
+        _profiler = None
+
+    import tracemalloc
+
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(f"{output}.tracemalloc.txt", "w") as file:
+            file.write(f"Traced Python memory: current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB\n")
+            file.write("Largest allocation sites still alive at the end of the run:\n")
+            for stat in snapshot.statistics("lineno")[:50]:
+                file.write(f"{stat}\n")
+
+    _records.clear()
+    _started = None
+    return report
+
+
+def print_summary(report: dict):
+    """Prints the stages of a report, the slowest first"""
+    total = report["total"]
+    print(f"Profile: {total['wall_s']:.2f}s wall, {total['cpu_s']:.2f}s CPU, peak RSS {total['peak_rss_mb']:,.0f} MB"
+          + (f", workers {total['workers_cpu_s']:.2f}s CPU, peak RSS {total['workers_peak_rss_mb']:,.0f} MB"
+             if total["workers_cpu_s"] else ""))
+    stages = sorted(report["summary"].items(), key=lambda item: item[1]["wall_s"], reverse=True)
+    for name, stage in stages:
+        rows = f", {stage['rows']:,} rows" if stage["rows"] else ""
+        print(f"  {name:<44} {stage['count']:>4}x {stage['wall_s']:8.2f}s wall {stage['cpu_s']:8.2f}s CPU"
+              f"  peak {stage['peak_rss_mb']:,.0f} MB{rows}")
@@ -0,0 +1,729 @@
+import numpy as np
+import pandas as pd
+
+# gpustats samples every 5 minutes, so 12 samples make one GPU hour
+SAMPLES_PER_HOUR = 12
+SAMPLE_SECONDS = 3600 // SAMPLES_PER_HOUR
+# Utilization (%) below which a sample counts as idle
+LOW_UTIL_THRESHOLD = 5
+# Bins of the per-job utilization histograms: one per integer percent from 0 to 100
+UTIL_BINS = 101
+HIST_COLUMNS = [f"util_hist_{percent:03d}" for percent in range(UTIL_BINS)]
+# Relative error of the VRAM quantiles: memory is binned on a log scale, each bin spanning
+# a factor of (1 + VRAM_ACCURACY) / (1 - VRAM_ACCURACY), from 1 MiB to 1 TiB
+VRAM_ACCURACY = 0.01
+VRAM_GAMMA = (1 + VRAM_ACCURACY) / (1 - VRAM_ACCURACY)
+VRAM_BINS = 2 + int(np.ceil(np.log(2 ** 20) / np.log(VRAM_GAMMA)))
+# Quantiles reported by QuantileSketches.result
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _plain_index(frame: pd.DataFrame) -> pd.DataFrame:
+    """Turns categorical group keys back into plain values so partial results concatenate"""
+    index = frame.index
+    if isinstance(index, pd.MultiIndex):
+        frame.index = index.set_levels([level.astype(object) for level in index.levels])
+    elif isinstance(index, pd.CategoricalIndex):
+        frame.index = index.astype(object)
+    return frame
+
+
+class Reducer:
+    """
+    Folds chunks of merged GPU records (see helpers.iter_gpu_data_range) into a summary.
+
+    A reducer keeps a small partial state built from sums, counts and first values, so
+    update() can be called chunk after chunk in bounded memory, and reducers filled from
+    different chunks (e.g. in different processes) can be combined with merge().
+    Chunks must be fed in the order the full frame would have them for the 'first'
+    columns to match a groupby over the concatenated frame.
+
+    Subclasses implement partial(chunk) and result(), and list the columns that
+    combine with 'first', 'min' or 'max' instead of 'sum' in FIRST_COLUMNS,
+    MIN_COLUMNS and MAX_COLUMNS.
+    """
+    FIRST_COLUMNS = ()
+    MIN_COLUMNS = ()
+    MAX_COLUMNS = ()
+
+    def _aggregation(self, column: str) -> str:
+        if column in self.FIRST_COLUMNS:
+            return "first"
+        if column in self.MIN_COLUMNS:
+            return "min"
+        if column in self.MAX_COLUMNS:
+            return "max"
+        return "sum"
+
+    def _aggregate(self, groups, columns: list) -> pd.DataFrame:
+        """
+        Combines columns of grouped rows with their aggregation.
+
+        Columns sharing an aggregation are reduced together, which is much faster than
+        a per-column agg() on wide states such as the utilization histograms.
+        """
+        by_aggregation = {}
+        for column in columns:
+            by_aggregation.setdefault(self._aggregation(column), []).append(column)
+        parts = [getattr(groups[names], aggregation)() for aggregation, names in by_aggregation.items()]
+        return pd.concat(parts, axis=1)[columns]
+
+    def __init__(self):
+        self.state = None
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def _combine(self, states: list) -> pd.DataFrame:
+        states = [state for state in states if state is not None]
+        if not states:
+            return None
+        if len(states) == 1:
+            return states[0]
+        combined = pd.concat(states)
+        levels = list(range(combined.index.nlevels))
+        return self._aggregate(combined.groupby(level=levels, dropna=False), list(combined.columns))
+
+    def update(self, chunk: pd.DataFrame) -> "Reducer":
+        """Adds one chunk of merged GPU records"""
+        if chunk is not None and not chunk.empty:
+            self.state = self._combine([self.state, _plain_index(self.partial(chunk))])
+        return self
+
+    def merge(self, other: "Reducer") -> "Reducer":
+        """Adds the state of another reducer of the same kind, fed with later chunks"""
+        self.state = self._combine([self.state, other.state])
+        return self
+
+
+def _epoch_seconds(time: pd.Series) -> pd.Series:
+    """Returns epoch seconds whether 'time' is still numeric or already datetime"""
+    if pd.api.types.is_datetime64_any_dtype(time):
+        return time.astype("int64") // 10**9
+    return time.astype("int64")
+
+
+class HourlyUtilization(Reducer):
+    """
+    Hourly share of GPUs reserved by jobs and mean percent utilization, as plotted by
+    create_utilization_chart.
+    """
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        hours = _epoch_seconds(chunk["time"]) // 3600 * 3600
+        frame = pd.DataFrame({
+            "hour": hours.to_numpy(),
+            "samples": 1,
+            "reserved": (chunk["scenario"] != 0).to_numpy(dtype="int64"),
+            "util_sum": chunk["util"].astype("float64").fillna(0).to_numpy(),
+            "util_count": chunk["util"].notna().to_numpy(dtype="int64"),
+        })
+        return frame.groupby("hour").sum()
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: Indexed by hour (every hour from the first to the last sample),
+                with 'reserved' (% of samples reserved) and 'util' (mean %) columns,
+                NaN for hours without samples.
+        """
+        return _hourly_percentages(self.state)
+
+
+def _hourly_percentages(sums: pd.DataFrame) -> pd.DataFrame:
+    """Turns hourly samples/reserved/util_sum/util_count sums indexed by epoch hour into percentages"""
+    if sums is None or sums.empty:
+        return pd.DataFrame(columns=["reserved", "util"], index=pd.DatetimeIndex([], freq="h"))
+    sums = sums.sort_index()
+    hourly = pd.DataFrame({
+        "reserved": sums["reserved"] / sums["samples"] * 100,
+        "util": sums["util_sum"] / sums["util_count"],
+    })
+    hourly.index = pd.to_datetime(hourly.index, unit="s")
+    return hourly.asfreq("h")
+
+
+class HourlyCube(Reducer):
+    """
+    Sample counts, reserved counts and util sums per hour, node and queue.
+
+    The cube is small (one row per hour, node and queue that had samples), so time series
+    of any slice of the cluster come from summing a few of its rows with
+    hourly_utilization() instead of resampling the row-level records. Attributes that
+    depend on the node or the queue only (shared/buy-in flag, class, GPU type) are
+    added to the cube afterwards as extra columns to slice on.
+    """
+    BY = ["node", "qname"]
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        frame = pd.DataFrame({
+            "hour": (_epoch_seconds(chunk["time"]) // 3600 * 3600).to_numpy(),
+            "node": chunk["node"].to_numpy(),
+            "qname": chunk["qname"].to_numpy(),
+            "samples": 1,
+            "reserved": (chunk["scenario"] != 0).to_numpy(dtype="int64"),
+            "util_sum": chunk["util"].astype("float64").fillna(0).to_numpy(),
+            "util_count": chunk["util"].notna().to_numpy(dtype="int64"),
+        })
+        return frame.groupby(["hour"] + self.BY, dropna=False, observed=True).sum()
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: One row per hour (epoch seconds), node and qname (NaN for idle
+                samples) with samples, reserved, util_sum and util_count.
+        """
+        columns = ["hour"] + self.BY + ["samples", "reserved", "util_sum", "util_count"]
+        if self.state is None:
+            return pd.DataFrame(columns=columns)
+        return self.state.sort_index().reset_index()[columns]
+
+
+def hourly_utilization(cube: pd.DataFrame) -> pd.DataFrame:
+    """
+    Hourly reserved share and mean utilization of a slice of an HourlyCube result.
+
+    Example:
+        cube = HourlyCube().update(chunk).result()
+        shared = hourly_utilization(cube[cube["node"].isin(shared_nodes)])
+
+    Returns:
+        pd.DataFrame: Like HourlyUtilization.result(), every hour from the first to the
+            last one of the slice.
+    """
+    sums = cube.groupby("hour")[["samples", "reserved", "util_sum", "util_count"]].sum()
+    return _hourly_percentages(sums)
+
+
+class GPUHours(Reducer):
+    """Reserved GPU hours per owner, project or any other column of the merged records"""
+
+    def __init__(self, by: str = "owner"):
+        super().__init__()
+        self.by = by
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        reserved = chunk[chunk["scenario"] != 0]
+        return reserved.groupby(self.by, observed=True).size().to_frame("samples")
+
+    def result(self) -> pd.Series:
+        """
+        Returns:
+            pd.Series: GPU hours per value of the 'by' column, largest first.
+        """
+        if self.state is None:
+            return pd.Series(dtype="float64", name="gpu_hours")
+        hours = self.state["samples"] / SAMPLES_PER_HOUR
+        return hours.rename("gpu_hours").rename_axis(self.by).sort_values(ascending=False)
+
+
+class LowUtilizationJobs(Reducer):
+    """
+    Per-job utilization summary used to find jobs whose samples were all below
+    LOW_UTIL_THRESHOLD, like the low-utilization pages of the report.
+    """
+    FIRST_COLUMNS = ("project_y", "job_name")
+
+    def __init__(self, threshold: float = LOW_UTIL_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        util = chunk["util"].astype("float64")
+        frame = pd.DataFrame({
+            "owner": chunk["owner"],
+            "job_id": chunk["job_id"],
+            "n_rows": 1,
+            "n_below": (util < self.threshold).to_numpy(dtype="int64"),
+            "util_sum": util.fillna(0).to_numpy(),
+            "util_count": util.notna().to_numpy(dtype="int64"),
+            "reserved": (chunk["scenario"] != 0).to_numpy(dtype="int64"),
+            "project_y": chunk["project_y"].astype(object),
+            "job_name": chunk["job_name"].astype(object),
+        })
+        return frame.groupby(["owner", "job_id"], observed=True).agg({
+            "n_rows": "sum",
+            "n_below": "sum",
+            "util_sum": "sum",
+            "util_count": "sum",
+            "reserved": "sum",
+            "project_y": "first",
+            "job_name": "first",
+        })
+
+    def result(self, all_jobs: bool = False) -> pd.DataFrame:
+        """
+        Parameters:
+            all_jobs (bool): Return every job instead of only the low-utilization ones.
+
+        Returns:
+            pd.DataFrame: One row per (owner, job_id) with util_mean, util_all_below
+                (True when every sample was below the threshold), reserved samples,
+                gpu_hours, project_y and job_name, sorted by reserved samples.
+        """
+        columns = ["owner", "job_id", "util_mean", "util_all_below", "reserved",
+                   "gpu_hours", "project_y", "job_name"]
+        if self.state is None:
+            return pd.DataFrame(columns=columns)
+        state = self.state
+        jobs = pd.DataFrame({
+            "util_mean": state["util_sum"] / state["util_count"],
+            "util_all_below": state["n_below"] == state["n_rows"],
+            "reserved": state["reserved"],
+            "gpu_hours": state["reserved"] / SAMPLES_PER_HOUR,
+            "project_y": state["project_y"],
+            "job_name": state["job_name"],
+        }).reset_index()
+        if not all_jobs:
+            jobs = jobs[jobs["util_all_below"]]
+        return jobs.sort_values(by="reserved", ascending=False, kind="stable")[columns]
+
+
+def util_histogram(codes: np.ndarray, util: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    Counts the samples of each group in 1% utilization bins.
+
+    Parameters:
+        codes (np.ndarray): Group number of each sample.
+        util (np.ndarray): Utilization (%) of each sample, NaN samples are left out.
+        n_groups (int): Number of groups.
+
+    Returns:
+        np.ndarray: (n_groups, UTIL_BINS) int32 counts; bin k holds utilizations from k
+            to k + 1, and bin 100 everything from 100 up.
+    """
+    valid = ~np.isnan(util)
+    bins = np.clip(np.floor(util[valid]), 0, UTIL_BINS - 1).astype(np.int64)
+    counts = np.bincount(codes[valid] * UTIL_BINS + bins, minlength=n_groups * UTIL_BINS)
+    return counts.reshape(n_groups, UTIL_BINS).astype(np.int32)
+
+
+def samples_below(histograms: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Number of samples strictly below a utilization threshold, from histograms.
+
+    gpustats writes utilization in whole percents, so the counts are exact for any
+    threshold; for fractional utilizations they are exact for whole-percent thresholds.
+
+    Parameters:
+        histograms (np.ndarray): (n, UTIL_BINS) counts from util_histogram.
+        threshold (float): Utilization (%).
+
+    Returns:
+        np.ndarray: n counts.
+    """
+    last = int(np.ceil(threshold)) - 1
+    return histograms[:, :max(min(last + 1, UTIL_BINS), 0)].sum(axis=1)
+
+
+def histogram_median(histograms: np.ndarray) -> np.ndarray:
+    """
+    Median utilization of each row of histograms, NaN for rows without samples.
+
+    Each sample counts as the lower bound of its bin, so the median (the mean of the two
+    middle samples for an even count) is exact for the whole percents gpustats writes.
+
+    Parameters:
+        histograms (np.ndarray): (n, UTIL_BINS) counts from util_histogram.
+
+    Returns:
+        np.ndarray: n medians.
+    """
+    counts = histograms.sum(axis=1)
+    cumulative = histograms.cumsum(axis=1)
+    # Bin of the sample of a given rank: the number of bins holding no more samples than it
+    lower = (cumulative <= ((counts - 1) // 2)[:, None]).sum(axis=1)
+    upper = (cumulative <= (counts // 2)[:, None]).sum(axis=1)
+    return np.where(counts > 0, (lower + upper) / 2, np.nan)
+
+
+class JobSummary(Reducer):
+    """
+    Per-job sums behind the job pages of the report: utilization and reserved samples,
+    a 1% histogram of the utilization of the reserved samples, and the project, queue,
+    job name and GPU count of every job.
+
+    The state is kept per (owner, job_id, node), so jobs on nodes left out of a report can
+    be dropped when the table is built. The queue and job name are kept rather than
+    their class and execution type, which result() derives, so a stored state does not
+    depend on the queue classes of the day. Likewise the histograms and the peak
+    utilization answer the low-utilization questions for any threshold, so one state
+    serves every --idle-threshold.
+    """
+    FIRST_COLUMNS = ("project_y", "qname", "job_name", "n_gpu")
+    MAX_COLUMNS = ("util_max",)
+
+    def __init__(self, threshold: float = LOW_UTIL_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        util = chunk["util"].astype("float64")
+        reserved = (chunk["scenario"] != 0).to_numpy()
+        frame = pd.DataFrame({
+            "owner": chunk["owner"],
+            "job_id": chunk["job_id"],
+            "node": chunk["node"],
+            "n_rows": 1,
+            "util_sum": util.fillna(0).to_numpy(),
+            "util_count": util.notna().to_numpy(dtype="int64"),
+            "util_max": util.to_numpy(),
+            "reserved": reserved.astype("int64"),
+            "project_y": chunk["project_y"].astype(object),
+            "qname": chunk["qname"].astype(object),
+            "job_name": chunk["job_name"].astype(object),
+            "n_gpu": chunk["n_gpu"].astype("float64"),
+        })
+        keys = ["owner", "job_id", "node"]
+        groups = frame.groupby(keys, observed=True)
+        sums = self._aggregate(groups, [column for column in frame.columns if column not in keys])
+
+        # Samples without a job have no owner and belong to no group
+        codes = groups.ngroup().to_numpy(dtype="float64", na_value=np.nan)
+        keep = reserved & ~np.isnan(codes)
+        histograms = util_histogram(codes[keep].astype(np.int64), util.to_numpy()[keep], len(sums))
+        return pd.concat([sums, pd.DataFrame(histograms, index=sums.index, columns=HIST_COLUMNS)], axis=1)
+
+    def result(self, nodes=None, queue_classes: dict = None, threshold: float = None) -> pd.DataFrame:
+        """
+        Parameters:
+            nodes (list): Only count samples from these nodes (default all).
+            queue_classes (dict): Class ("shared", "buyin", ...) of each queue.
+            threshold (float): Utilization (%) of the low-utilization columns, defaults
+                to the reducer's threshold.
+
+        Returns:
+            pd.DataFrame: One row per (owner, job_id), sorted by them, with util_mean,
+                util_all_below (every sample below the threshold), reserved and low_util
+                (reserved samples below the threshold) samples, gpu_hours,
+                idle_gpu_hours (reserved samples below the threshold, in GPU hours),
+                project_y, qname, job_name, n_gpu, class_user, class_type, job_type,
+                job_interactive and execution_type.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        state = self.state
+        if state is None:
+            state = self.partial(pd.DataFrame(columns=[
+                "owner", "job_id", "node", "util", "scenario", "project_y", "qname", "job_name", "n_gpu"
+            ]))
+        if nodes is not None:
+            state = state[state.index.get_level_values("node").isin(nodes)]
+        state = self._aggregate(state.groupby(level=["owner", "job_id"]), list(state.columns))
+        histograms = state[HIST_COLUMNS].to_numpy()
+
+        jobs = pd.DataFrame({
+            "util_mean": state["util_sum"] / state["util_count"],
+            "util_all_below": (state["util_count"] == state["n_rows"]) & (state["util_max"] < threshold),
+            "reserved": state["reserved"],
+            "low_util": samples_below(histograms, threshold),
+            "gpu_hours": state["reserved"] / SAMPLES_PER_HOUR,
+            "idle_gpu_hours": samples_below(histograms, threshold) / SAMPLES_PER_HOUR,
+            "project_y": state["project_y"],
+            "qname": state["qname"],
+            "job_name": state["job_name"],
+            "n_gpu": state["n_gpu"],
+        }).reset_index()
+        jobs["class_user"] = jobs["qname"].map(queue_classes or {}).astype(object)
+        jobs["class_type"] = np.where(jobs["class_user"] == "shared", "Shared", "Buy-in")
+        jobs["job_type"] = jobs["class_user"].str.capitalize()
+        job_name = jobs["job_name"].astype(object)
+        jobs["job_interactive"] = (job_name.str.startswith("ood") == True) | (job_name == "QRLOGIN")
+        jobs["execution_type"] = np.where(jobs["job_interactive"], "On-Demand/Interactive", "Batch")
+        return jobs
+
+
+def _segments(codes: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Sorts values by group code, then by value, and returns the sorted values with the
+    codes of the groups present and the start and end of their segments.
+    """
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    present, starts = np.unique(codes, return_index=True)
+    ends = np.append(starts[1:], len(codes)).astype(np.int64) if len(starts) else starts
+    return values, present, starts, ends
+
+
+class JobMetrics(Reducer):
+    """
+    Per-job GPU efficiency metrics: time before the first and after the last active
+    sample, active share, and the mean, median, maximum and dispersion of utilization.
+
+    The state is kept per (owner, job_id, ux_start_time, node, bus), so jobs that reused
+    a job number stay apart, and every column combines with a sum, min, max or first, so
+    metrics of a year come from merging monthly states.
+    Samples count as active when their utilization is at or above the threshold. Each
+    sample stands for SAMPLE_SECONDS of GPU time.
+
+    Like JobSummary, the state keeps a 101-bin utilization histogram per GPU, from which
+    util_median is taken once the GPUs, months or chunks are combined, so it is the
+    exact median of all the samples of a GPU or job.
+    """
+    FIRST_COLUMNS = ("project_y", "qname", "job_name")
+    MIN_COLUMNS = ("first_sample", "first_active")
+    MAX_COLUMNS = ("util_max", "last_sample", "last_active", "end_time")
+    KEYS = ["owner", "job_id", "ux_start_time", "node", "bus"]
+
+    def __init__(self, threshold: float = LOW_UTIL_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        groups = chunk.groupby(self.KEYS, observed=True, sort=True)
+        codes = groups.ngroup().to_numpy(dtype="float64", na_value=np.nan)
+        # Samples without a job have no owner and belong to no group
+        keep = ~np.isnan(codes) & (codes >= 0)
+        index = groups.size().index
+        n = len(index)
+        codes = codes[keep].astype(np.int64)
+        util = chunk["util"].astype("float64").to_numpy()[keep]
+        times = _epoch_seconds(chunk["time"]).to_numpy(dtype="float64")[keep]
+        valid = ~np.isnan(util)
+        active = valid & (util >= self.threshold)
+
+        frame = pd.DataFrame({
+            "samples": np.bincount(codes, minlength=n),
+            "util_count": np.bincount(codes[valid], minlength=n),
+            "util_sum": np.bincount(codes[valid], weights=util[valid], minlength=n),
+            "util_sq_sum": np.bincount(codes[valid], weights=util[valid] ** 2, minlength=n),
+            "active": np.bincount(codes[active], minlength=n),
+        }, index=index)
+
+        # Maximum from the utilization sorted within each group
+        sorted_util, present, starts, ends = _segments(codes[valid], util[valid])
+        util_max = np.full(n, np.nan)
+        util_max[present] = sorted_util[ends - 1]
+        frame["util_max"] = util_max
+        histograms = pd.DataFrame(util_histogram(codes, util, n), index=index, columns=HIST_COLUMNS)
+        frame = pd.concat([frame, histograms], axis=1)
+
+        # First and last sample, and first and last active sample, from the sorted times
+        for prefix, mask in (("sample", np.ones(len(codes), dtype=bool)), ("active", active)):
+            sorted_times, present, starts, ends = _segments(codes[mask], times[mask])
+            first, last = np.full(n, np.nan), np.full(n, np.nan)
+            first[present] = sorted_times[starts]
+            last[present] = sorted_times[ends - 1]
+            frame[f"first_{prefix}"] = first
+            frame[f"last_{prefix}"] = last
+
+        jobs = chunk[keep]
+        first_rows = np.unique(codes, return_index=True)[1]
+        frame["end_time"] = pd.to_numeric(jobs["ux_end_time"], errors="coerce").to_numpy(dtype="float64")[first_rows]
+        for column in self.FIRST_COLUMNS:
+            frame[column] = jobs[column].astype(object).to_numpy()[first_rows]
+        return frame
+
+    def result(self, per_bus: bool = False) -> pd.DataFrame:
+        """
+        Parameters:
+            per_bus (bool): One row per GPU (owner, job_id, start_time, node, bus) instead of
+                per job.
+
+        Returns:
+            pd.DataFrame: One row per job (owner, job_id, start_time), or per GPU, sorted by them, with
+                gpus (GPUs with samples), samples, util_mean, util_median, util_max,
+                comp_std (standard deviation of utilization), comp_time (sampled GPU
+                seconds), comp_active (active GPU seconds), comp_frac (active share),
+                comp_tot (utilization-weighted GPU seconds, 0 for jobs that never used
+                their GPUs), idle_start (seconds from the job start to the first active
+                sample), idle_end (seconds from the last active sample to the job end),
+                idle_mid (idle GPU seconds between them), never_active, end_time,
+                project_y, qname and job_name. idle_start and idle_end are NaN
+                for jobs without active samples.
+        """
+        state = self.state
+        if state is None:
+            state = self.partial(pd.DataFrame(columns=self.KEYS + [
+                "util", "time", "ux_end_time"] + list(self.FIRST_COLUMNS)))
+
+        state = state.copy()
+        # Idle GPU time between the first and the last active sample of each GPU
+        span = state["last_active"] - state["first_active"] + SAMPLE_SECONDS
+        state["idle_mid"] = (span - state["active"] * SAMPLE_SECONDS).clip(lower=0).fillna(0)
+        state["gpus"] = 1
+        if not per_bus:
+            state = self._aggregate(state.groupby(level=self.KEYS[:3], observed=True), list(state.columns))
+
+        start_time = state.index.get_level_values("ux_start_time").to_numpy(dtype="float64")
+        util_mean = state["util_sum"] / state["util_count"]
+        variance = (state["util_sq_sum"] / state["util_count"] - util_mean ** 2).clip(lower=0)
+        metrics = pd.DataFrame({
+            "gpus": state["gpus"],
+            "samples": state["samples"],
+            "util_mean": util_mean,
+            "util_median": histogram_median(state[HIST_COLUMNS].to_numpy()),
+            "util_max": state["util_max"],
+            "comp_std": np.sqrt(variance),
+            "comp_time": state["samples"] * SAMPLE_SECONDS,
+            "comp_active": state["active"] * SAMPLE_SECONDS,
+            "comp_frac": state["active"] / state["samples"],
+            "comp_tot": state["util_sum"] * SAMPLE_SECONDS / 100,
+            "idle_start": (state["first_active"] - start_time).clip(lower=0),
+            "idle_end": (state["end_time"] - state["last_active"]).clip(lower=0),
+            "idle_mid": state["idle_mid"],
+            "never_active": state["active"] == 0,
+            "end_time": state["end_time"],
+            "project_y": state["project_y"],
+            "qname": state["qname"],
+            "job_name": state["job_name"],
+        })
+        return metrics.sort_index().reset_index().rename(columns={"ux_start_time": "start_time"})
+
+
+def vram_bins(memory: np.ndarray) -> np.ndarray:
+    """
+    Log-scale bin of each VRAM reading (MiB): 0 below 1 MiB, then bin k + 1 for
+    readings in (VRAM_GAMMA ** (k - 1), VRAM_GAMMA ** k]; -1 for missing readings.
+    """
+    bins = np.full(len(memory), -1, dtype=np.int64)
+    valid = ~np.isnan(memory) & (memory >= 0)
+    bins[valid & (memory < 1)] = 0
+    large = valid & (memory >= 1)
+    exponents = np.ceil(np.log(memory[large]) / np.log(VRAM_GAMMA) - 1e-9)
+    bins[large] = np.clip(exponents + 1, 1, VRAM_BINS - 1).astype(np.int64)
+    return bins
+
+
+def vram_bin_values(bins: np.ndarray) -> np.ndarray:
+    """
+    VRAM (MiB) standing for each bin of vram_bins, within VRAM_ACCURACY (relative) of
+    every reading of the bin.
+    """
+    bins = np.asarray(bins, dtype="float64")
+    return np.where(bins == 0, 0.0, 2 * VRAM_GAMMA ** (bins - 1) / (VRAM_GAMMA + 1))
+
+
+def sketch_quantiles(codes: np.ndarray, counts: np.ndarray, values: np.ndarray, quantiles: tuple) -> tuple:
+    """
+    Quantiles of binned samples, group by group.
+
+    The q quantile of a group is the value of the bin holding its sample of rank
+    ceil(q * n) (1-based), i.e. numpy's "inverted_cdf" quantile of the binned values.
+
+    Parameters:
+        codes (np.ndarray): Group of each bin, the bins of a group next to each other.
+        counts (np.ndarray): Number of samples in each bin.
+        values (np.ndarray): Value of each bin, increasing within a group.
+        quantiles (tuple): Quantiles between 0 and 1.
+
+    Returns:
+        tuple: (number of samples of each group, (n_groups, len(quantiles)) quantiles).
+    """
+    if len(codes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(quantiles)))
+    cumulative = np.cumsum(counts)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.append(starts[1:], len(codes))
+    before = cumulative[starts] - counts[starts]
+    totals = cumulative[ends - 1] - before
+    table = np.empty((len(starts), len(quantiles)))
+    for column, quantile in enumerate(quantiles):
+        # Rounded first, so that e.g. 0.9 * 10 is rank 9 rather than 10
+        ranks = np.maximum(np.ceil(np.round(quantile * totals, 6)), 1)
+        table[:, column] = values[np.searchsorted(cumulative, before + ranks)]
+    return totals, table
+
+
+class QuantileSketches(Reducer):
+    """
+    Mergeable sketches of the utilization and VRAM distributions of every user, project,
+    queue and node, for percentiles over any range of months.
+
+    A sketch counts the samples of a key in fixed bins: one per whole percent of
+    utilization, and log-scale bins of VRAM (see vram_bins). Sketches of different
+    months add up, so merged monthly rollups give the same percentiles as a pass over
+    all the raw samples, with bounded error:
+    - utilization: exact, as gpustats reports whole percents (fractional values are
+      reported at the percent below them, within 1 point);
+    - VRAM: within VRAM_ACCURACY of the exact value (1%), from 1 MiB to 1 TiB.
+
+    The state has one row per (by, key, metric, bin) holding samples, with by one of
+    BY, metric "util" or "vram", and only the bins that have samples. Samples count
+    for the user, project and queue of the job they belong to, and for their node.
+    """
+    BY = {"owner": "owner", "project": "project_y", "qname": "qname", "node": "node"}
+    METRICS = {"util": "util", "vram": "memory_used_mb"}
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        util = chunk["util"].astype("float64").to_numpy()
+        util_bins = np.full(len(util), -1, dtype=np.int64)
+        valid = ~np.isnan(util)
+        util_bins[valid] = np.clip(np.floor(util[valid]), 0, UTIL_BINS - 1)
+        memory = pd.to_numeric(chunk["memory_used_mb"], errors="coerce").to_numpy(dtype="float64")
+        bins = {"util": (util_bins, UTIL_BINS), "vram": (vram_bins(memory), VRAM_BINS)}
+
+        parts = []
+        for by, column in self.BY.items():
+            # Samples without a job have no owner, project or queue and get code -1
+            codes, keys = pd.factorize(chunk[column])
+            keys = np.asarray(keys, dtype=object)
+            for metric, (metric_bins, n_bins) in bins.items():
+                keep = (codes >= 0) & (metric_bins >= 0)
+                counts = np.bincount(codes[keep] * n_bins + metric_bins[keep], minlength=len(keys) * n_bins)
+                cells = np.flatnonzero(counts)
+                parts.append(pd.DataFrame({
+                    "by": by,
+                    "key": keys[cells // n_bins],
+                    "metric": metric,
+                    "bin": cells % n_bins,
+                    "samples": counts[cells],
+                }))
+        return pd.concat(parts, ignore_index=True).set_index(["by", "key", "metric", "bin"])
+
+    def result(self, by: str = "owner", quantiles: tuple = QUANTILES) -> pd.DataFrame:
+        """
+        Parameters:
+            by (str): "owner", "project", "qname", "node", or "all" for the whole cluster.
+            quantiles (tuple): Quantiles between 0 and 1.
+
+        Returns:
+            pd.DataFrame: One row per key, sorted, with util_samples and vram_samples and
+                a util_p<q> and vram_mb_p<q> column per quantile (e.g. util_p50, vram_mb_p99),
+                NaN for keys without VRAM readings.
+        """
+        names = {prefix: [f"{prefix}_p{quantile * 100:g}" for quantile in quantiles] for prefix in ("util", "vram_mb")}
+        columns = [by, "util_samples", "vram_samples"] + names["util"] + names["vram_mb"]
+        if self.state is None:
+            return pd.DataFrame(columns=columns)
+        samples = self.state["samples"].xs("node" if by == "all" else by, level="by")
+        if by == "all":
+            samples = pd.concat({"all": samples.groupby(level=["metric", "bin"]).sum()}, names=["key"])
+
+        tables = []
+        for metric, prefix, bin_values in (("util", "util", lambda bins: bins.astype("float64")),
+                                           ("vram", "vram_mb", vram_bin_values)):
+            counts = samples.xs(metric, level="metric").sort_index()
+            keys = counts.index.get_level_values("key")
+            codes, uniques = pd.factorize(keys)
+            totals, table = sketch_quantiles(codes, counts.to_numpy(), bin_values(
+                counts.index.get_level_values("bin").to_numpy()), quantiles)
+            table = pd.DataFrame(table, index=pd.Index(uniques, name=by), columns=names[prefix])
+            table.insert(0, f"{metric}_samples", totals)
+            tables.append(table)
+        table = pd.concat(tables, axis=1).sort_index()
+        for column in ("util_samples", "vram_samples"):
+            table[column] = table[column].fillna(0).astype("int64")
+        return table.reset_index()[columns]
+
+
+def reduce_gpu_data(chunks, *reducers) -> tuple:
+    """
+    Feeds every chunk to every reducer, holding a single chunk in memory at a time.
+
+    Example:
+        hourly, users, jobs = reduce_gpu_data(
+            iter_gpu_data_range("2023-01-01", "2025-12-31", compact=True),
+            HourlyUtilization(), GPUHours("owner"), LowUtilizationJobs()
+        )
+        print(users.result().head(10))
+
+    Returns:
+        tuple: The reducers, updated.
+    """
+    for chunk in chunks:
+        for reducer in reducers:
+            reducer.update(chunk)
+    return reducers
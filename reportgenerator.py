@@ -1,6 +1,14 @@
 import argparse
+import os
+import re
 from helpers import *
+from reducers import LOW_UTIL_THRESHOLD, HourlyCube, JobMetrics, JobSummary, QuantileSketches, hourly_utilization
+from rollups import accounting_sizes, is_closed, load_rollups, write_rollup
+from profiling import print_summary, profile_stage, start_profiling, stop_profiling
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # Reports are only written to PDF, no display is needed
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from matplotlib.backends.backend_pdf import PdfPages
@@ -11,13 +19,24 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+# Batch mode kinds, the column of the merged records they split the month on and the
+# accounting column the entities are looked up in
+BATCH_COLUMNS = {"user": ("owner", "owner"), "project": ("project_y", "project"), "qname": ("qname", "qname")}
+# Columns of the merged records the reports are built from, the only ones batch mode keeps
+REPORT_COLUMNS = ["time", "node", "util", "scenario", "owner", "job_id", "project_y", "qname", "job_name", "n_gpu"]
+# Most points drawn per line of the time series pages; a month of hours fits, longer
+# reports are downsampled (a page is narrower than this in pixels anyway)
+MAX_PLOT_POINTS = 1000
+
 def parse_arguments():
     """Parse command line arguments for report specs"""
     parser = argparse.ArgumentParser(description='Generate GPU utilization report')
     parser.add_argument('-y', '--year', type=str, default="25", 
                         help='Year (last two digits, e.g. 25)')
     parser.add_argument('-m', '--month', type=str, default="02", 
-                    help='Month (two digits, e.g. 02)')
+                    help='Month (two digits, e.g. 02), or "all" for the whole year')
+    parser.add_argument('--range', type=str, nargs=2, default=None, metavar=('START', 'END'),
+                        help='Report on the months from START to END (YYYY-MM) instead of -y/-m')
     parser.add_argument('-o', '--output', type=str, default="gpu_utilization_report.pdf", 
                     help='Output PDF filename')
     parser.add_argument('-p', '--project', type=str, default=None, 
@@ -26,14 +45,51 @@ def parse_arguments():
                         help='Filter by user name (optional)')
     parser.add_argument('-q', '--qname', type=str, default=None, 
                         help='Filter by queue name (optional)')
-
-    return parser.parse_args()
-
-
-def create_title_page(pdf, year_month_date, project=None, user=None, qname=None):
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-parse gpustats and accounting files instead of using the parsed cache and accounting store')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only parse gpustats lines appended since the last run (month in progress)')
+    parser.add_argument('--backend', type=str, default="serial", choices=BACKENDS,
+                        help='Process node files serially, in a thread pool or in a process pool')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of workers for the thread and process backends (default: $NSLOTS or all CPUs)')
+    parser.add_argument('--idle-threshold', type=float, default=LOW_UTIL_THRESHOLD,
+                        help=f'Utilization (%%) below which GPUs count as idle (default: {LOW_UTIL_THRESHOLD})')
+    parser.add_argument('--refresh-rollups', action='store_true',
+                        help='Rebuild the monthly rollups of a yearly or range report from the raw data')
+    parser.add_argument('--batch', type=str, default=None, choices=sorted(BATCH_COLUMNS),
+                        help='Generate one report per user, project or queue of the month from a single data load')
+    parser.add_argument('--entities', type=str, nargs='+', default=None,
+                        help='Users, projects or queues to report on in batch mode (default: all of them)')
+    parser.add_argument('--min-gpu-hours', type=float, default=0,
+                        help='In batch mode, skip users, projects or queues with fewer GPU hours in the month')
+    parser.add_argument('--output-dir', type=str, default=".",
+                        help='Directory the batch mode reports are saved to')
+    parser.add_argument('--render-jobs', type=int, default=1,
+                        help='Number of worker processes drawing the report pages (default: 1, in this process)')
+    parser.add_argument('--profile', type=str, default=None, metavar='JSON',
+                        help='Record the time, CPU and peak memory of every stage to this JSON file')
+    parser.add_argument('--profile-cpu', action='store_true',
+                        help='With --profile, also write a cProfile dump to JSON.prof')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With --profile, also trace allocations to JSON.tracemalloc.txt (slow)')
+
+    args = parser.parse_args()
+    if (args.range or args.month == "all") and (args.project or args.user or args.qname):
+        parser.error("-p, -u and -q only apply to single-month reports")
+    if args.batch and (args.range or args.month == "all" or args.project or args.user or args.qname):
+        parser.error("--batch only applies to single-month reports without -p, -u or -q")
+    return args
+
+
+def create_title_page(pdf, year_month_date, project=None, user=None, qname=None, end_date=None):
     """Create and save the title page"""
     month_name = year_month_date.strftime("%B")
     year_val = year_month_date.strftime("%Y")
+    if end_date is not None and end_date != year_month_date:
+        # Reports over several months show the whole period instead
+        month_name = f"{month_name} {year_val} - {end_date.strftime('%B')}"
+        year_val = end_date.strftime("%Y")
     generation_time = time.strftime('%H:%M%p %Z on %b %d, %Y')
     
     fig = plt.figure(figsize=(8.5, 11))
@@ -81,104 +137,18 @@ def create_title_page(pdf, year_month_date, project=None, user=None, qname=None)
     pdf.savefig(fig)
 
 
-def create_quick_stats_chart(pdf, year_data):
-    # Calculate statistics
-    mean = year_data['util'].mean()
-    median = year_data['util'].median()
-    max_val = year_data['util'].max()
-    idle_perc = (year_data['util'] < 5).mean()
-    idle_hours = (year_data['util'] < 5).sum() / 12
-
-    year_data['reserved'] = year_data['scenario'] != 0
-    year_data['reserved'] = year_data['reserved'].astype(int)
-
-    # Length of jobs
-    job_utilization = year_data.groupby(["owner", "job_id"]).agg({
-        "util": ["mean", lambda x: (x < 5).all()],  # Mean of util and True if all time points were <5%
-        "reserved": "sum",  # Sum of reserved GPU (to compute GPU hours)
-        "project_y": "first",  # Keep project name
-        "job_interactive": "first"  # Execution type
-    }).reset_index()
-
-    # Rename columns to make them more readable
-    job_utilization.columns = ['owner', 'job_id', 'util_mean', 'util_all_below_5', 'reserved', 'project', 'job_interactive']
-
-    # Filter only jobs that were always <5% utilization
-    low_util_jobs = job_utilization[job_utilization["util_all_below_5"]].sort_values(by='reserved', ascending=False)
-    # Convert reserved GPUs into GPU hours
-    low_util_jobs["gpu_hours"] = low_util_jobs["reserved"] / 12
-
-    # Top 5 low utilization jobs
-    top_low_util_jobs = low_util_jobs[['owner', 'job_id', 'util_mean', 'project', 'job_interactive', 'gpu_hours']].head(5)
-
-    title = "Quick Stats"
-    subtitle = "This page was generated as user/project/queue was specified"
-
-    fig = plt.figure(figsize=(8.5, 11))
-    gs = gridspec.GridSpec(2, 1, height_ratios=[1, 2])
-
-    # Title Section
-    fig.text(0.5, 0.90, title, fontsize=18, ha='center', weight='bold')
-    fig.text(0.5, 0.87, subtitle, fontsize=14, ha='center')
-
-    # Text Content Section
-    stats_text = (
-        "GPU Utilization (util/load %) Descriptive Statistics:\n"
-        f"Mean: {mean:.2f}%\n"
-        f"Median: {median:.2f}%\n"
-        f"Max: {max_val:.2f}%\n\n"
-        "GPU Idle (util < 5%) Statistics:\n"
-        f"GPUs were idle for {idle_perc:.2%} of the time\n"
-        f"for a total of {idle_hours:.2f} hours.\n\n"
-        "Here are the top 5 rows for the project/user:"
-    )
-    fig.text(0.5, 0.55, stats_text, ha='center', va='center', fontsize=12, wrap=True)
-
-    # Table Section
-    ax_table = fig.add_subplot(gs[1])
-    ax_table.axis("off")
-
-    # Create table data from the top 5 low utilization jobs
-    table_data = top_low_util_jobs.values.tolist()
-    table_columns = top_low_util_jobs.columns.tolist()
-
-    # Add the table to the plot
-    table = ax_table.table(cellText=table_data, colLabels=table_columns, cellLoc='center', loc='center')
-    table.auto_set_font_size(False)
-    table.set_fontsize(10)
-    table.scale(1.2, 1.2)
-
-    # Footer
-    footer = "For internal use — Research Computing Services Team"
-    fig.text(0.5, 0.03, footer, fontsize=8, ha='center', va='center', style='italic')
-
-    plt.tight_layout()
-    pdf.savefig(fig)
-
-def create_quick_stats_chart(pdf, year_data):
+def create_quick_stats_chart(pdf, year_data, job_summary, idle_threshold=LOW_UTIL_THRESHOLD):
 
     # Calculate statistics
     mean = year_data['util'].mean()
     median = year_data['util'].median()
     max_val = year_data['util'].max()
-    idle_perc = (year_data['util'] < 5).mean()
-    idle_hours = (year_data['util'] < 5).sum() / 12
-
-    year_data['reserved'] = year_data['scenario'] != 0
-    year_data['reserved'] = year_data['reserved'].astype(int)
-
-    # Length of jobs
-    job_utilization = year_data.groupby(["owner", "job_id"]).agg({
-        "util": ["mean", lambda x: (x < 5).all()],
-        "reserved": "sum",
-        "project_y": "first",
-        "job_interactive": "first"
-    }).reset_index()
-
-    job_utilization.columns = ['owner', 'job_id', 'util_mean', 'util_all_below_5', 'reserved', 'project', 'job_interactive']
+    idle_perc = (year_data['util'] < idle_threshold).mean()
+    idle_hours = (year_data['util'] < idle_threshold).sum() / 12
 
-    low_util_jobs = job_utilization[job_utilization["util_all_below_5"]].sort_values(by='reserved', ascending=False)
-    low_util_jobs["gpu_hours"] = low_util_jobs["reserved"] / 12
+    # Jobs that were always below the idle threshold, longest first
+    low_util_jobs = job_summary[job_summary["util_all_below"]].sort_values(by='reserved', ascending=False)
+    low_util_jobs = low_util_jobs.rename(columns={"project_y": "project"})
 
     top_low_util_jobs = low_util_jobs[['owner', 'job_id', 'util_mean', 'project', 'job_interactive', 'gpu_hours']].head(5)
 
@@ -210,7 +180,7 @@ def create_quick_stats_chart(pdf, year_data):
         f"Mean: {mean:.2f}%\n"
         f"Median: {median:.2f}%\n"
         f"Max: {max_val:.2f}%\n\n"
-        "GPU Idle (util < 5%) Statistics:\n"
+        f"GPU Idle (util < {idle_threshold:g}%) Statistics:\n"
         f"GPUs were idle for {idle_perc:.2%} of the time\n"
         f"for a total of {idle_hours:.2f} hours.\n\n"
         "Here are the top 5 rows for the project/user:"
@@ -221,10 +191,13 @@ def create_quick_stats_chart(pdf, year_data):
     ax_table = fig.add_subplot(gs[1])
     ax_table.axis("off")
 
-    table = ax_table.table(cellText=cleaned_table_data, colLabels=table_columns, cellLoc='center', loc='center')
-    table.auto_set_font_size(False)
-    table.set_fontsize(10)
-    table.scale(1.2, 1.2)
+    if cleaned_table_data:
+        table = ax_table.table(cellText=cleaned_table_data, colLabels=table_columns, cellLoc='center', loc='center')
+        table.auto_set_font_size(False)
+        table.set_fontsize(10)
+        table.scale(1.2, 1.2)
+    else:
+        ax_table.text(0.5, 0.5, f"No job was always below {idle_threshold:g}% utilization.", fontsize=12, ha='center', va='center')
 
     # Footer
     footer = "For internal use — Research Computing Services Team"
@@ -234,15 +207,47 @@ def create_quick_stats_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_utilization_chart(pdf, year_data):
+def downsample_series(series, max_points=MAX_PLOT_POINTS):
+    """
+    Downsamples a time series for plotting with largest-triangle-three-buckets.
+
+    The first and last points are kept, the others are split into max_points - 2 buckets
+    and the point of each bucket forming the largest triangle with the point kept before
+    it and the mean of the next bucket is kept. Peaks and idle dips stay visible, unlike
+    with a mean or a stride.
+
+    Parameters:
+        series (pd.Series): Values indexed by time, in order.
+        max_points (int): Number of points to keep.
+
+    Returns:
+        pd.Series: The kept points, the series itself when it is short enough.
+    """
+    n = len(series)
+    if n <= max_points or max_points < 3:
+        return series
+
+    x = series.index.values.astype("int64").astype("float64")
+    y = series.to_numpy(dtype="float64")
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+
+    kept = np.empty(max_points, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        prev_x, prev_y = x[kept[i]], y[kept[i]]
+        area = np.abs((prev_x - next_x) * (y[start:end] - prev_y) - (prev_x - x[start:end]) * (next_y - prev_y))
+        kept[i + 1] = start + int(area.argmax())
+    return series.iloc[kept]
+
+
+def create_utilization_chart(pdf, hourly_cube):
     """Create utilization time series chart"""
-    # Add gpu reserved column
-    year_data['reserved'] = year_data['scenario'] != 0
-    year_data['reserved'] = year_data['reserved'].astype(int)
-    
-    # Resample utilization by 1-hour intervals (mean utilization)
-    gpu_util_hourly = year_data.resample('1H', on='time')['reserved'].mean() * 100
-    gpu_util_hourly[gpu_util_hourly.isna()] = 0
+    # Hourly share of reserved GPUs and mean utilization
+    hourly = hourly_utilization(hourly_cube)
+    gpu_util_hourly = hourly['reserved'].fillna(0)
     
     # Define moving average window size
     window_size = 10
@@ -250,9 +255,8 @@ def create_utilization_chart(pdf, year_data):
     # Compute moving averages for smoothing
     gpu_util_hourly_smooth = gpu_util_hourly.rolling(window=window_size, min_periods=1).mean()
     
-    # Resample and compute moving average for percent utilization
-    gpu_util_hourly_util = year_data.resample('1H', on='time')['util'].mean()
-    gpu_util_hourly_util.fillna(0, inplace=True)
+    # Compute moving average for percent utilization
+    gpu_util_hourly_util = hourly['util'].fillna(0)
     gpu_util_hourly_util_smooth = gpu_util_hourly_util.rolling(window=window_size, min_periods=1).mean()
     
     fig = plt.figure(figsize=(8.5, 11))  
@@ -260,12 +264,16 @@ def create_utilization_chart(pdf, year_data):
     
     ax = fig.add_subplot(gs[0])
     
-    sns.lineplot(x=gpu_util_hourly.index, y=gpu_util_hourly_smooth.values, 
+    # Averages are taken on every hour, only the drawn lines are downsampled
+    reserved_plot = downsample_series(gpu_util_hourly_smooth)
+    util_plot = downsample_series(gpu_util_hourly_util_smooth)
+
+    sns.lineplot(x=reserved_plot.index, y=reserved_plot.values, 
                 color="blue", label="Allocated GPU Utilization (Smoothed)", ax=ax)
     ax.axhline(gpu_util_hourly_smooth.mean(), color="blue", linestyle="dashed", 
               linewidth=1, label="Allocated Utilization Avg")
     
-    sns.lineplot(x=gpu_util_hourly_util_smooth.index, y=gpu_util_hourly_util_smooth.values, 
+    sns.lineplot(x=util_plot.index, y=util_plot.values, 
                 color="red", label="Percent GPU Utilization (Smoothed)", ax=ax)
     ax.axhline(gpu_util_hourly_util_smooth.mean(), color="red", linestyle="dashed", 
               linewidth=1, label="Percent Utilization Avg")
@@ -297,22 +305,18 @@ def create_utilization_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def plot_shared_gpu_utilization(pdf, year_data, window_size=10):
+def plot_shared_gpu_utilization(pdf, hourly_cube, window_size=10):
     """Plot shared hourly GPU reserved vs. percent utilization (smoothed)"""
     
-    # Filter shared data
-    shared_filter = year_data[year_data['sb_flag'] == "S"]
-
-    # Resample utilization by 1-hour intervals (mean utilization)
-    gpu_util_hourly = shared_filter.resample('1H', on='time')['reserved'].mean() * 100
-    gpu_util_hourly.fillna(0, inplace=True)  # Fill NaNs with 0
+    # Slice the shared nodes out of the hourly cube
+    hourly = hourly_utilization(hourly_cube[hourly_cube['sb_flag'] == "S"])
+    gpu_util_hourly = hourly['reserved'].fillna(0)  # Fill NaNs with 0
 
     # Compute moving averages for smoothing
     gpu_util_hourly_smooth = gpu_util_hourly.rolling(window=window_size, min_periods=1).mean()
 
-    # Resample and compute moving average for percent utilization
-    gpu_util_hourly_util = shared_filter.resample('1H', on='time')['util'].mean()
-    gpu_util_hourly_util.fillna(0, inplace=True)  # Fill NaNs with 0
+    # Compute moving average for percent utilization
+    gpu_util_hourly_util = hourly['util'].fillna(0)  # Fill NaNs with 0
     gpu_util_hourly_util_smooth = gpu_util_hourly_util.rolling(window=window_size, min_periods=1).mean()
 
     # Set up the full 8.5x11 figure
@@ -322,12 +326,16 @@ def plot_shared_gpu_utilization(pdf, year_data, window_size=10):
     ### ---- PLOT SECTION ---- ###
     ax = fig.add_subplot(gs[0])
 
+    # Averages are taken on every hour, only the drawn lines are downsampled
+    reserved_plot = downsample_series(gpu_util_hourly_smooth)
+    util_plot = downsample_series(gpu_util_hourly_util_smooth)
+
     # Plot Reserved Utilization (Job Allocation)
-    sns.lineplot(x=gpu_util_hourly.index, y=gpu_util_hourly_smooth.values, color="blue", label="Reserved GPU Utilization (Smoothed)", ax=ax)
+    sns.lineplot(x=reserved_plot.index, y=reserved_plot.values, color="blue", label="Reserved GPU Utilization (Smoothed)", ax=ax)
     ax.axhline(gpu_util_hourly_smooth.mean(), color="blue", linestyle="dashed", linewidth=1, label="Reserved Utilization Avg")
 
     # Plot Percent Utilization (Actual Usage)
-    sns.lineplot(x=gpu_util_hourly_util_smooth.index, y=gpu_util_hourly_util_smooth.values, color="red", label="Percent GPU Utilization (Smoothed)", ax=ax)
+    sns.lineplot(x=util_plot.index, y=util_plot.values, color="red", label="Percent GPU Utilization (Smoothed)", ax=ax)
     ax.axhline(gpu_util_hourly_util_smooth.mean(), color="red", linestyle="dashed", linewidth=1, label="Percent Utilization Avg")
 
     # Labels and title
@@ -366,10 +374,10 @@ def plot_shared_gpu_utilization(pdf, year_data, window_size=10):
     pdf.savefig(fig)
 
 
-def create_top_users_chart(pdf, year_data):
+def create_top_users_chart(pdf, job_summary):
     """Create top users chart"""
-    top_users = year_data[year_data['scenario']!=0].groupby("owner")["reserved"].sum().nlargest(10)
-    top_projects = year_data[year_data['scenario']!=0].groupby("project_y")["reserved"].sum().nlargest(10)
+    top_users = job_summary.groupby("owner")["reserved"].sum().nlargest(10)
+    top_projects = job_summary.groupby("project_y")["reserved"].sum().nlargest(10)
     
     sns.set_theme(style="whitegrid")
     
@@ -411,26 +419,13 @@ def create_top_users_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_usage_breakdown_charts(pdf, year_data):
+def create_usage_breakdown_charts(pdf, job_summary):
     """Create charts breaking down GPU hours by users and projects, also by shared or buy-in resources."""
-
-    # Group by job_id and calculate GPU hours
-    job_utilization = year_data.groupby(["owner", "job_id"]).agg({
-        "util": "mean",  # Mean of util
-        "reserved": "sum",  # Sum of reserved GPU (to compute GPU hours)
-        "project_y": "first",  # Keep project name
-        "class_user": "first",  # Shared or Buy-in
-    }).reset_index()
-
-    # Convert class ownership to readable categories
-    job_utilization["class_type"] = job_utilization["class_user"].apply(lambda x: "Shared" if x == "shared" else "Buy-in")
-
-    # Convert reserved GPUs into GPU hours
-    job_utilization["gpu_hours"] = job_utilization["reserved"] / 12
+    sns.set_theme(style="whitegrid")
 
     # Separate data into buy-in and shared jobs
-    buy_in_jobs = job_utilization[job_utilization["class_type"] == "Buy-in"]
-    shared_jobs = job_utilization[job_utilization["class_type"] == "Shared"]
+    buy_in_jobs = job_summary[job_summary["class_type"] == "Buy-in"]
+    shared_jobs = job_summary[job_summary["class_type"] == "Shared"]
 
     # Get top 10 users and projects by GPU hours for buy-in jobs
     top_buy_in_users = buy_in_jobs.groupby("owner")["gpu_hours"].sum().nlargest(10)
@@ -493,10 +488,12 @@ def create_usage_breakdown_charts(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_low_utilization_chart(pdf, year_data):
+def create_low_utilization_chart(pdf, job_summary, idle_threshold=LOW_UTIL_THRESHOLD):
     """Create low utilization chart"""
-    zero_util_users = year_data[(year_data['util'] <= 5) & (year_data['scenario'] != 0)].groupby('owner').size().reset_index(name='zero_util_count')
-    zero_util_projects = year_data[(year_data['util'] <= 5) & (year_data['scenario'] != 0)].groupby('project_y').size().reset_index(name='zero_util_count')
+    # Jobs with reserved samples below the idle threshold
+    low_util_jobs = job_summary[job_summary['low_util'] > 0]
+    zero_util_users = low_util_jobs.groupby('owner')['low_util'].sum().reset_index(name='zero_util_count')
+    zero_util_projects = low_util_jobs.groupby('project_y')['low_util'].sum().reset_index(name='zero_util_count')
     
     zero_util_users_sorted = zero_util_users.sort_values('zero_util_count', ascending=False).head(10)
     zero_util_projects_sorted = zero_util_projects.sort_values('zero_util_count', ascending=False).head(10)
@@ -512,14 +509,14 @@ def create_low_utilization_chart(pdf, year_data):
     ax1 = fig.add_subplot(gs[0])
     
     sns.barplot(x='zero_util_count', y='owner', data=zero_util_users_sorted, palette='Reds_d', ax=ax1)
-    ax1.set_title('Top 10 Users with Low GPU Utilization (<5%)', fontsize=14)
+    ax1.set_title(f'Top 10 Users with Low GPU Utilization (<{idle_threshold:g}%)', fontsize=14)
     ax1.set_xlabel('Low Utilization Hours', fontsize=12)
     ax1.set_ylabel('User', fontsize=12)
     
     ax2 = fig.add_subplot(gs[1])
     
     sns.barplot(x='zero_util_count', y='project_y', data=zero_util_projects_sorted, palette='Oranges_d', ax=ax2)
-    ax2.set_title('Top 10 Projects with Low GPU Utilization (<5%)', fontsize=14)
+    ax2.set_title(f'Top 10 Projects with Low GPU Utilization (<{idle_threshold:g}%)', fontsize=14)
     ax2.set_xlabel('Low Utilization Hours', fontsize=12)
     ax2.set_ylabel('Project', fontsize=12)
     
@@ -528,7 +525,7 @@ def create_low_utilization_chart(pdf, year_data):
     
     description = (
         "This visualization identifies inefficient GPU resource allocation by highlighting users and projects with "
-        "consistently low GPU utilization (below 5%). The top chart (red) shows the users who have the most hours "
+        f"consistently low GPU utilization (below {idle_threshold:g}%). The top chart (red) shows the users who have the most hours "
         "of GPU allocation with minimal actual usage, while the bottom chart (orange) shows projects with similar "
         "patterns. "
     )
@@ -544,16 +541,15 @@ def create_low_utilization_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_low_utilization_chart_by_class(pdf, year_data):
+def create_low_utilization_chart_by_class(pdf, job_summary, idle_threshold=LOW_UTIL_THRESHOLD):
     """Create low utilization chart split by shared vs buy-in"""
-    # Filter data for low utilization
-    low_util_data = year_data[(year_data['util'] <= 5) & (year_data['scenario'] != 0)]
-    low_util_data['class_type'] = low_util_data['class_user'].apply(lambda x: "Shared" if x == "shared" else "Buy-in")
+    # Filter jobs with low utilization samples
+    low_util_jobs = job_summary[job_summary['low_util'] > 0]
 
     # Group by owner and class type
-    zero_util_users = low_util_data.groupby(['owner', 'class_type']).size().reset_index(name='zero_util_count')
+    zero_util_users = low_util_jobs.groupby(['owner', 'class_type'])['low_util'].sum().reset_index(name='zero_util_count')
     # Group by project and class type
-    zero_util_projects = low_util_data.groupby(['project_y', 'class_type']).size().reset_index(name='zero_util_count')
+    zero_util_projects = low_util_jobs.groupby(['project_y', 'class_type'])['low_util'].sum().reset_index(name='zero_util_count')
 
     # Calculate hours from counts
     zero_util_users['zero_util_count'] /= 12
@@ -596,7 +592,7 @@ def create_low_utilization_chart_by_class(pdf, year_data):
     # Add explanatory text at the bottom
     text_box = fig.add_axes([0.1, 0.01, 0.8, 0.1])  # Positioning within 8.5x11 layout
     text_box.text(0.5, 0.5, 
-        "This page highlights GPU hours consumed by users and projects with low utilization (<5%).\n"
+        f"This page highlights GPU hours consumed by users and projects with low utilization (<{idle_threshold:g}%).\n"
         "Charts are split by class type (Buy-in vs Shared).",
         fontsize=10, ha="center", va="center", wrap=True)
     text_box.set_xticks([])
@@ -611,19 +607,10 @@ def create_low_utilization_chart_by_class(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_job_type_chart(pdf, year_data):
+def create_job_type_chart(pdf, job_summary):
     """Create job type chart"""
-    df = year_data.copy()
-    
-    df["job_type"] = df["class_user"].str.capitalize()
-    df["execution_type"] = df["job_interactive"].apply(lambda x: "On-Demand/Interactive" if x else "Batch")
-    df["gpu_hours"] = df["reserved"] / 12
-    
-    grouped_df = df.groupby(["owner", "job_id"]).agg({
-        "job_type": "first",
-        "execution_type": "first",
-        "gpu_hours": "sum"
-    }).reset_index()
+    sns.set_theme(style="whitegrid")
+    grouped_df = job_summary
     
     job_count_by_type = grouped_df["job_type"].value_counts()
     job_count_by_execution = grouped_df["execution_type"].value_counts()
@@ -692,19 +679,10 @@ def create_job_type_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_stacked_job_chart(pdf, year_data):
+def create_stacked_job_chart(pdf, job_summary):
     """Create stacked job chart with percentage proportions"""
-    df = year_data.copy()
-    
-    df["job_type"] = df["class_user"].str.capitalize()
-    df["execution_type"] = df["job_interactive"].apply(lambda x: "On-Demand/Interactive" if x else "Batch")
-    df["gpu_hours"] = df["reserved"] / 12
-    
-    grouped_df = df.groupby(["owner", "job_id"]).agg({
-        "job_type": "first",
-        "execution_type": "first",
-        "gpu_hours": "sum"
-    }).reset_index()
+    sns.set_theme(style="whitegrid")
+    grouped_df = job_summary
     
     job_count_stacked = grouped_df.groupby(["job_type", "execution_type"]).size().unstack(fill_value=0)
     gpu_hours_stacked = grouped_df.groupby(["job_type", "execution_type"])["gpu_hours"].sum().unstack(fill_value=0)
@@ -767,17 +745,11 @@ def create_stacked_job_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_n_gpu_chart(pdf, year_data):
+def create_n_gpu_chart(pdf, job_summary):
     """Create table summarizing the distribution of GPUs per job"""
-    df = year_data.copy()
-    
-    # Group data by owner and job_id and get the first n_gpu value for each job
-    grouped_df = df.groupby(["owner", "job_id"]).agg({
-        "n_gpu": "first",
-    }).reset_index()
-    
+    sns.set_theme(style="whitegrid")
     # Calculate the distribution of GPUs per job
-    gpu_distribution = grouped_df["n_gpu"].dropna().value_counts().sort_index()
+    gpu_distribution = job_summary["n_gpu"].dropna().value_counts().sort_index()
     gpu_distribution_percentage = (gpu_distribution / gpu_distribution.sum()) * 100
 
     # Create a DataFrame to display in the table
@@ -825,25 +797,12 @@ def create_n_gpu_chart(pdf, year_data):
     plt.close(fig)
 
 
-def create_no_usage_chart(pdf, year_data):
+def create_no_usage_chart(pdf, job_summary, idle_threshold=LOW_UTIL_THRESHOLD):
     """Create gpu no usage gpu hours chart"""
-    
-    # Group by job_id and check if ALL time points for the job were under 5%
-    job_utilization = year_data.groupby(["owner", "job_id"]).agg({
-        "util": lambda x: (x < 5).all(),  # True if all time points were <5%
-        "reserved": "sum",  # Sum of reserved GPU (to compute GPU hours)
-        "project_y": "first",  # Keep project name
-        "job_interactive": "first"  # Execution type
-    }).reset_index()
-
-    # Filter only jobs that were always <5% utilization
-    low_util_jobs = job_utilization[job_utilization["util"]]
-
-    # Convert execution type to readable categories
-    low_util_jobs["execution_type"] = low_util_jobs["job_interactive"].apply(lambda x: "On-Demand/Interactive" if x else "Batch")
+    sns.set_theme(style="whitegrid")
 
-    # Convert reserved GPUs into GPU hours
-    low_util_jobs["gpu_hours"] = low_util_jobs["reserved"] / 12
+    # Filter only jobs that were always below the idle threshold
+    low_util_jobs = job_summary[job_summary["util_all_below"]]
 
     # Get top 10 users and projects by low-utilization GPU hours
     low_util_users = low_util_jobs.groupby("owner")["gpu_hours"].sum().nlargest(10)
@@ -868,14 +827,16 @@ def create_no_usage_chart(pdf, year_data):
     palette = {"On-Demand/Interactive": "skyblue", "Batch": "darkblue"}
 
     # Plot top users with breakdown
-    low_util_users_breakdown.plot(kind="barh", stacked=True, ax=axes[0], color=palette)
+    if not low_util_users_breakdown.empty:
+        low_util_users_breakdown.plot(kind="barh", stacked=True, ax=axes[0], color=palette)
     axes[0].set_title("Top Users with Low Utilization GPU Hours (Interactive vs Batch)", fontsize=14)
     axes[0].set_xlabel("Total GPU Hours", fontsize=12)
     axes[0].set_ylabel("User", fontsize=12)
     axes[0].legend(title="Job Type", loc="upper right")
 
     # Plot top projects with breakdown
-    low_util_projects_breakdown.plot(kind="barh", stacked=True, ax=axes[1], color=palette)
+    if not low_util_projects_breakdown.empty:
+        low_util_projects_breakdown.plot(kind="barh", stacked=True, ax=axes[1], color=palette)
     axes[1].set_title("Top Projects with Low Utilization GPU Hours (Interactive vs Batch)", fontsize=14)
     axes[1].set_xlabel("Total GPU Hours", fontsize=12)
     axes[1].set_ylabel("Project", fontsize=12)
@@ -884,7 +845,7 @@ def create_no_usage_chart(pdf, year_data):
     # Add explanatory text at the bottom
     text_box = fig.add_axes([0.1, 0.05, 0.8, 0.2])  # Positioning within 8.5x11 layout
     text_box.text(0.5, 0.5, 
-        "This page highlights GPU hours consumed by jobs that were always under 5% utilization.\n"
+        f"This page highlights GPU hours consumed by jobs that were always under {idle_threshold:g}% utilization.\n"
         "Bars are split by job execution type (Interactive vs. Batch).",
         fontsize=12, ha="center", va="center", wrap=True)
     text_box.set_xticks([])
@@ -899,26 +860,11 @@ def create_no_usage_chart(pdf, year_data):
     pdf.savefig(fig)
 
 
-def create_no_usage_chart_by_class(pdf, year_data):
+def create_no_usage_chart_by_class(pdf, job_summary, idle_threshold=LOW_UTIL_THRESHOLD):
     """Create GPU no usage GPU hours chart split by shared vs buy-in"""
 
-    # Group by job_id and check if ALL time points for the job were under 5%
-    job_utilization = year_data.groupby(["owner", "job_id"]).agg({
-        "util": lambda x: (x < 5).all(),  # True if all time points were <5%
-        "reserved": "sum",  # Sum of reserved GPU (to compute GPU hours)
-        "project_y": "first",  # Keep project name
-        "class_user": "first",  # Shared or Buy-in
-        "job_interactive": "first"  # Execution type
-    }).reset_index()
-
-    # Filter only jobs that were always <5% utilization
-    low_util_jobs = job_utilization[job_utilization["util"]]
-
-    # Convert class ownership to readable categories
-    low_util_jobs["class_type"] = low_util_jobs["class_user"].apply(lambda x: "Shared" if x == "shared" else "Buy-in")
-
-    # Convert reserved GPUs into GPU hours
-    low_util_jobs["gpu_hours"] = low_util_jobs["reserved"] / 12
+    # Filter only jobs that were always below the idle threshold
+    low_util_jobs = job_summary[job_summary["util_all_below"]]
 
     # Separate data into buy-in and shared jobs
     buy_in_jobs = low_util_jobs[low_util_jobs["class_type"] == "Buy-in"]
@@ -963,7 +909,7 @@ def create_no_usage_chart_by_class(pdf, year_data):
     # Add explanatory text at the bottom
     text_box = fig.add_axes([0.1, 0.01, 0.8, 0.1])  # Positioning within 8.5x11 layout
     text_box.text(0.5, 0.5, 
-        "This page highlights GPU hours consumed by jobs that were always under 5% utilization.\n"
+        f"This page highlights GPU hours consumed by jobs that were always under {idle_threshold:g}% utilization.\n"
         "Charts are split by class type (Buy-in vs Shared).",
         fontsize=10, ha="center", va="center", wrap=True)
     text_box.set_xticks([])
@@ -978,78 +924,300 @@ def create_no_usage_chart_by_class(pdf, year_data):
     pdf.savefig(fig)
 
 
-def main():
-    # Parse command line arguments
-    args = parse_arguments()
+def report_tables(job_sums, hourly_cube, host_owner, node_status_mapping, idle_threshold=LOW_UTIL_THRESHOLD):
+    """
+    Turns the reducers fed with a report's records into the tables its pages are drawn from.
+
+    Parameters:
+        job_sums (JobSummary): Job sums of the report's records.
+        hourly_cube (HourlyCube): Hourly cube of the report's records.
+        host_owner (pd.DataFrame): node and sb_flag (shared or buy-in) of the cluster nodes.
+        node_status_mapping (dict): Queue name to class_user.
+        idle_threshold (float): Utilization (%) below which GPUs count as idle.
+
+    Returns:
+        tuple: (hourly cube, job summary) DataFrames, restricted to the cluster nodes.
+    """
+    hourly = hourly_cube.result().merge(host_owner, on="node")
+    hourly['class_user'] = hourly['qname'].map(node_status_mapping)
+    job_summary = job_sums.result(nodes=host_owner["node"], queue_classes=node_status_mapping,
+                                  threshold=idle_threshold)
+    return hourly, job_summary
+
+
+class _FigureCollector:
+    """
+    Stands in for PdfPages when a page is drawn as a task, keeping the figures it saves.
+
+    Tick positions and labels are only laid out when a figure is saved, from the
+    matplotlib settings of that moment, so they are kept along with each figure.
+    """
+
+    def __init__(self):
+        self.figures = []
+
+    def savefig(self, figure=None, **kwargs):
+        rc = {key: value for key, value in matplotlib.rcParams.items() if key != "backend"}
+        self.figures.append((figure if figure is not None else plt.gcf(), rc))
+
+
+def _render_page(task):
+    """
+    Draws one page of a report, in this process or in a worker process.
+
+    Each page starts from the default matplotlib settings, so its look does not depend on
+    the pages drawn before it in the same process, and its figures are closed before
+    they are returned (pickled, with the process backend).
+
+    Parameters:
+        task (tuple): (page function, arguments after pdf).
+
+    Returns:
+        list: (figure, matplotlib settings to save it with) of every figure the page saved.
+    """
+    page, args = task
+    collector = _FigureCollector()
+    try:
+        with plt.rc_context(), profile_stage(f"page:{page.__name__}"):
+            page(collector, *args)
+    finally:
+        for figure, _ in collector.figures:
+            plt.close(figure)
+        plt.close("all")
+    return collector.figures
+
+
+def create_report(output, year_month_date, hourly_cube, job_summary, year_data=None,
+                  project=None, user=None, qname=None, end_date=None, render_jobs=1,
+                  idle_threshold=LOW_UTIL_THRESHOLD):
+    """
+    Renders every page of a report into a PDF file.
+
+    Every page is a task drawn by _render_page, in this process or, with render_jobs
+    above 1, in a pool of worker processes. Pages are saved to the PDF in order as soon
+    as they are drawn, so only a few figures are held in memory at once.
+
+    Parameters:
+        output (str): PDF filename.
+        year_month_date (datetime): First month of the report.
+        hourly_cube (pd.DataFrame): Hourly cube from report_tables.
+        job_summary (pd.DataFrame): Job summary from report_tables.
+        year_data (pd.DataFrame): Records of a filtered report, for its quick stats page.
+        project, user, qname (str): Filters the report was made with, if any.
+        end_date (datetime): Last month of the report, for reports over several months.
+        render_jobs (int): Number of worker processes drawing the pages.
+        idle_threshold (float): Utilization (%) below which GPUs count as idle.
+    """
+    filtered = project or user or qname
+
+    # Title page
+    pages = [(create_title_page, (year_month_date, project, user, qname, end_date))]
+
+    # Charts
+    if filtered:
+        pages.append((create_quick_stats_chart, (year_data, job_summary, idle_threshold)))
+    pages.append((create_utilization_chart, (hourly_cube,)))
+    pages.append((plot_shared_gpu_utilization, (hourly_cube,)))
+    pages.append((create_top_users_chart, (job_summary,)))
+    if not filtered:
+        pages.append((create_usage_breakdown_charts, (job_summary,)))
+    for page in (create_low_utilization_chart, create_low_utilization_chart_by_class):
+        pages.append((page, (job_summary, idle_threshold)))
+    for page in (create_job_type_chart, create_stacked_job_chart, create_n_gpu_chart):
+        pages.append((page, (job_summary,)))
+    for page in (create_no_usage_chart, create_no_usage_chart_by_class):
+        pages.append((page, (job_summary, idle_threshold)))
+
+    with PdfPages(output) as pdf:
+        for figures in map_tasks(_render_page, pages, backend="process", n_jobs=render_jobs):
+            for figure, rc in figures:
+                with plt.rc_context(rc), profile_stage("savefig", output=os.path.basename(output)):
+                    pdf.savefig(figure)
+
+
+def _render_entity_report(task):
+    """Renders the report of one user, project or queue of a batch, in a worker process"""
+    output, kind, entity, year_month_date, entity_data, host_owner, node_status_mapping, idle_threshold = task
+    with profile_stage("report_tables", **{kind: entity}, rows=len(entity_data)):
+        job_sums, hourly_cube = JobSummary(), HourlyCube()
+        job_sums.update(entity_data)
+        hourly_cube.update(entity_data)
+        hourly_cube, job_summary = report_tables(job_sums, hourly_cube, host_owner, node_status_mapping,
+                                                 idle_threshold)
+    if job_summary.empty or hourly_cube.empty:
+        # Only samples on nodes outside the cluster list: nothing to draw
+        print(f"Skipping report of {kind} {entity}: no GPU usage on the cluster nodes")
+        return None
+    create_report(output, year_month_date, hourly_cube, job_summary,
+                  entity_data.merge(host_owner, on="node"), **{kind: entity}, idle_threshold=idle_threshold)
+    return output
+
+
+def create_batch_reports(args, host_owner, node_status_mapping):
+    """
+    Generates one report per user, project or queue of a month from a single data load.
+
+    The month is read and joined once, in the compact schema and keeping only
+    REPORT_COLUMNS; when the entities are listed, only the samples of their jobs are read
+    (see job_filter in iter_gpu_data). Each entity's records are then summarized and
+    rendered in a process pool (args.jobs workers), to
+    <output dir>/gpu_report_<kind>_<entity>_<YYMM>.pdf. Each report is the one
+    reportgenerator.py -u/-p/-q would produce for that entity.
+
+    Parameters:
+        args (argparse.Namespace): Parsed command line arguments, with args.batch set.
+        host_owner (pd.DataFrame): node and sb_flag (shared or buy-in) of the cluster nodes.
+        node_status_mapping (dict): Queue name to class_user.
+    """
+    year, month = args.year, args.month
+    column, accounting_column = BATCH_COLUMNS[args.batch]
+    job_filter = {accounting_column: list(args.entities)} if args.entities else None
+    year_month_date = datetime.strptime("20" + year + '-' + month, "%Y-%m")
 
+    # Load the whole month once
+    job_sums = JobSummary()
+    node_dfs = []
+    for node_df in iter_gpu_data(year, month, use_cache=not args.no_cache, incremental=args.incremental,
+                                 compact=True, backend=args.backend, n_jobs=args.jobs,
+                                 job_filter=job_filter):
+        with profile_stage("reduce", rows=len(node_df)):
+            job_sums.update(node_df)
+            node_dfs.append(node_df[REPORT_COLUMNS])
+    if not node_dfs:
+        print("No GPU usage found for the selected month")
+        return
+    year_data = concat_gpu_frames(node_dfs)
+    del node_dfs
+
+    # Entities of the month with enough GPU hours, largest first
+    gpu_hours = job_sums.result(nodes=host_owner["node"], queue_classes=node_status_mapping)\
+        .groupby(column)["gpu_hours"].sum().sort_values(ascending=False)
+    entities = args.entities or list(gpu_hours.index)
+    entities = [entity for entity in entities if gpu_hours.get(entity, 0) >= args.min_gpu_hours]
+    rows = year_data.groupby(column, observed=True).indices
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def tasks():
+        for entity in entities:
+            if entity not in rows:
+                print(f"No GPU usage found for {args.batch} {entity}")
+                continue
+            name = re.sub(r"[^\w.-]", "_", str(entity))
+            output = os.path.join(args.output_dir, f"gpu_report_{args.batch}_{name}_{year}{month}.pdf")
+            yield (output, args.batch, entity, year_month_date, year_data.take(rows[entity]),
+                   host_owner, node_status_mapping, args.idle_threshold)
+
+    for output in map_tasks(_render_entity_report, tasks(), backend="process", n_jobs=args.jobs):
+        if output is not None:
+            print(f"Report saved as {output}")
+
+
+def generate_report(args):
+    """Generates the report, or the batch of reports, described by the command line arguments"""
     # Define year and month from arguments
     year, month = args.year, args.month
+    filtered = args.user or args.project or args.qname
+
+    # Months covered by the report
+    if args.range:
+        months = months_in_range(f"{args.range[0]}-01", f"{args.range[1]}-01")
+    elif month == "all":
+        months = months_in_range(f"20{year}-01-01", f"20{year}-12-01")
+    else:
+        months = [(year, month)]
     
-    # Set up PDF output file
-    pdf = PdfPages(args.output)
-    
-    # Parse date for report
-    year_month_date = datetime.strptime("20" + year + '-' + month, "%Y-%m")
-    
-    # Create title page
-    create_title_page(pdf, year_month_date, args.project, args.user, args.qname)
-    
-    # Process GPU data
-    year_data = process_gpu_data(year, month)
+    # Parse dates for report
+    year_month_date = datetime.strptime("20" + months[0][0] + '-' + months[0][1], "%Y-%m")
+    end_date = datetime.strptime("20" + months[-1][0] + '-' + months[-1][1], "%Y-%m")
 
     # Get shared/buyin data
-    host_owner = get_cluster_node_info()
-    host_owner = host_owner[["host", "flag"]]
-    host_owner.columns = ["node", "sb_flag"]
-    year_data = year_data.merge(host_owner, on="node")
-
-    # If project is specified, we mask the dataframe
-    if args.project:
-        year_data = year_data[year_data['project_y'] == args.project]
+    with profile_stage("get_cluster_node_info") as stage:
+        host_owner = get_cluster_node_info()
+        host_owner = host_owner[["host", "flag"]]
+        host_owner.columns = ["node", "sb_flag"]
+        stage["rows"] = len(host_owner)
+
+    # Load node status
+    with profile_stage("queue_info") as stage:
+        node_status = pd.read_csv('/projectnb/scv/utilization/katia/queue_info.csv')
+        node_status_mapping = node_status.set_index('queuename')['class_user'].to_dict()
+        stage["rows"] = len(node_status)
+
+    if args.batch:
+        create_batch_reports(args, host_owner, node_status_mapping)
+        return
+
+    year_data = None
+    if args.range or month == "all":
+        # Assemble the report from the monthly rollups, building the missing ones
+        with profile_stage("rollups", months=len(months)):
+            rollups = load_rollups(months, backend=args.backend, n_jobs=args.jobs, refresh=args.refresh_rollups)
+        job_sums, hourly_cube = rollups["jobs"], rollups["hourly"]
+    else:
+        # Project, user and queue filters are applied to the accounting rows first, so only
+        # the samples of the selected jobs, on the nodes they ran on, are read and joined
+        job_filter = {
+            column: value
+            for column, value in (("project", args.project), ("owner", args.user), ("qname", args.qname))
+            if value
+        }
+
+        # Process GPU data node by node, folding each node into the job sums and the hourly cube
+        job_sums, hourly_cube, job_metrics, quantiles = JobSummary(), HourlyCube(), JobMetrics(), QuantileSketches()
+        node_dfs = []
+        accounting = accounting_sizes(year)
+        for node_df in iter_gpu_data(year, month, use_cache=not args.no_cache, incremental=args.incremental,
+                                     backend=args.backend, n_jobs=args.jobs, job_filter=job_filter):
+            with profile_stage("reduce", rows=len(node_df)):
+                job_sums.update(node_df)
+                hourly_cube.update(node_df)
+                if not filtered:
+                    job_metrics.update(node_df)
+                    quantiles.update(node_df)
+                node_dfs.append(node_df)
+        if not node_dfs:
+            print("No GPU usage found for the selected month and filters")
+            return
+        year_data = pd.concat(node_dfs, ignore_index=True)
+
+        # Keep the month's rollup for yearly and range reports once the month is over
+        if not filtered and is_closed(year, month):
+            try:
+                write_rollup(year, month, {"jobs": job_sums, "hourly": hourly_cube, "metrics": job_metrics,
+                                           "quantiles": quantiles}, accounting=accounting)
+            except ImportError as e:
+                print(f"Rollup not stored: {e}")
+
+        with profile_stage("node_info_join") as stage:
+            year_data = year_data.merge(host_owner, on="node")
+            stage["rows"] = len(year_data)
+        print(f"Percent NaN from GPU Util: {float(year_data[year_data['scenario']!=0]['qname'].isna().mean()):.2%}")
+        print(f"Percent Duplicate from GPU Util: {float(year_data.duplicated().mean()):.2%}")
+
+    # Hourly series and one row per job, on the nodes of the cluster
+    with profile_stage("report_tables") as stage:
+        hourly_cube, job_summary = report_tables(job_sums, hourly_cube, host_owner, node_status_mapping,
+                                                 args.idle_threshold)
+        stage["rows"] = len(job_summary)
+
+    create_report(args.output, year_month_date, hourly_cube, job_summary, year_data,
+                  args.project, args.user, args.qname, end_date, args.render_jobs, args.idle_threshold)
+    print(f"Report saved as {args.output}")
 
-    # If user is specified, we mask the dataframe
-    if args.user:
-        year_data = year_data[year_data['owner'] == args.user]
 
-    # qname
-    if args.qname:
-        year_data = year_data[year_data['qname'] == args.qname]
+def main():
+    # Parse command line arguments
+    args = parse_arguments()
 
-    print(f"Percent NaN from GPU Util: {float(year_data[year_data['scenario']!=0]['qname'].isna().mean()):.2%}")
-    print(f"Percent Duplicate from GPU Util: {float(year_data.duplicated().mean()):.2%}")
-    
-    # Load and map node status
-    node_status = pd.read_csv('/projectnb/scv/utilization/katia/queue_info.csv')
-    node_status_mapping = node_status.set_index('queuename')['class_user'].to_dict()
-    year_data['class_user'] = year_data['qname'].map(node_status_mapping)
-    node_status_mapping = node_status.set_index('queuename')['class_user'].to_dict()
-    year_data['class_user'] = year_data['qname'].map(node_status_mapping)
-    
-    # Determine if job is interactive
-    year_data['job_interactive'] = (year_data['job_name'].str.startswith("ood")) | (year_data['job_name'] == "QRLOGIN")
-    
-    # Convert 'time' to datetime
-    year_data['time'] = pd.to_datetime(year_data['time'], unit='s')
-    
-    # Create charts
-    if args.user or args.project or args.qname:
-        create_quick_stats_chart(pdf, year_data)
-    create_utilization_chart(pdf, year_data)
-    plot_shared_gpu_utilization(pdf, year_data)
-    create_top_users_chart(pdf, year_data)
-    if not (args.user or args.project or args.qname):
-        create_usage_breakdown_charts(pdf, year_data)
-    create_low_utilization_chart(pdf, year_data)
-    create_low_utilization_chart_by_class(pdf, year_data)
-    create_job_type_chart(pdf, year_data)
-    create_stacked_job_chart(pdf, year_data)
-    create_n_gpu_chart(pdf, year_data)
-    create_no_usage_chart(pdf, year_data)
-    create_no_usage_chart_by_class(pdf, year_data)
-    
-    # Close the PDF
-    pdf.close()
-    print(f"Report saved as {args.output}")
+    if args.profile:
+        start_profiling(cpu=args.profile_cpu, memory=args.profile_memory)
+    try:
+        generate_report(args)
+    finally:
+        if args.profile:
+            print_summary(stop_profiling(args.profile))
+            print(f"Profile saved as {args.profile}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,374 @@
+import argparse
+import calendar
+import os
+import shutil
+import time
+import pandas as pd
+from reducers import QUANTILES, HourlyCube, JobMetrics, JobSummary, QuantileSketches, reduce_gpu_data
+from tracked_files import read_json, write_json
+
+# Where the monthly rollups are kept
+ROLLUP_DIR = os.environ.get(
+    "GPU_UTIL_ROLLUP_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "gpu_util", "rollups")
+)
+META_FILE = "meta.json"
+# Bump whenever the reducers of TABLES change, older rollups are then rebuilt
+ROLLUP_VERSION = 6
+# Days after the end of a month before it counts as closed and its rollup is kept, once
+# its gpustats files have stopped growing. Jobs still running then have no accounting row
+# yet, their samples are recorded as pending in the rollup (see pending_jobs)
+CLOSE_AFTER_DAYS = 3
+# Reducer states written for every month, one parquet file each
+TABLES = {"jobs": JobSummary, "hourly": HourlyCube, "metrics": JobMetrics, "quantiles": QuantileSketches}
+
+
+def rollup_dir(year: str, month: str, root: str = None) -> str:
+    """Directory of one month's rollup, <root>/<YYMM>"""
+    return os.path.join(root or ROLLUP_DIR, f"{year}{month}")
+
+
+def is_closed(year: str, month: str, now: float = None) -> bool:
+    """True once CLOSE_AFTER_DAYS days have passed since the end of the month"""
+    first_day = (2000 + int(year), int(month), 1)
+    next_month = (first_day[0] + first_day[1] // 12, first_day[1] % 12 + 1, 1)
+    closes = calendar.timegm(next_month + (0, 0, 0)) + CLOSE_AFTER_DAYS * 86400
+    return (now or time.time()) >= closes
+
+
+def month_sources(year: str, month: str) -> dict:
+    """
+    Fingerprints the gpustats files a month's rollup is built from.
+
+    Returns:
+        dict: {path: [size, mtime_ns]} for every node file of the month.
+    """
+    from helpers import list_gpu_files
+
+    sources = {}
+    for node, file_name in list_gpu_files(year, month):
+        stat = os.stat(file_name)
+        sources[os.path.abspath(file_name)] = [stat.st_size, stat.st_mtime_ns]
+    return sources
+
+
+def accounting_sizes(year: str) -> dict:
+    """
+    Fingerprints the accounting files the jobs of a month's rollup are matched with.
+
+    Returns:
+        dict: {path: size} of the accounting files of the year, the one before and after.
+    """
+    from helpers import accounting_sources
+
+    return {os.path.abspath(path): os.path.getsize(path) for path in accounting_sources(year)
+            if os.path.exists(path)}
+
+
+def pending_jobs(year: str, month: str, reducers: dict) -> list:
+    """
+    Job ids of the month's samples that no accounting row matched.
+
+    Such samples (scenario != 0) are left out of the rollup. Most belong to jobs that were
+    still running when it was built, whose accounting row is only written when they end;
+    see pending_appeared.
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        month (str): Two-digit month string (e.g., "01" for January).
+        reducers (dict): The month's reducers, see write_rollup.
+
+    Returns:
+        list: Sorted gpustats job ids.
+    """
+    from helpers import list_gpu_files, load_gpu_file
+
+    state = reducers["jobs"].state
+    matched = set() if state is None else set(state.index.get_level_values("job_id"))
+    seen = set()
+    for node, file_name in list_gpu_files(year, month):
+        try:
+            records = load_gpu_file(file_name)
+        except Exception:
+            continue
+        seen.update(records["job_id"][records["scenario"] != 0].dropna().unique())
+    return sorted(seen - matched)
+
+
+def pending_appeared(year: str, meta: dict) -> bool:
+    """
+    Whether one of the pending jobs of a rollup got an accounting row after it was built.
+
+    The accounting index (accounting_index.py) gives the byte offset of the rows of the
+    pending job numbers; rows past the sizes recorded in the rollup were added since.
+    Job numbers are recycled, so an old row of the same number does not count.
+    """
+    from accounting_index import lookup
+
+    numbers = {job_id.split(".")[0] for job_id in meta["pending"]}
+    numbers = [int(number) for number in numbers if number.isdigit()]
+    try:
+        matches = lookup(list(accounting_sizes(year)), job_numbers=numbers)
+    except ImportError:
+        # No index without pyarrow, rebuild rather than keep missing jobs
+        return True
+    return any((entries["offset"] >= meta["accounting"].get(path, 0)).any()
+               for path, entries in matches.items())
+
+
+def read_meta(path: str) -> dict:
+    """Reads a rollup's meta.json, returning None when it is missing or unreadable"""
+    return read_json(os.path.join(path, META_FILE))
+
+
+def read_rollup(year: str, month: str, root: str = None, sources: dict = None) -> dict:
+    """
+    Reads a month's rollup, if it exists and is up to date.
+
+    A rollup is stale when it was written by another ROLLUP_VERSION, when a gpustats
+    file of the month was added, removed or modified since, or when the accounting files
+    grew and now hold the row of one of its pending jobs (see pending_jobs).
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        month (str): Two-digit month string (e.g., "01" for January).
+        root (str): Rollup root, defaults to ROLLUP_DIR.
+        sources (dict): month_sources() of the month, listed when not given.
+
+    Returns:
+        dict: {"jobs": JobSummary, "hourly": HourlyCube, "metrics": JobMetrics,
+            "quantiles": QuantileSketches} with their states, or None.
+    """
+    path = rollup_dir(year, month, root)
+    meta = read_meta(path)
+    if meta is None or meta.get("version") != ROLLUP_VERSION:
+        return None
+    if meta["sources"] != (sources if sources is not None else month_sources(year, month)):
+        return None
+    if meta["pending"] and meta["accounting"] != accounting_sizes(year) and pending_appeared(year, meta):
+        return None
+
+    reducers = {}
+    try:
+        for name, reducer_class in TABLES.items():
+            reducer = reducer_class()
+            if meta["rows"][name]:
+                table = pd.read_parquet(os.path.join(path, f"{name}.parquet"))
+                reducer.state = table.set_index(meta["index"][name])
+            reducers[name] = reducer
+    except Exception as e:
+        print(f"Ignoring unreadable rollup {path}: {e}")
+        return None
+    return reducers
+
+
+def write_rollup(year: str, month: str, reducers: dict, root: str = None, sources: dict = None,
+                 accounting: dict = None):
+    """
+    Stores the reducer states of a month as its rollup.
+
+    Parameters:
+        year (str): Two-digit year string (e.g., "25" for 2025).
+        month (str): Two-digit month string (e.g., "01" for January).
+        reducers (dict): {"jobs": JobSummary, "hourly": HourlyCube, "metrics": JobMetrics,
+            "quantiles": QuantileSketches} fed with the whole month.
+        root (str): Rollup root, defaults to ROLLUP_DIR.
+        sources (dict): month_sources() of the data the reducers were fed with.
+        accounting (dict): accounting_sizes() taken before the reducers were fed, now when
+            not given.
+    """
+    path = rollup_dir(year, month, root)
+    os.makedirs(path, exist_ok=True)
+    meta = {
+        "version": ROLLUP_VERSION,
+        "created": time.time(),
+        "sources": sources if sources is not None else month_sources(year, month),
+        # Rows added after these sizes are checked for the pending jobs
+        "accounting": accounting if accounting is not None else accounting_sizes(year),
+        "pending": pending_jobs(year, month, reducers),
+        "index": {},
+        "rows": {},
+    }
+    for name, reducer in reducers.items():
+        state = reducer.state
+        meta["rows"][name] = 0 if state is None else len(state)
+        if state is None:
+            # Nothing ran during the month
+            continue
+        meta["index"][name] = list(state.index.names)
+        tmp = os.path.join(path, f".{name}.parquet.{os.getpid()}")
+        state.reset_index().to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(path, f"{name}.parquet"))
+
+    # meta.json is written last, a rollup without it is never read
+    write_json(os.path.join(path, META_FILE), meta)
+
+
+def build_rollup(year: str, month: str, backend: str = "serial", n_jobs: int = None) -> dict:
+    """Reads a month's raw GPU data once and reduces it to the rollup's reducers"""
+    from helpers import iter_gpu_data
+
+    jobs, hourly, metrics, quantiles = reduce_gpu_data(
+        iter_gpu_data(year, month, compact=True, backend=backend, n_jobs=n_jobs),
+        JobSummary(), HourlyCube(), JobMetrics(), QuantileSketches()
+    )
+    return {"jobs": jobs, "hourly": hourly, "metrics": metrics, "quantiles": quantiles}
+
+
+def load_rollups(months: list, backend: str = "serial", n_jobs: int = None, root: str = None,
+                 refresh: bool = False) -> dict:
+    """
+    Returns the merged rollups of several months, building the missing or stale ones.
+
+    Rollups of closed months are written as they are built; the month in progress is
+    always read from the raw data and never stored.
+
+    Parameters:
+        months (list): (year, month) tuples of two-digit strings, in order.
+        backend (str): Backend used to build missing rollups, see helpers.map_tasks.
+        n_jobs (int): Number of workers for the thread and process backends.
+        root (str): Rollup root, defaults to ROLLUP_DIR.
+        refresh (bool): Rebuild every rollup from the raw data.
+
+    Returns:
+        dict: {"jobs": JobSummary, "hourly": HourlyCube, "metrics": JobMetrics,
+            "quantiles": QuantileSketches} covering all the months.
+    """
+    merged = {name: reducer_class() for name, reducer_class in TABLES.items()}
+    for year, month in months:
+        sources = month_sources(year, month)
+        reducers = None if refresh else read_rollup(year, month, root, sources)
+        if reducers is None:
+            print(f"Building rollup {year}-{month}...")
+            accounting = accounting_sizes(year)
+            reducers = build_rollup(year, month, backend, n_jobs)
+            if is_closed(year, month):
+                try:
+                    write_rollup(year, month, reducers, root, sources, accounting)
+                except ImportError as e:
+                    print(f"Rollup not stored: {e}")
+        for name, reducer in reducers.items():
+            merged[name].merge(reducer)
+    return merged
+
+
+def parse_arguments():
+    """Parse command line arguments for the rollup tool"""
+    parser = argparse.ArgumentParser(description='Manage the monthly GPU usage rollups')
+    parser.add_argument('--rollup-dir', type=str, default=None,
+                        help=f'Rollup directory (default: {ROLLUP_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Build the missing or stale rollups of closed months')
+    build.add_argument('-y', '--year', type=str, required=True,
+                       help='Year (last two digits, e.g. 25)')
+    build.add_argument('-m', '--month', type=str, nargs='+', default=None,
+                       help='Month(s) (two digits, default: all months)')
+    build.add_argument('--refresh', action='store_true',
+                       help='Rebuild rollups even when they are up to date')
+    build.add_argument('--backend', type=str, default="serial",
+                       help='Ingestion backend: serial, thread or process')
+    build.add_argument('-j', '--jobs', type=int, default=None,
+                       help='Number of workers for the thread and process backends')
+
+    metrics = commands.add_parser('metrics', help='Export the per-job GPU efficiency metrics of a year or range')
+    metrics.add_argument('-y', '--year', type=str, default=None,
+                         help='Year (last two digits, e.g. 25)')
+    metrics.add_argument('-m', '--month', type=str, nargs='+', default=None,
+                         help='Month(s) (two digits, default: all months)')
+    metrics.add_argument('--range', nargs=2, metavar=('START', 'END'), default=None,
+                         help='First and last month (YYYY-MM) instead of --year/--month')
+    metrics.add_argument('--per-gpu', action='store_true',
+                         help='One row per GPU of each job instead of one row per job')
+    metrics.add_argument('-o', '--output', type=str, default="job_metrics.csv",
+                         help='Output CSV (default: job_metrics.csv)')
+    metrics.add_argument('--backend', type=str, default="serial",
+                         help='Ingestion backend used to build missing rollups: serial, thread or process')
+    metrics.add_argument('-j', '--jobs', type=int, default=None,
+                         help='Number of workers for the thread and process backends')
+
+    quantiles = commands.add_parser('quantiles',
+                                    help='Export utilization and VRAM percentiles per user, project, queue or node')
+    quantiles.add_argument('-y', '--year', type=str, default=None,
+                           help='Year (last two digits, e.g. 25)')
+    quantiles.add_argument('-m', '--month', type=str, nargs='+', default=None,
+                           help='Month(s) (two digits, default: all months)')
+    quantiles.add_argument('--range', nargs=2, metavar=('START', 'END'), default=None,
+                           help='First and last month (YYYY-MM) instead of --year/--month')
+    quantiles.add_argument('--by', type=str, default="owner", choices=list(QuantileSketches.BY) + ["all"],
+                           help='One row per user (default), project, queue or node, or one for the whole cluster')
+    quantiles.add_argument('-q', '--quantiles', type=float, nargs='+', default=list(QUANTILES),
+                           help='Quantiles between 0 and 1 (default: 0.5 0.9 0.99)')
+    quantiles.add_argument('-o', '--output', type=str, default="quantiles.csv",
+                           help='Output CSV (default: quantiles.csv)')
+    quantiles.add_argument('--backend', type=str, default="serial",
+                           help='Ingestion backend used to build missing rollups: serial, thread or process')
+    quantiles.add_argument('-j', '--jobs', type=int, default=None,
+                           help='Number of workers for the thread and process backends')
+
+    commands.add_parser('info', help='List the stored rollups')
+    commands.add_parser('clear', help='Remove every rollup')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    root = args.rollup_dir or ROLLUP_DIR
+
+    if args.command == 'build':
+        for month in args.month or [f"{m:02d}" for m in range(1, 13)]:
+            if not is_closed(args.year, month):
+                print(f"Skipping {args.year}-{month}: month not closed yet")
+                continue
+            start = time.time()
+            sources = month_sources(args.year, month)
+            if not args.refresh and read_rollup(args.year, month, root, sources) is not None:
+                print(f"Rollup {args.year}-{month} is up to date")
+                continue
+            accounting = accounting_sizes(args.year)
+            reducers = build_rollup(args.year, month, args.backend, args.jobs)
+            write_rollup(args.year, month, reducers, root, sources, accounting)
+            print(f"Built rollup {args.year}-{month} from {len(sources)} files in {time.time() - start:.1f}s")
+
+    elif args.command in ('metrics', 'quantiles'):
+        from helpers import months_in_range
+
+        if args.range:
+            months = months_in_range(f"{args.range[0]}-01", f"{args.range[1]}-01")
+        elif args.year:
+            months = [(args.year, month) for month in args.month or [f"{m:02d}" for m in range(1, 13)]]
+        else:
+            print("Error: give --year or --range")
+            return
+        start = time.time()
+        rollups = load_rollups(months, backend=args.backend, n_jobs=args.jobs, root=root)
+        if args.command == 'metrics':
+            metrics = rollups["metrics"].result(per_bus=args.per_gpu)
+            metrics.to_csv(args.output, index=False)
+            print(f"Saved the metrics of {len(metrics):,} {'GPUs' if args.per_gpu else 'jobs'} to {args.output} "
+                  f"in {time.time() - start:.1f}s")
+        else:
+            table = rollups["quantiles"].result(by=args.by, quantiles=tuple(args.quantiles))
+            table.to_csv(args.output, index=False)
+            print(f"Saved the percentiles of {len(table):,} keys ({args.by}) to {args.output} "
+                  f"in {time.time() - start:.1f}s")
+
+    elif args.command == 'info':
+        names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+        for name in names:
+            meta = read_meta(os.path.join(root, name))
+            if meta is None:
+                continue
+            version = "" if meta.get("version") == ROLLUP_VERSION else "  (old version)"
+            rows = ", ".join(f"{rows:,} {table} rows" for table, rows in meta["rows"].items())
+            pending = f", {len(meta['pending'])} jobs pending" if meta.get("pending") else ""
+            print(f"{name}: {len(meta['sources'])} files, {rows}{pending}{version}")
+
+    elif args.command == 'clear':
+        shutil.rmtree(root, ignore_errors=True)
+        print(f"Removed {root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,93 @@
+import os
+import pickle
+import random
+import resource
+import tempfile
 import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
 # Import the non-parallel and parallel versions of the function
 from helpers import process_gpu_data as process_gpu_data_non_parallel
 from helpers_parallel import process_gpu_data as process_gpu_data_parallel
 from helpers import aggregate_gpu_data as aggregate_gpu_data_non_parallel
 from helpers_parallel import aggregate_gpu_data as aggregate_gpu_data_parallel
+from helpers import clean_gpu_data_new, clean_gpu_data_new_loop, JobIntervalIndex, BACKENDS
+from benchmark import frame_digest
+
+
+def write_synthetic_gpustats(filepath: str, n_gpus: int = 8, days: int = 31, interval: int = 300, seed: int = 0):
+    """
+    Writes a node-month gpustats file with one line per GPU every `interval` seconds.
+
+    Roughly a quarter of the samples are idle, the rest alternate between the legacy 7-field
+    layout and the 11-field layout, with a sprinkling of misaligned (5/9-field) and broken lines.
+    """
+    rng = random.Random(seed)
+    start = 1740787200  # 2025-03-01
+    buses = [f"00000000:{0x18 + i:02X}:00.0" for i in range(n_gpus)]
+    with open(filepath, "w", encoding="utf-8") as file:
+        for t in range(start, start + days * 86400, interval):
+            for gpu, bus in enumerate(buses):
+                util = rng.choice([0, 0, 3, 45, 87, 100])
+                mem = rng.randint(0, 60)
+                extra = f" 81920 {rng.randint(0, 81920)} {rng.randint(30, 80)} {rng.uniform(50, 300):.2f}"
+                roll = rng.random()
+                if roll < 0.25:
+                    file.write(f"{t} {bus} {util}.0 {mem}.0 - - -\n")
+                elif roll < 0.26:
+                    file.write(f"{t} {bus} {util}.0 {mem}.0 {4000000 + gpu}.undefined{extra}\n")
+                elif roll < 0.265:
+                    file.write(f"{t} Unable to determine the device handle for GPU{gpu}: {bus}: Unknown Error\n")
+                elif roll < 0.6:
+                    file.write(f"{t} {bus} {util}.0 {mem}.0 user{gpu} proj{gpu} {4000000 + gpu}.undefined\n")
+                else:
+                    file.write(f"{t} {bus} {util}.0 {mem}.0 user{gpu} proj{gpu} {4000000 + gpu}.1{extra}\n")
+
+
+# Speedup of clean_gpu_data_new over clean_gpu_data_new_loop measured by test_parser_speed on
+# its synthetic month (71,424 lines, one core): 2.3-3.3x, ~135-177k -> ~390-490k lines/s. This is
+# short of the 10x that was asked for; most of the remaining time goes to gathering the tokens
+# into fixed-width fields and factorizing the bus ids and timestamps.
+PARSER_SPEEDUP = 2.5
+
+
+def test_parser_speed(filepath: str = None, repeat: int = 3):
+    """
+    Compares the vectorized clean_gpu_data_new against the line-by-line reference parser
+    and reports the speedup next to the recorded PARSER_SPEEDUP.
+
+    If no file is given, a synthetic month of 5-minute samples for an 8-GPU node is generated.
+    """
+    tmpdir = None
+    if filepath is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        filepath = os.path.join(tmpdir.name, "2503")
+        write_synthetic_gpustats(filepath)
+
+    with open(filepath, "rb") as file:
+        n_lines = sum(1 for _ in file)
+
+    timings = {}
+    results = {}
+    for name, parser in [("loop", clean_gpu_data_new_loop), ("vectorized", clean_gpu_data_new)]:
+        best = float("inf")
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            results[name] = parser(filepath)
+            best = min(best, time.perf_counter() - start_time)
+        timings[name] = best
+        print(f"{name:>10}: {best:.3f} s ({n_lines / best:,.0f} lines/s)")
+
+    pd.testing.assert_frame_equal(results["loop"], results["vectorized"])
+    speedup = timings["loop"] / timings["vectorized"]
+    print(f"Identical output, speedup {speedup:.1f}x on {n_lines:,} lines (recorded {PARSER_SPEEDUP:.1f}x)")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    return timings["loop"], timings["vectorized"]
+
 
 # Define a function to test the processing time of both versions
 def test_processing_time(year: str, month: str):
@@ -26,7 +108,8 @@ def test_processing_time(year: str, month: str):
     print(f"Parallel processing took {parallel_time:.2f} seconds.")
 
     # Optionally, you can check if both results are the same
-    if result_non_parallel.equals(result_parallel):
+    # Same rows in any order
+    if frame_digest(result_non_parallel) == frame_digest(result_parallel):
         print("Both parallel and non-parallel results are the same.")
     else:
         print("Results differ between parallel and non-parallel versions.")
@@ -52,26 +135,372 @@ def test_aggregate_gpu_data(year: str):
     print(f"Parallel yearly aggregation took {parallel_year_time:.2f} seconds.")
 
     # Optionally, check if the results are the same for yearly aggregation
-    if result_non_parallel_year.equals(result_parallel_year):
+    if frame_digest(result_non_parallel_year) == frame_digest(result_parallel_year):
         print("Both parallel and non-parallel yearly aggregation results are the same.")
     else:
         print("Yearly aggregation results differ between parallel and non-parallel versions.")
 
     return non_parallel_year_time, parallel_year_time
 
+def test_backends(year: str, n_jobs: int = None):
+    """Times the yearly aggregation with every backend and checks they return the same frame"""
+    times = {}
+    reference = None
+    for backend in BACKENDS:
+        start_time = time.time()
+        result = aggregate_gpu_data_non_parallel(year, backend=backend, n_jobs=n_jobs)
+        times[backend] = time.time() - start_time
+        print(f"{backend:>8} backend took {times[backend]:.2f} seconds.")
+        if reference is None:
+            reference = result
+        elif frame_digest(reference) != frame_digest(result):
+            print(f"Results differ between the serial and {backend} backends.")
+    return times
+
+def make_recycled_month(n_gpus: int = 16, n_ids: int = 500, recycle: int = 20, interval: int = 300,
+                        seed: int = 0) -> tuple:
+    """
+    Builds a month of gpustats records and a year of accounting rows with heavy job-ID recycling.
+
+    Each of the n_ids job numbers is reused `recycle` times over the year (disjoint windows),
+    so a merge on job_id matches every sample with `recycle` accounting rows.
+
+    Returns:
+        tuple: (gpu_records, gpu_jobs) frames with the columns process_gpu_data joins on.
+    """
+    rng = np.random.default_rng(seed)
+    year_start, month_days = 1735689600, 31  # 2025-01-01
+    slot = 365 * 86400 // recycle
+
+    ids = np.repeat(np.arange(n_ids), recycle)
+    starts = year_start + np.tile(np.arange(recycle), n_ids) * slot + rng.integers(0, slot // 2, len(ids))
+    gpu_jobs = pd.DataFrame({
+        "job_number": 5000000 + ids,
+        "task_string": "undefined",
+        "job_task": [f"{5000000 + i}.undefined" for i in ids],
+        "owner": [f"user{i % 97}" for i in ids],
+        "project": [f"proj{i % 31}" for i in ids],
+        "ux_submission_time": starts,
+        "ux_end_time": starts + rng.integers(3600, slot // 2, len(ids)),
+    }).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    # Samples of jobs running during the first month, plus idle samples
+    times = np.arange(year_start, year_start + month_days * 86400, interval)
+    n = len(times) * n_gpus
+    time_column = np.repeat(times, n_gpus)
+    running = gpu_jobs[gpu_jobs["ux_submission_time"] < year_start + month_days * 86400]
+    pick = rng.integers(0, len(running), n)
+    job_ids = running["job_task"].to_numpy()[pick]
+    idle = rng.random(n) < 0.25
+    gpu_records = pd.DataFrame({
+        "time": time_column,
+        "bus": np.tile([f"00000000:{0x18 + i:02X}:00.0" for i in range(n_gpus)], len(times)),
+        "util": rng.choice([0.0, 3.0, 45.0, 100.0], n),
+        "user": np.where(idle, "-", "user"),
+        "project": np.where(idle, "-", "proj"),
+        "job_id": np.where(idle, "-", job_ids),
+        "scenario": np.where(idle, 0, 1),
+    })
+    return gpu_records, gpu_jobs
+
+
+def test_interval_join(repeat: int = 3, **kwargs):
+    """
+    Compares the interval join with the former merge-then-filter on a month with heavy
+    job-ID recycling, checking that both give the same frame.
+    """
+    gpu_records, gpu_jobs = make_recycled_month(**kwargs)
+
+    def merge_then_filter():
+        merged_df = pd.merge(gpu_records, gpu_jobs, left_on="job_id", right_on="job_task", how="left")
+        in_time_range = (
+            (merged_df["time"] >= merged_df["ux_submission_time"]) &
+            (merged_df["time"] <= merged_df["ux_end_time"])
+        ).fillna(False)
+        return merged_df[in_time_range | (merged_df["scenario"] == 0)].reset_index(drop=True), len(merged_df)
+
+    def interval_join():
+        return JobIntervalIndex(gpu_jobs).join(gpu_records)
+
+    timings = {}
+    for name, join in [("merge", merge_then_filter), ("interval", interval_join)]:
+        best = float("inf")
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            result = join()
+            best = min(best, time.perf_counter() - start_time)
+        timings[name] = (best, result)
+
+    (merge_time, (expected, merged_rows)), (join_time, joined) = timings["merge"], timings["interval"]
+    pd.testing.assert_frame_equal(joined, expected)
+    print(f"{len(gpu_records):,} samples, {len(gpu_jobs):,} accounting rows: "
+          f"merge builds {merged_rows:,} rows to keep {len(expected):,}")
+    print(f"merge+filter: {merge_time:.3f} s, interval join: {join_time:.3f} s, "
+          f"identical output, speedup {merge_time / join_time:.1f}x")
+    return merge_time, join_time
+
+
+def test_shared_job_index(sizes=(500, 5000, 50000), recycle: int = 20):
+    """
+    Compares what a worker receives per node-month task when the accounting table is pickled
+    with every task (the former joblib path) and when the job index is shared once through
+    memory-mapped files, for accounting tables of growing size.
+    """
+    for n_ids in sizes:
+        gpu_records, gpu_jobs = make_recycled_month(n_ids=n_ids, recycle=recycle)
+        job_index = JobIntervalIndex(gpu_jobs)
+        pickled_mb = len(pickle.dumps(gpu_jobs)) / 2**20
+
+        with tempfile.TemporaryDirectory() as shared_dir:
+            start_time = time.perf_counter()
+            job_index.share(shared_dir)
+            share_time = time.perf_counter() - start_time
+            task = ("25", "01", "scc-000", "/path/to/gpustats/scc-000/2501", True, False, False, shared_dir, None)
+            task_bytes = len(pickle.dumps(task))
+
+            start_time = time.perf_counter()
+            attached = JobIntervalIndex.attach(shared_dir)
+            attach_time = time.perf_counter() - start_time
+            pd.testing.assert_frame_equal(attached.join(gpu_records), job_index.join(gpu_records))
+
+        print(f"{len(gpu_jobs):>9,} accounting rows: pickled table {pickled_mb:7.1f} MB per task, "
+              f"shared task {task_bytes} bytes, share {share_time:.3f} s once, attach {attach_time:.3f} s per worker")
+
+
+def test_job_filter(months=(("25", "01"),), n_values: int = 3, **cluster):
+    """
+    Checks that a filtered read (job_filter, as -u/-p/-q reports use) yields exactly the
+    rows of the unfiltered read of the same jobs, on a synthetic cluster with MPI jobs
+    running on two nodes while the accounting only names their master host.
+    """
+    from benchmark import frame_digest, use_data
+    from helpers import iter_gpu_data
+    from synthetic_data import write_cluster
+
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as work_dir:
+        manifest = write_cluster(root, list(months), **{"n_nodes": 4, "jobs_per_month": 200, "multi_node": 0.1,
+                                                        **cluster})
+        with use_data(root, work_dir):
+            for year, month in months:
+                full = pd.concat(iter_gpu_data(year, month), ignore_index=True)
+                for accounting_column, column in [("owner", "owner"), ("project", "project_y"), ("qname", "qname")]:
+                    values = full[column].dropna().value_counts().index[:n_values]
+                    for value in values:
+                        start_time = time.perf_counter()
+                        filtered = pd.concat(iter_gpu_data(year, month, job_filter={accounting_column: value}),
+                                             ignore_index=True)
+                        seconds = time.perf_counter() - start_time
+                        expected = full[full[column] == value]
+                        # Accounting columns are float in the unfiltered read, where idle samples leave them NaN
+                        filtered = filtered.astype({name: "float64" for name in filtered.columns
+                                                    if expected[name].dtype == "float64"})
+                        assert frame_digest(filtered) == frame_digest(expected), (year, month, column, value)
+                        gpu_hours = (expected["scenario"] != 0).sum() / 12
+                        print(f"{year}-{month} {accounting_column} {value}: {len(filtered):,} rows, "
+                              f"{gpu_hours:,.1f} GPU hours, same as the unfiltered read ({seconds:.2f}s)")
+    print(f"Filtered reads match the unfiltered one, with {manifest['multi_node_jobs']} multi-node jobs")
+
+
+def test_job_stats(interval: int = 300):
+    """
+    Checks the GPU hours job_stats reports, including for jobs with a single sample per GPU,
+    which have no gap between samples to take the sampling interval from.
+    """
+    from gpustats_index import job_stats
+    from reducers import SAMPLES_PER_HOUR
+
+    job = pd.Series({"job_task": "4000001.undefined", "owner": "user0", "project": "proj0",
+                     "hostname": "scc-000.scc.bu.edu", "ux_start_time": 1740787200,
+                     "ux_end_time": 1740787200 + 86400, "n_gpu": 2})
+    buses = ["00000000:18:00.0", "00000000:19:00.0"]
+
+    def samples(n_times: int, util: float) -> pd.DataFrame:
+        times = 1740787200 + np.arange(n_times) * interval
+        return pd.DataFrame({
+            "time": np.repeat(times, len(buses)),
+            "bus": np.tile(buses, n_times),
+            "util": util,
+            "memory_used_mb": 1024.0,
+        })
+
+    for n_times, util in [(1, 0.0), (1, 50.0), (2, 0.0), (24, 50.0)]:
+        stats = job_stats(job, samples(n_times, util))
+        expected = n_times * len(buses) / SAMPLES_PER_HOUR
+        assert stats["samples"] == n_times * len(buses)
+        assert np.isclose(stats["gpu_hours"], expected), (n_times, stats["gpu_hours"], expected)
+        assert np.isclose(stats["idle_gpu_hours"], expected if util == 0 else 0.0), (n_times, stats)
+        print(f"{n_times} samples per GPU at {util:.0f}%: {stats['gpu_hours']:.3f} GPU hours, "
+              f"{stats['idle_gpu_hours']:.3f} idle, as expected")
+
+
+def test_quantile_sketches(months=(("25", "01"), ("25", "02")), quantiles=(0.5, 0.9, 0.99), **cluster):
+    """
+    Compares the percentiles of merged monthly QuantileSketches with exact ones on a
+    synthetic cluster: utilization percentiles must equal numpy's "inverted_cdf" quantiles
+    and VRAM percentiles be within VRAM_ACCURACY of them. Merged monthly states must also
+    equal the state of a single pass over all the months.
+    """
+    from benchmark import use_data
+    from helpers import iter_gpu_data
+    from reducers import VRAM_ACCURACY, QuantileSketches
+    from synthetic_data import write_cluster
+
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as work_dir:
+        write_cluster(root, list(months), **{"n_nodes": 4, "jobs_per_month": 200, **cluster})
+        with use_data(root, work_dir):
+            merged, single, frames = QuantileSketches(), QuantileSketches(), []
+            for year, month in months:
+                monthly = QuantileSketches()
+                for chunk in iter_gpu_data(year, month, compact=True):
+                    monthly.update(chunk)
+                    single.update(chunk)
+                    frames.append(chunk[["owner", "project_y", "qname", "node", "util", "memory_used_mb"]])
+                merged.merge(monthly)
+
+    state, expected_state = merged.state.sort_index(), single.state.sort_index()
+    assert state.index.equals(expected_state.index) and (state["samples"] == expected_state["samples"]).all()
+
+    records = pd.concat(frames, ignore_index=True)
+    records["util"] = records["util"].astype("float64")
+    records["memory_used_mb"] = pd.to_numeric(records["memory_used_mb"], errors="coerce").astype("float64")
+    records["all"] = "all"
+    for by, column in [("owner", "owner"), ("project", "project_y"), ("qname", "qname"), ("node", "node"),
+                       ("all", "all")]:
+        table = merged.result(by=by, quantiles=quantiles).set_index(by)
+        keys = records[column].astype(object)
+        for metric, values, prefix in [("util", "util", "util"), ("vram", "memory_used_mb", "vram_mb")]:
+            valid = records[values].notna() & keys.notna()
+            names = [f"{prefix}_p{quantile * 100:g}" for quantile in quantiles]
+            exact = records[valid].groupby(keys[valid])[values].apply(
+                lambda group: pd.Series(np.quantile(group.to_numpy(), quantiles, method="inverted_cdf"), index=names)
+            ).unstack()
+            counts = records[valid].groupby(keys[valid]).size()
+            estimate = table.loc[exact.index, names]
+            assert (table.loc[counts.index, f"{metric}_samples"] == counts).all(), (by, metric)
+            if metric == "util":
+                assert np.array_equal(estimate.to_numpy(), exact.to_numpy()), (by, metric)
+                error = 0.0
+            else:
+                error = float(np.nanmax(((estimate - exact).abs() / exact.where(exact > 0)).to_numpy(), initial=0))
+                assert error <= VRAM_ACCURACY + 1e-9, (by, metric, error)
+            print(f"{by:<8} {metric}: {len(exact):>3} keys, {counts.sum():>9,} samples, "
+                  f"max relative error {error:.4f}")
+    print("Merged monthly sketches equal a single pass, percentiles within their bounds")
+
+
+def _aggregate_peak_rss(year: str, compact: bool) -> tuple:
+    """Runs aggregate_gpu_data and returns (rows, frame MB, peak RSS MB) of this process"""
+    result = aggregate_gpu_data_non_parallel(year, compact=compact)
+    frame_mb = result.memory_usage(deep=True).sum() / 2**20
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return len(result), frame_mb, peak_mb
+
+
+# Compare the peak memory of a yearly aggregation with and without the compact schema
+def test_aggregate_memory(year: str):
+    peaks = {}
+    for compact in (False, True):
+        # A fresh process per run, so the peak RSS of one run does not hide the other
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            rows, frame_mb, peak_mb = executor.submit(_aggregate_peak_rss, year, compact).result()
+        peaks[compact] = peak_mb
+        print(f"compact={compact}: {rows:,} rows, frame {frame_mb:,.0f} MB, peak RSS {peak_mb:,.0f} MB")
+    print(f"Peak RSS reduced {peaks[False] / peaks[True]:.1f}x by the compact schema")
+    return peaks[False], peaks[True]
+
+def _report_peak_rss(tables_file: str, render_jobs: int) -> tuple:
+    """Renders a report from pickled tables, returns (seconds, peak RSS MB of this process and of its workers)"""
+    from reportgenerator import create_report
+
+    with open(tables_file, "rb") as file:
+        year_month_date, hourly_cube, job_summary = pickle.load(file)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.time()
+        create_report(os.path.join(tmpdir, "report.pdf"), year_month_date, hourly_cube, job_summary,
+                      render_jobs=render_jobs)
+        seconds = time.time() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return seconds, peak_mb, workers_mb
+
+
+# Wall time and peak memory of drawing a monthly report, in process and with worker processes
+def test_report_rendering(year: str, month: str, render_jobs=(1, 2, 4)):
+    from datetime import datetime
+    from helpers import get_cluster_node_info, iter_gpu_data
+    from reducers import HourlyCube, JobSummary, reduce_gpu_data
+    from reportgenerator import report_tables
+
+    host_owner = get_cluster_node_info()[["host", "flag"]]
+    host_owner.columns = ["node", "sb_flag"]
+    node_status = pd.read_csv('/projectnb/scv/utilization/katia/queue_info.csv')
+    node_status_mapping = node_status.set_index('queuename')['class_user'].to_dict()
+    job_sums, hourly_cube = reduce_gpu_data(iter_gpu_data(year, month, compact=True), JobSummary(), HourlyCube())
+    hourly_cube, job_summary = report_tables(job_sums, hourly_cube, host_owner, node_status_mapping)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tables_file = os.path.join(tmpdir, "tables.pkl")
+        with open(tables_file, "wb") as file:
+            pickle.dump((datetime.strptime(f"20{year}-{month}", "%Y-%m"), hourly_cube, job_summary), file)
+        for n in render_jobs:
+            # A fresh process per run, so the peak RSS of one run does not hide the other
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                seconds, peak_mb, workers_mb = executor.submit(_report_peak_rss, tables_file, n).result()
+            results[n] = seconds
+            workers = f", workers peak RSS {workers_mb:,.0f} MB" if n > 1 else ""
+            print(f"render_jobs={n}: {seconds:.2f} seconds, peak RSS {peak_mb:,.0f} MB{workers}")
+    return results
+
 # Example usage of the test
 if __name__ == "__main__":
     year = "24"  # Example year (2024)
     month = "01"  # Example month (January)
 
+    # Compare the vectorized gpustats parser with the line-by-line one on a synthetic month
+    print("Testing gpustats parser...")
+    test_parser_speed()
+
     # Call the function to test the time taken by both versions (monthly)
-    print("Testing monthly function...")
+    print("\nTesting monthly function...")
     non_parallel_time, parallel_time = test_processing_time(year, month)
 
     # Call the function to test the time taken by both versions (yearly aggregation)
     print("\nTesting yearly aggregation function...")
     non_parallel_year_time, parallel_year_time = test_aggregate_gpu_data(year)
 
+    # Serial, thread pool and process pool backends of the same engine
+    print("\nTesting backends...")
+    test_backends(year)
+
+    # Joining samples to recycled job ids
+    print("\nTesting interval join...")
+    test_interval_join()
+
+    # Per-task cost of handing the accounting table to worker processes
+    print("\nTesting shared job index...")
+    test_shared_job_index()
+
+    # -u/-p/-q filters pushed down into ingestion against the unfiltered read
+    print("\nTesting job filters...")
+    test_job_filter()
+
+    # GPU hours of single jobs, down to one sample per GPU
+    print("\nTesting job stats...")
+    test_job_stats()
+
+    # Percentiles of merged monthly sketches against exact ones
+    print("\nTesting quantile sketches...")
+    test_quantile_sketches()
+
+    # Peak memory of the yearly aggregation, object columns vs. compact schema
+    print("\nTesting yearly aggregation memory...")
+    test_aggregate_memory(year)
+
+    # Drawing the report pages in process and in worker processes
+    print("\nTesting report rendering...")
+    test_report_rendering(year, month)
+
     # Print summary for both tests
     print(f"\nTest Summary:")
     print(f"Non-parallel monthly processing time: {non_parallel_time:.2f} seconds.")
@@ -0,0 +1,335 @@
+import argparse
+import calendar
+import csv
+import json
+import os
+import random
+import time
+import numpy as np
+
+# Columns of the yearly accounting files, in order
+ACCOUNTING_HEADER = [
+    "qname", "hostname", "group", "owner", "job_name", "job_number", "account", "priority",
+    "submission_time", "start_time", "end_time", "failed", "exit_status", "ru_wallclock",
+    "ru_utime", "ru_stime", "ru_maxrss", "project", "department", "granted_pe", "slots",
+    "task_number", "cpu", "mem", "io", "category", "iow", "pe_taskid", "maxvmem", "arid",
+    "ar_submission_time", "ux_submission_time", "ux_start_time", "ux_end_time", "options", "n_gpu",
+]
+MANIFEST_FILE = "cluster.json"
+GPU_TYPES = ("a100", "v100", "l40s")
+JOB_NAMES = ("ood-jupyter", "QRLOGIN", "train.sh", "bash", "run_model.py", "eval.qsub")
+# Typical utilization of a job, drawn once per job; its samples are spread around it
+JOB_UTIL_LEVELS = (0.0, 2.0, 15.0, 45.0, 80.0, 97.0)
+# First job number; numbers wrap around after job_id_pool jobs, skipping those still running
+FIRST_JOB_NUMBER = 4000000
+
+
+def month_bounds(year: str, month: str) -> tuple:
+    """Epoch seconds of the first second of a month and of the next one"""
+    first_day = (2000 + int(year), int(month), 1)
+    next_month = (first_day[0] + first_day[1] // 12, first_day[1] % 12 + 1, 1)
+    return calendar.timegm(first_day + (0, 0, 0)), calendar.timegm(next_month + (0, 0, 0))
+
+
+def schedule_jobs(months: list, n_nodes: int, gpus_per_node: int, jobs_per_month: int,
+                  job_id_pool: int, n_users: int, rng: random.Random, multi_node: float = 0.0) -> tuple:
+    """
+    Lays out the jobs of every node over the months, as an SGE-like scheduler would.
+
+    Each node alternates idle gaps and busy periods; a busy period splits the node's GPUs
+    between jobs of 1, 2 or 4 GPUs that start together and end independently. Job
+    numbers are handed out in start order from a pool of job_id_pool numbers, so they
+    are recycled, but never while a job holding the number may still be running.
+    A multi_node share of the jobs are MPI jobs that also run on the same GPUs of the
+    next node, over whatever that node was running; their accounting hostname only names
+    their own node, as SGE records the master host.
+
+    Returns:
+        tuple: (nodes, jobs), nodes a list of dicts (name, flag, gpu_type) and jobs a list
+            of dicts with the accounting fields, the hosts and the GPUs each job ran on.
+    """
+    start, _ = month_bounds(*months[0])
+    _, end = month_bounds(*months[-1])
+    n_buyin = n_nodes // 3
+    nodes = [
+        {"name": f"scc-{i:03d}", "flag": "B" if i < n_buyin else "S", "gpu_type": GPU_TYPES[i % len(GPU_TYPES)]}
+        for i in range(n_nodes)
+    ]
+
+    # Mean busy period so that about jobs_per_month jobs run each month
+    jobs_per_period = gpus_per_node / np.mean([size for size in (1, 2, 4) if size <= gpus_per_node])
+    periods = max(jobs_per_month * len(months) / (n_nodes * jobs_per_period), 1)
+    mean_period = 0.8 * (end - start) / periods
+
+    jobs = []
+    for node in nodes:
+        queue = f"{node['gpu_type']}-{'buy' if node['flag'] == 'B' else 'pub'}"
+        owners = [f"user{(int(node['name'][4:]) * 7 + k) % n_users}" for k in range(6)]
+        t = start + rng.randint(0, 3600)
+        while t < end:
+            if rng.random() < 0.25:
+                t += int(rng.expovariate(1 / (0.25 * mean_period))) + 300
+                continue
+            period_end = t
+            buses = list(range(gpus_per_node))
+            while buses:
+                size = rng.choice([s for s in (1, 2, 4) if s <= len(buses)])
+                owner = rng.choice(owners)
+                length = max(int(rng.expovariate(1 / mean_period)), 600)
+                array = rng.random() < 0.15
+                jobs.append({
+                    "node": node["name"], "qname": queue, "owner": owner,
+                    "project": f"proj{owner[4:]}",
+                    "job_name": rng.choice(JOB_NAMES),
+                    "task_number": rng.randint(1, 4) if array else 0, "array": array,
+                    "submission": t - rng.randint(60, 7200), "start": t, "end": t + length,
+                    "buses": buses[:size], "util": rng.choice(JOB_UTIL_LEVELS),
+                })
+                buses = buses[size:]
+                period_end = max(period_end, t + length)
+            t = period_end + rng.randint(60, 1800)
+
+    for job in jobs:
+        job["hosts"] = [job["node"]]
+        if multi_node and n_nodes > 1 and rng.random() < multi_node:
+            position = int(job["node"][4:])
+            job["hosts"].append(nodes[(position + 1) % n_nodes]["name"])
+
+    # Job numbers in start order; a number is reused once its previous job has ended
+    jobs.sort(key=lambda job: job["start"])
+    busy_until = {}
+    counter = 0
+    for job in jobs:
+        for _ in range(job_id_pool):
+            number = FIRST_JOB_NUMBER + counter % job_id_pool
+            counter += 1
+            if busy_until.get(number, -1) < job["submission"]:
+                break
+        else:
+            raise ValueError(f"job_id_pool of {job_id_pool} is too small for the jobs running at once")
+        busy_until[number] = job["end"]
+        job["job_number"] = number
+    return nodes, jobs
+
+
+def _gpustats_line(t: int, gpu: int, bus: str, job: dict, new_format: bool, rng: random.Random) -> str:
+    """One gpustats line of a GPU at time t, running job (or idle when job is None)"""
+    extra = (f" 81920 {rng.randint(0, 81920)} {rng.randint(30, 85)} {rng.uniform(50, 300):.2f}"
+             if new_format else "")
+    if job is None:
+        return f"{t} {bus} 0.0 0.0 - - -{extra}\n"
+
+    util = min(max(round(rng.gauss(job["util"], 8.0)), 0), 100) if job["util"] else 0
+    mem = min(util, rng.randint(0, 60))
+    job_id = f"{job['job_number']}.{job['task_number'] if job['array'] else 'undefined'}"
+    roll = rng.random()
+    if roll < 0.003:
+        # Garbled line written when nvidia-smi cannot reach the GPU
+        return f"{t} Unable to determine the device handle for GPU{gpu}: {bus}: Unknown Error\n"
+    if roll < 0.01:
+        # Misaligned line, user and project missing (5 or 9 fields)
+        return f"{t} {bus} {util}.0 {mem}.0 {job_id}{extra}\n"
+    if util == 0 and roll < 0.1:
+        # Reserved GPU without a process on it
+        return f"{t} {bus} 0.0 0.0 - - {job_id}{extra}\n"
+    return f"{t} {bus} {util}.0 {mem}.0 {job['owner']} {job['project']} {job_id}{extra}\n"
+
+
+def write_gpustats(root: str, months: list, nodes: list, jobs: list, gpus_per_node: int,
+                   interval: int, rng: random.Random) -> int:
+    """
+    Writes <root>/gpustats/<node>/<YYMM>, one line per GPU every `interval` seconds.
+
+    Nodes still run the legacy 7-field nvidia-smi script until a per-node upgrade time
+    and the 11-field one (memory, temperature and power) after it.
+
+    Returns:
+        int: Number of lines written.
+    """
+    start, _ = month_bounds(*months[0])
+    _, end = month_bounds(*months[-1])
+    buses = [f"00000000:{0x18 + i:02X}:00.0" for i in range(gpus_per_node)]
+    by_node = {}
+    for job in jobs:
+        for host in job["hosts"]:
+            by_node.setdefault(host, []).append(job)
+
+    n_lines = 0
+    for node in nodes:
+        node_dir = os.path.join(root, "gpustats", node["name"])
+        os.makedirs(node_dir, exist_ok=True)
+        upgrade = start + int(rng.uniform(-0.5, 1.5) * (end - start))
+
+        # Job running on each GPU at each sample time
+        times = np.arange(start, end, interval)
+        running = [[None] * len(times) for _ in buses]
+        for job in by_node.get(node["name"], []):
+            first, last = np.searchsorted(times, [job["start"], job["end"]])
+            for gpu in job["buses"]:
+                running[gpu][first:last] = [job] * (last - first)
+
+        for year, month in months:
+            month_start, month_end = month_bounds(year, month)
+            first, last = np.searchsorted(times, [month_start, month_end])
+            with open(os.path.join(node_dir, f"{year}{month}"), "w", encoding="utf-8") as file:
+                for i in range(first, last):
+                    t = int(times[i])
+                    new_format = t >= upgrade
+                    file.writelines(
+                        _gpustats_line(t, gpu, bus, running[gpu][i], new_format, rng) for gpu, bus in enumerate(buses)
+                    )
+                n_lines += int(last - first) * len(buses)
+    return n_lines
+
+
+def write_accounting(root: str, jobs: list, rng: random.Random) -> list:
+    """
+    Writes the yearly accounting files <root>/accounting/20YY.csv of the jobs.
+
+    Jobs go to the file of the year they ended in, as in the real accounting files,
+    with a few CPU-only jobs (no gpus= request) in between.
+
+    Returns:
+        list: Paths of the files written.
+    """
+    accounting_dir = os.path.join(root, "accounting")
+    os.makedirs(accounting_dir, exist_ok=True)
+    by_year = {}
+    for job in jobs:
+        year = time.gmtime(job["end"]).tm_year
+        by_year.setdefault(year, []).append(job)
+
+    paths = []
+    for year, year_jobs in sorted(by_year.items()):
+        path = os.path.join(accounting_dir, f"{year}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(ACCOUNTING_HEADER)
+            for job in sorted(year_jobs, key=lambda job: job["end"]):
+                n_gpu = len(job["buses"])
+                options = f"-l gpus={n_gpu} -l gpu_type={job['qname'].split('-')[0]}"
+                if job["array"]:
+                    options += " -t 1-4"
+                wallclock = job["end"] - job["start"]
+                pe = f"mpi_{4 * n_gpu}_tasks_per_node" if len(job["hosts"]) > 1 else "omp" if n_gpu > 1 else "NONE"
+                writer.writerow([
+                    job["qname"], f"{job['node']}.scc.bu.edu", "grp", job["owner"], job["job_name"],
+                    job["job_number"], "sge", 0, job["submission"], job["start"], job["end"], 0, 0,
+                    wallclock, round(wallclock * 0.8, 1), round(wallclock * 0.05, 1), 1000000,
+                    job["project"], "dept", pe, 4 * n_gpu * len(job["hosts"]), job["task_number"],
+                    round(wallclock * 3.2, 1), 2.0, 0.1, options, 0, 0, 1e9, 0, 0,
+                    job["submission"], job["start"], job["end"], options, n_gpu,
+                ])
+                if rng.random() < 0.1:
+                    writer.writerow([
+                        "linga", "scc-c01.scc.bu.edu", "grp", job["owner"], "cpu_job", job["job_number"] + 5000000,
+                        "sge", 0, job["submission"], job["start"], job["end"], 0, 0, wallclock, 0, 0, 0,
+                        job["project"], "dept", "NONE", 1, 0, 0, 0, 0, "-l h_rt=12:00:00", 0, 0, 0, 0, 0,
+                        job["submission"], job["start"], job["end"], "-l h_rt=12:00:00", 0,
+                    ])
+        paths.append(path)
+    return paths
+
+
+def write_cluster(root: str, months: list, n_nodes: int = 8, gpus_per_node: int = 4,
+                  jobs_per_month: int = 1000, job_id_pool: int = None, n_users: int = 40,
+                  interval: int = 300, seed: int = 0, multi_node: float = 0.0) -> dict:
+    """
+    Writes a synthetic cluster: gpustats files, accounting files and a manifest.
+
+    Layout under root: gpustats/<node>/<YYMM> as in helpers.GPUSTATS_DIR,
+    accounting/20YY.csv as in helpers.ACCOUNTING_DIR and cluster.json describing the
+    nodes (shared or buy-in) and queues, in place of the SGE node list and queue_info.csv.
+    The same arguments always write the same files.
+
+    Parameters:
+        root (str): Output directory.
+        months (list): (year, month) tuples of two-digit strings, consecutive and in order.
+        n_nodes (int): Number of GPU nodes, a third of them buy-in.
+        gpus_per_node (int): GPUs per node.
+        jobs_per_month (int): Approximate number of GPU jobs started per month.
+        job_id_pool (int): Job numbers in use before they wrap around, defaults to half
+            the jobs of a month (at least twice the GPUs) so that numbers are recycled.
+        n_users (int): Number of users (each with a project of the same number).
+        interval (int): Seconds between two samples of a GPU.
+        seed (int): Random seed.
+        multi_node (float): Share of the jobs that also run on a second node (MPI jobs).
+
+    Returns:
+        dict: The manifest, also written to <root>/cluster.json.
+    """
+    rng = random.Random(seed)
+    job_id_pool = job_id_pool or max(jobs_per_month // 2, 2 * n_nodes * gpus_per_node)
+    nodes, jobs = schedule_jobs(months, n_nodes, gpus_per_node, jobs_per_month, job_id_pool, n_users, rng,
+                                multi_node)
+    n_lines = write_gpustats(root, months, nodes, jobs, gpus_per_node, interval, rng)
+    accounting_files = write_accounting(root, jobs, rng)
+
+    manifest = {
+        "months": [f"{year}-{month}" for year, month in months],
+        "nodes": nodes,
+        "queues": {
+            f"{gpu_type}-{kind}": "shared" if kind == "pub" else "buyin"
+            for gpu_type in GPU_TYPES for kind in ("pub", "buy")
+        },
+        "gpus_per_node": gpus_per_node,
+        "jobs": len(jobs),
+        "recycled_job_ids": len(jobs) - len({job["job_number"] for job in jobs}),
+        "multi_node_jobs": sum(len(job["hosts"]) > 1 for job in jobs),
+        "gpustats_lines": n_lines,
+        "accounting_files": [os.path.basename(path) for path in accounting_files],
+        "config": {
+            "n_nodes": n_nodes, "gpus_per_node": gpus_per_node, "jobs_per_month": jobs_per_month,
+            "job_id_pool": job_id_pool, "n_users": n_users, "interval": interval, "seed": seed,
+            "multi_node": multi_node,
+        },
+    }
+    with open(os.path.join(root, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=1)
+    return manifest
+
+
+def read_manifest(root: str) -> dict:
+    """Reads the cluster.json written by write_cluster"""
+    with open(os.path.join(root, MANIFEST_FILE)) as file:
+        return json.load(file)
+
+
+def parse_months(values: list) -> list:
+    """Turns YY-MM strings into (year, month) tuples, checking they are consecutive"""
+    months = [tuple(value.split("-")) for value in values]
+    for (year, month), (next_year, next_month) in zip(months, months[1:]):
+        if (int(next_year) * 12 + int(next_month)) - (int(year) * 12 + int(month)) != 1:
+            raise ValueError(f"Months must be consecutive: {year}-{month} then {next_year}-{next_month}")
+    return months
+
+
+def parse_arguments():
+    """Parse command line arguments for the synthetic data generator"""
+    parser = argparse.ArgumentParser(description='Write synthetic gpustats and accounting files')
+    parser.add_argument('output', type=str, help='Output directory')
+    parser.add_argument('--months', type=str, nargs='+', default=["25-01"],
+                        help='Consecutive months to generate, as YY-MM (default: 25-01)')
+    parser.add_argument('--nodes', type=int, default=8, help='Number of GPU nodes (default: 8)')
+    parser.add_argument('--gpus', type=int, default=4, help='GPUs per node (default: 4)')
+    parser.add_argument('--jobs', type=int, default=1000, help='GPU jobs per month (default: 1000)')
+    parser.add_argument('--job-id-pool', type=int, default=None,
+                        help='Job numbers in use before they are recycled (default: half of --jobs)')
+    parser.add_argument('--users', type=int, default=40, help='Number of users (default: 40)')
+    parser.add_argument('--interval', type=int, default=300, help='Seconds between samples (default: 300)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--multi-node', type=float, default=0.0,
+                        help='Share of the jobs that also run on a second node, as MPI jobs (default: 0)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    manifest = write_cluster(args.output, parse_months(args.months), args.nodes, args.gpus, args.jobs,
+                             args.job_id_pool, args.users, args.interval, args.seed, args.multi_node)
+    print(f"Wrote {manifest['gpustats_lines']:,} gpustats lines and {manifest['jobs']:,} jobs "
+          f"({manifest['recycled_job_ids']:,} with a recycled job number) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+
+# Bytes hashed at the start of a file and just before the ingested offset, to detect
+# files that were rewritten rather than appended to
+CHECK_BYTES = 4096
+
+
+def read_json(path: str, version: int = None) -> dict:
+    """Reads a JSON state file, None when it is missing, unreadable or from another version"""
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if version is not None and data.get("version") != version:
+        return None
+    return data
+
+
+def write_json(path: str, data: dict, indent: int = 1):
+    """Atomically replaces a JSON state file"""
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}")
+    with open(tmp, "w") as file:
+        json.dump(data, file, indent=indent)
+    os.replace(tmp, path)
+
+
+def checksums(file, offset: int) -> list:
+    """Hashes the first and the last CHECK_BYTES bytes before offset of an open binary file"""
+    file.seek(0)
+    head = file.read(min(offset, CHECK_BYTES))
+    start = max(offset - CHECK_BYTES, 0)
+    file.seek(start)
+    tail = file.read(offset - start)
+    return [hashlib.sha1(head).hexdigest(), hashlib.sha1(tail).hexdigest()]
+
+
+def unchanged(state: dict, stat: os.stat_result) -> bool:
+    """Whether a tracked file has the size and modification time recorded in its state"""
+    return state is not None and (state["size"], state["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+
+
+def appended(file, state: dict, stat: os.stat_result) -> bool:
+    """
+    Whether a tracked file was only appended to since its state was recorded, so that
+    reading can resume at state["offset"]. A file that shrank or whose bytes before the
+    offset changed has to be read again from the start.
+    """
+    return (
+        state is not None
+        and stat.st_size >= state["offset"]
+        and checksums(file, state["offset"]) == state["checksums"]
+    )
+
+
+def read_appended(file, state: dict, stat: os.stat_result, block_size: int = -1):
+    """
+    Yields the complete lines of an open binary file from state["offset"] on.
+
+    Lines come in blocks of about `block_size` bytes (the rest of the file by default).
+    state["offset"] still points at the start of a block while it is being processed
+    and moves past it once the next block is requested. When the file is exhausted the
+    state records its size, modification time and checksums; a last line without its
+    newline is left for the next read.
+
+    Parameters:
+        file: File opened in binary mode.
+        state (dict): Tracking state with at least an "offset", updated in place.
+        stat (os.stat_result): Stat of the file taken before reading it.
+        block_size (int): Bytes read at a time, -1 to read the rest of the file at once.
+
+    Yields:
+        bytes: Blocks of complete lines.
+    """
+    file.seek(state["offset"])
+    pending = b""
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        block = pending + block
+        end = block.rfind(b"\n") + 1
+        block, pending = block[:end], block[end:]
+        if block:
+            yield block
+            state["offset"] += len(block)
+
+    state["size"] = state["offset"] + len(pending)
+    state["mtime_ns"] = stat.st_mtime_ns
+    state["checksums"] = checksums(file, state["offset"])
@@ -1,13 +1,22 @@
-import subprocess
+import os
+import re
 import sys
 import pandas as pd
-from io import StringIO
+from io import BytesIO
 from datetime import datetime
 import argparse
+from helpers import ACCOUNTING_DIR
+
+# Bytes of an accounting file read and filtered at a time
+BLOCK_SIZE = 64 * 2**20
+# Columns add_gpu_stats adds to the rows of GPU jobs
+GPU_STATS_COLUMNS = ["gpus_used", "samples", "gpu_hours", "util_mean", "util_max", "idle_share",
+                     "idle_gpu_hours", "peak_vram_mb"]
+
 
 def read_user_records(start_date: str, end_date: str, username: str) -> pd.DataFrame:
     """
-    Extracts rows where the 'user' column exactly matches a specified username from CSV files 
+    Extracts rows where the 'owner' column exactly matches a specified username from CSV files 
     within a given date range. It processes multiple years based on the range. Jobs are included
     if they ended during that time.
 
@@ -17,88 +26,179 @@ def read_user_records(start_date: str, end_date: str, username: str) -> pd.DataF
         username (str): The username to filter for.
 
     Returns:
-        pd.DataFrame: A DataFrame containing only rows where the 'user' column matches the given username 
+        pd.DataFrame: A DataFrame containing only rows where the 'owner' column matches the given username 
                       and the 'ux_end_time' column falls within the specified date range.
 
     Raises:
         ValueError: If date formats are incorrect.
-        FileNotFoundError: If a file for a particular year does not exist.
-        PermissionError: If a file cannot be accessed due to permission issues.
-        subprocess.CalledProcessError: If an error occurs while executing the grep command.
     """
+    return read_users_records(start_date, end_date, [username])[username]
+
+
+def _date_range(start_date: str, end_date: str) -> tuple:
+    """Parses and checks a "YYYY-MM-DD" date range"""
     try:
-        # Convert start and end dates to datetime objects
         start_dt = datetime.strptime(start_date, "%Y-%m-%d")
         end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError as e:
+        raise ValueError(f"Date format error: {e}")
+    if start_dt > end_dt:
+        raise ValueError("Date format error: Start date must be before or equal to end date.")
+    return start_dt, end_dt
 
-        # Validate date range
-        if start_dt > end_dt:
-            raise ValueError("Start date must be before or equal to end date.")
 
-        # Generate list of years to process
-        years_to_load = list(range(start_dt.year, end_dt.year + 1))
+def _scan_owners(filepath: str, usernames: list) -> pd.DataFrame:
+    """
+    Reads the rows of an accounting file whose 'owner' is one of usernames, in one pass.
 
-        all_dfs = []  # List to store DataFrames
+    The file is read in blocks of BLOCK_SIZE bytes. Candidate lines, holding one of the
+    usernames between two commas, are found with a single regular expression over the
+    block and only those lines are parsed; the exact match on the 'owner' column is then
+    applied to the parsed rows.
+    """
+    pattern = re.compile(b",(?:" + b"|".join(re.escape(name.encode("utf-8")) for name in usernames) + b"),")
 
-        for year in years_to_load:
-            filepath = f"/projectnb/rcsmetrics/accounting/data/scc/{year}.csv"
+    def candidate_lines(block: bytes) -> list:
+        lines, line_end = [], -1
+        for match in pattern.finditer(block):
+            if match.start() < line_end:
+                continue  # Another match on a line already taken
+            line_start = block.rfind(b"\n", 0, match.start()) + 1
+            line_end = block.find(b"\n", match.end())
+            if line_end < 0:
+                line_end = len(block)
+            lines.append(block[line_start:line_end])
+        return lines
 
-            try:
-                # Run grep command to filter rows containing the username
-                result = subprocess.run(
-                    ["grep", "-e", username, filepath],
-                    capture_output=True,
-                    text=True,
-                    check=True,
-                )
+    lines = []
+    with open(filepath, "rb") as file:
+        header = file.readline().decode("utf-8").strip().split(",")
+        pending = b""
+        while True:
+            block = file.read(BLOCK_SIZE)
+            if not block:
+                break
+            block = pending + block
+            end = block.rfind(b"\n") + 1
+            block, pending = block[:end], block[end:]
+            lines.extend(candidate_lines(block))
+        # Last line without its newline
+        lines.extend(candidate_lines(pending))
 
-                # Extract header from the first row of the file
-                with open(filepath, "r", encoding="utf-8") as file:
-                    header = next(file).strip().split(",")
+    if not lines:
+        return pd.DataFrame(columns=header)
+    df = pd.read_csv(BytesIO(b"\n".join(lines)), names=header, quotechar='"',
+                     low_memory=False, encoding_errors="replace")
+    return df[df["owner"].astype(str).isin(usernames)]
 
-                # Convert grep output to a DataFrame
-                df = pd.read_csv(StringIO(result.stdout), names=header, quotechar='"')
 
-                # Ensure 'user' column exists and filter for exact matches
-                if "user" in df.columns:
-                    df = df[df["user"] == username]
+def read_users_records(start_date: str, end_date: str, usernames: list, use_index: bool = False) -> dict:
+    """
+    Extracts the rows of several users from the accounting files within a given date range.
 
-                # Convert 'ux_end_time' column to datetime
-                if "ux_end_time" in df.columns:
-                    df["time"] = pd.to_datetime(df["ux_end_time"], unit="s")
+    Each year's file is read once whatever the number of users, and rows are kept when
+    their 'owner' column is exactly one of the usernames. Jobs are included if they
+    ended during the date range. With use_index the rows are fetched through the
+    accounting index (accounting_index.py) instead, which only reads the users' lines.
 
-                # Append processed DataFrame
-                all_dfs.append(df)
+    Args:
+        start_date (str): Start date in "YYYY-MM-DD" format.
+        end_date (str): End date in "YYYY-MM-DD" format.
+        usernames (list): The usernames to filter for.
+        use_index (bool): Look the rows up in the accounting index.
+
+    Returns:
+        dict: {username: pd.DataFrame of that user's rows, with a 'time' column holding
+               the end time}; users without rows get an empty DataFrame.
+
+    Raises:
+        ValueError: If date formats are incorrect.
+    """
+    start_dt, end_dt = _date_range(start_date, end_date)
+    usernames = list(dict.fromkeys(usernames))
 
-            except FileNotFoundError:
-                print(f"Warning: File not found for year {year}, skipping.")
-                continue
-            except PermissionError:
-                print(f"Warning: Permission denied for file {filepath}, skipping.")
-                continue
-            except subprocess.CalledProcessError:
-                print(f"Warning: No matching records found in {filepath}, skipping.")
-                continue
-            except pd.errors.EmptyDataError:
-                print(f"Warning: Empty data in {filepath}, skipping.")
-                continue
+    all_dfs = []  # List to store DataFrames
+    for year in range(start_dt.year, end_dt.year + 1):
+        filepath = f"{ACCOUNTING_DIR}/{year}.csv"
+        try:
+            if use_index:
+                from accounting_index import fetch_rows
 
-        # Concatenate all DataFrames and filter final range
-        final_df = pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
+                if not os.path.exists(filepath):
+                    raise FileNotFoundError(filepath)
+                df = fetch_rows([filepath], owners=usernames)
+            else:
+                df = _scan_owners(filepath, usernames)
+        except FileNotFoundError:
+            print(f"Warning: File not found for year {year}, skipping.")
+            continue
+        except PermissionError:
+            print(f"Warning: Permission denied for file {filepath}, skipping.")
+            continue
+        except pd.errors.EmptyDataError:
+            print(f"Warning: Empty data in {filepath}, skipping.")
+            continue
+        if df.empty:
+            print(f"Warning: No matching records found in {filepath}, skipping.")
+            continue
 
-        if not final_df.empty and "time" in final_df.columns:
-            final_df = final_df[(final_df["time"] >= start_dt) & (final_df["time"] <= end_dt)]
+        # Convert 'ux_end_time' column to datetime
+        if "ux_end_time" in df.columns:
+            df["time"] = pd.to_datetime(pd.to_numeric(df["ux_end_time"], errors="coerce"), unit="s")
+        all_dfs.append(df)
 
-        return final_df
+    final_df = pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
+    if not final_df.empty and "time" in final_df.columns:
+        final_df = final_df[(final_df["time"] >= start_dt) & (final_df["time"] <= end_dt)]
 
-    except ValueError as e:
-        raise ValueError(f"Date format error: {e}")
+    records = {username: pd.DataFrame(columns=final_df.columns) for username in usernames}
+    if not final_df.empty:
+        for username, df in final_df.groupby(final_df["owner"].astype(str), sort=False):
+            records[username] = df.reset_index(drop=True)
+    return records
+
+
+def add_gpu_stats(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the GPU usage of each GPU job to accounting rows.
+
+    Only the gpustats files of the hosts and months the jobs ran on are read, and only
+    the parts of them covering the jobs' run times (see gpustats_index.jobs_stats).
+    Rows of jobs that did not request GPUs get empty values.
+
+    Args:
+        df (pd.DataFrame): Accounting rows, e.g. one user's rows from read_users_records.
+
+    Returns:
+        pd.DataFrame: The rows with GPU_STATS_COLUMNS added.
+    """
+    from accounting_store import prepare_gpu_jobs
+    from gpustats_index import jobs_stats
+
+    df = df.copy()
+    gpu_rows = df["options"].astype(str).str.contains("gpus=", na=False)
+    jobs = prepare_gpu_jobs(df[gpu_rows].copy())
+    jobs["ux_start_time"] = pd.to_numeric(jobs["ux_start_time"], errors="coerce")
+    jobs = jobs[jobs["ux_start_time"].notna() & jobs["ux_end_time"].notna()]
+    stats = jobs_stats(jobs) if len(jobs) else pd.DataFrame(columns=GPU_STATS_COLUMNS)
+    for column in GPU_STATS_COLUMNS:
+        df[column] = stats[column] if column in stats else None
+    return df
+
+
+def read_usernames(filepath: str) -> list:
+    """Reads usernames from a file, one per line or separated by spaces or commas; '#' starts a comment"""
+    usernames = []
+    with open(filepath) as file:
+        for line in file:
+            usernames.extend(name for name in re.split(r"[\s,]+", line.split("#")[0]) if name)
+    return usernames
 
 
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(
-        description="Extract GPU job records for a specific user within a date range."
+        description="Extract GPU job records for one or more users within a date range."
     )
     parser.add_argument(
         "start_date", type=str, help="Start date in YYYY-MM-DD format."
@@ -107,31 +207,68 @@ def main():
         "end_date", type=str, help="End date in YYYY-MM-DD format."
     )
     parser.add_argument(
-        "username", type=str, help="Username to filter records."
+        "usernames", type=str, nargs="*", help="Username(s) to filter records."
+    )
+    parser.add_argument(
+        "--users-file", "-f", type=str, help="Optional: File of usernames, one per line."
+    )
+    parser.add_argument(
+        "--output", "-o", type=str, help="Optional: Output CSV file to save results (all users)."
     )
     parser.add_argument(
-        "--output", "-o", type=str, help="Optional: Output CSV file to save results."
+        "--output-dir", "-d", type=str, help="Optional: Directory to save one <username>.csv per user."
+    )
+    parser.add_argument(
+        "--gpu-stats", action="store_true",
+        help="Optional: Add the GPU utilization, idle share, peak VRAM and GPU hours of each GPU job."
+    )
+    parser.add_argument(
+        "--index", action="store_true",
+        help="Optional: Look the rows up in the accounting index instead of scanning the files."
     )
 
     # Parse arguments
     args = parser.parse_args()
+    usernames = list(args.usernames)
+    if args.users_file:
+        usernames += read_usernames(args.users_file)
+    if not usernames:
+        parser.error("give at least one username or --users-file")
 
     try:
         # Call function to get records
-        df = read_user_records(args.start_date, args.end_date, args.username)
+        records = read_users_records(args.start_date, args.end_date, usernames, use_index=args.index)
+        found = {username: df for username, df in records.items() if not df.empty}
+        if args.gpu_stats:
+            found = {username: add_gpu_stats(df) for username, df in found.items()}
 
-        if df.empty:
+        if not found:
             print("No records found for the given criteria.")
             sys.exit(0)
 
         # Print result summary
-        print(f"Loaded {len(df)} records for user '{args.username}' from {args.start_date} to {args.end_date}.")
-        print(df.head())  # Print first few rows
+        for username, df in records.items():
+            print(f"Loaded {len(df)} records for user '{username}' from {args.start_date} to {args.end_date}.")
+            if args.gpu_stats and username in found:
+                df = found[username]
+                sampled = df["gpu_hours"].sum()
+                idle = df["idle_gpu_hours"].sum()
+                print(f"  GPU jobs: {int(df['samples'].notna().sum())}, {sampled:,.1f} sampled GPU hours, "
+                      f"{df['util_mean'].mean():.1f}% average utilization, "
+                      f"{100 * idle / sampled if sampled else 0:.1f}% of the GPU hours idle, "
+                      f"peak VRAM {df['peak_vram_mb'].max():,.0f} MB")
+        if len(records) == 1:
+            print(next(iter(found.values())).head())  # Print first few rows
 
         # Save to CSV if requested
         if args.output:
-            df.to_csv(args.output, index=False)
+            pd.concat(found.values(), ignore_index=True).to_csv(args.output, index=False)
             print(f"Results saved to {args.output}")
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            for username, df in found.items():
+                df.to_csv(os.path.join(args.output_dir, f"{username}.csv"), index=False)
+            print(f"Results of {len(found)} users saved to {args.output_dir}")
 
     except ValueError as e:
         print(f"Error: {e}")